@@ -1,39 +1,51 @@
-import ast
 import base64
+import os
 import sys
 import zlib
 import binascii
 from datetime import datetime
 
+from line_parser import parse_data_line
+from topic_index import TopicIndex, index_path
+
+def read_numbered_lines(input_file, topic_filter=None):
+    """Retorna (número da linha, linha); com filtro e índice disponível, lê só as linhas do tópico"""
+    if topic_filter and os.path.exists(index_path(input_file)):
+        print(f"Usando índice de tópicos: {index_path(input_file)}")
+        index = TopicIndex(input_file)
+        index.build()  # Indexa as linhas adicionadas desde a última execução
+        yield from index.read_lines({topic_filter})
+        return
+    
+    with open(input_file, 'r') as f:
+        for i, line in enumerate(f):
+            yield i + 1, line
+
 def analyze_data_format(input_file, topic_filter=None, num_samples=5):
     """Analisa o formato dos dados para entender como decodificá-los"""
     print(f"Analisando arquivo: {input_file}")
     
     samples = {}
-    with open(input_file, 'r') as f:
-        for i, line in enumerate(f):
-            try:
-                # Parse da linha
-                parsed = ast.literal_eval(line)
-                
-                # Verifica formato esperado
-                if not isinstance(parsed, list) or len(parsed) < 3:
-                    continue
-                
-                topic, data, timestamp = parsed[0], parsed[1], parsed[2]
-                
-                # Filtra pelo tópico se especificado
-                if topic_filter and topic != topic_filter:
-                    continue
-                
-                # Armazena amostras
-                if topic not in samples:
-                    samples[topic] = []
-                
-                if len(samples[topic]) < num_samples:
-                    samples[topic].append((i+1, data, timestamp))
-            except Exception as e:
-                pass
+    for line_num, line in read_numbered_lines(input_file, topic_filter):
+        try:
+            # Parse da linha; com filtro, outros tópicos são descartados pelo prefixo
+            parsed = parse_data_line(line, {topic_filter} if topic_filter else None)
+            if parsed is None:
+                continue
+            
+            topic, data, timestamp = parsed
+            
+            # Armazena amostras
+            if topic not in samples:
+                samples[topic] = []
+            
+            if len(samples[topic]) < num_samples:
+                samples[topic].append((line_num, data, timestamp))
+            elif topic_filter:
+                # Com filtro só há um tópico: as amostras já estão completas
+                break
+        except Exception as e:
+            pass
     
     # Imprime análise
     for topic, topic_samples in samples.items():
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Compara a vazão (linhas/s) de três formas de carregar a telemetria dos carros
+em um PostgreSQL local:
+
+- ``execute``: um INSERT por linha (como os monitores faziam)
+- ``executemany``: INSERT parametrizado em lote (como o SupabaseLoader fazia)
+- ``COPY``: ``copy_records_to_table`` via CopyLoader
+
+As cargas são feitas em uma tabela temporária com a mesma estrutura de
+``car_telemetry``, a partir de linhas montadas da mesma forma que o
+SupabaseLoader monta as suas.
+
+Uso: python benchmarks/bench_copy_loader.py [dsn] [linhas] [linhas por lote]
+
+O DSN padrão vem de BENCH_DSN (ou postgresql://postgres@localhost/postgres).
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg
+
+from copy_loader import CAR_TELEMETRY_COLUMNS, CopyLoader
+
+DEFAULT_DSN = os.getenv("BENCH_DSN", "postgresql://postgres@localhost/postgres")
+
+TABLE = 'car_telemetry'
+
+CREATE_TABLE = f'''
+    CREATE TEMP TABLE {TABLE} (
+        id bigserial PRIMARY KEY,
+        timestamp timestamp without time zone,
+        utc_timestamp timestamp without time zone,
+        session_id integer,
+        driver_number text,
+        rpm integer,
+        speed integer,
+        gear integer,
+        throttle numeric,
+        brake numeric,
+        drs integer,
+        created_at timestamp without time zone,
+        updated_at timestamp without time zone
+    )
+'''
+
+def build_rows(count):
+    """Linhas sintéticas de telemetria (20 carros, 4 amostras por segundo)"""
+    start = datetime(2025, 5, 17, 14, 0, 0)
+    now = datetime.now()
+    rows = []
+    for i in range(count):
+        sample_time = start + timedelta(microseconds=250_000 * (i // 20))
+        speed = 100 + i % 220
+        rows.append((
+            sample_time, sample_time, 1, str(i % 20 + 1),
+            10500 + i % 1500, speed, min(8, speed // 40 + 1),
+            float(i % 101), float(i % 2 * 100), 8,
+            now, now
+        ))
+    return rows
+
+async def run_execute(conn, loader, rows, batch_size):
+    sql = loader.insert_sql(TABLE, CAR_TELEMETRY_COLUMNS)
+    for row in rows:
+        await conn.execute(sql, *row)
+
+async def run_executemany(conn, loader, rows, batch_size):
+    sql = loader.insert_sql(TABLE, CAR_TELEMETRY_COLUMNS)
+    for i in range(0, len(rows), batch_size):
+        await conn.executemany(sql, rows[i:i + batch_size])
+
+async def run_copy(conn, loader, rows, batch_size):
+    for i in range(0, len(rows), batch_size):
+        await loader.load(conn, TABLE, CAR_TELEMETRY_COLUMNS, rows[i:i + batch_size])
+
+async def measure(conn, label, method, rows, batch_size):
+    """Carrega as linhas na tabela vazia e retorna linhas/s"""
+    await conn.execute(f'TRUNCATE {TABLE}')
+    loader = CopyLoader(schema='pg_temp')
+
+    start = time.perf_counter()
+    async with conn.transaction():
+        await method(conn, loader, rows, batch_size)
+    elapsed = time.perf_counter() - start
+
+    loaded = await conn.fetchval(f'SELECT count(*) FROM {TABLE}')
+    if loaded != len(rows):
+        print(f"❌ {label}: {loaded} linhas carregadas, esperado {len(rows)}")
+        sys.exit(1)
+
+    rate = len(rows) / elapsed
+    print(f"{label:<14} {elapsed:8.3f}s  {rate:12.0f} linhas/s")
+    return rate
+
+async def main():
+    dsn = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DSN
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    rows = build_rows(count)
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(CREATE_TABLE)
+        print(f"PostgreSQL: {conn.get_server_version()}")
+        print(f"{count} linhas de telemetria, lotes de {batch_size}\n")
+
+        # execute (uma ida e volta por linha) é medido sobre uma amostra menor
+        sample = rows[:min(count, 2000)]
+        baseline = await measure(conn, 'execute', run_execute, sample, batch_size)
+        for label, method in (('executemany', run_executemany), ('COPY', run_copy)):
+            rate = await measure(conn, label, method, rows, batch_size)
+            print(f"{'':<14} ganho de {rate / baseline:.1f}x sobre execute")
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Mede o custo de decodificação JSON de cada backend disponível (json, orjson,
+msgspec) sobre os payloads de um arquivo gravado pelo fastf1_livetiming, e
+confere que todos produzem o mesmo resultado que o json da biblioteca padrão.
+
+São medidos dois conjuntos: os JSONs descomprimidos de CarData.z/Position.z e
+os payloads dos demais tópicos convertidos pelo line_parser.
+
+Uso: python benchmarks/bench_json_codec.py [arquivo] [repetições]
+"""
+
+import base64
+import importlib
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec
+from decoder import COMPRESSED_TOPICS
+from line_parser import _python_literal_to_json, parse_data_line
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'f1_data_q1.txt')
+
+def load_payloads(input_file):
+    """Separa os documentos JSON do arquivo: payloads comprimidos (bytes) e demais tópicos (str)"""
+    compressed, literals = [], []
+    with open(input_file, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            topic, data, _ = parse_data_line(line)
+            if topic in COMPRESSED_TOPICS:
+                compressed.append(zlib.decompress(base64.b64decode(data), -zlib.MAX_WBITS))
+            elif isinstance(data, (dict, list)):
+                # Mesmo caminho usado pelo line_parser para os payloads sem aspas duplas
+                source = repr(data)
+                if '"' not in source and '\\' not in source:
+                    literals.append(_python_literal_to_json(source))
+    return compressed, literals
+
+def available_backends():
+    """Retorna os backends instalados: nome -> função loads"""
+    backends = {'json': json.loads}
+    for name in ('orjson', 'msgspec'):
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        backends[name] = module.loads if name == 'orjson' else module.json.Decoder().decode
+    return backends
+
+def measure(label, loads, documents, repeats):
+    """Decodifica todos os documentos e retorna o tempo médio por documento (µs)"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for document in documents:
+            loads(document)
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(len(document) for document in documents) * repeats
+    per_doc_us = elapsed / (repeats * len(documents)) * 1e6
+    print(f"{label:<12} {per_doc_us:8.2f} µs/doc  {total_bytes / elapsed / 1e6:8.1f} MB/s")
+    return per_doc_us
+
+def main():
+    input_file = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_INPUT
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    compressed, literals = load_payloads(input_file)
+    backends = available_backends()
+
+    print(f"Arquivo: {input_file}")
+    print(f"Backend selecionado por json_codec: {json_codec.BACKEND}")
+    print(f"Backends instalados: {', '.join(backends)}\n")
+
+    # Todos os backends devem reproduzir o resultado do json da biblioteca padrão
+    for name, loads in backends.items():
+        for document in compressed + literals:
+            if loads(document) != json.loads(document):
+                print(f"❌ {name}: resultado diverge do json da biblioteca padrão")
+                sys.exit(1)
+    print("✅ Resultados idênticos ao json da biblioteca padrão\n")
+
+    for label, documents in (("Payloads comprimidos (CarData.z/Position.z)", compressed),
+                             ("Payloads dos demais tópicos", literals)):
+        if not documents:
+            continue
+        size = sum(len(document) for document in documents) / len(documents)
+        print(f"{label}: {len(documents)} documentos, {size:.0f} bytes em média")
+        baseline = None
+        for name, loads in backends.items():
+            per_doc = measure(name, loads, documents, repeats)
+            baseline = baseline or per_doc
+            if name != 'json':
+                print(f"{'':<12} ganho de {baseline / per_doc:.1f}x sobre json")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Verifica a compatibilidade do line_parser com ast.literal_eval e mede o ganho de
+desempenho sobre um arquivo gravado pelo fastf1_livetiming.
+
+Uso: python benchmarks/bench_line_parser.py [arquivo] [repetições]
+"""
+
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from line_parser import parse_data_line
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'f1_data_q1.txt')
+
+def check_compatibility(lines):
+    """Compara o resultado do parser com ast.literal_eval linha a linha"""
+    mismatches = 0
+    for line_num, line in enumerate(lines, start=1):
+        expected = ast.literal_eval(line)
+        expected = (expected[0], expected[1], expected[2])
+
+        for candidate in (line, line.encode('utf-8')):
+            result = parse_data_line(candidate)
+            if result != expected:
+                mismatches += 1
+                print(f"❌ Linha {line_num}: resultado diverge de ast.literal_eval ({type(candidate).__name__})")
+
+        # Filtragem por tópico deve descartar a linha ou devolver o mesmo registro
+        if parse_data_line(line, {expected[0]}) != expected or parse_data_line(line, {'__nenhum__'}) is not None:
+            mismatches += 1
+            print(f"❌ Linha {line_num}: filtragem por tópico incorreta")
+
+    return mismatches
+
+def measure(label, func, lines, repeats):
+    """Executa a função sobre todas as linhas e retorna o tempo médio por linha"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for line in lines:
+            func(line)
+    elapsed = time.perf_counter() - start
+    per_line_us = elapsed / (repeats * len(lines)) * 1e6
+    print(f"{label:<40} {per_line_us:8.2f} µs/linha  {repeats * len(lines) / elapsed:12.0f} linhas/s")
+    return per_line_us
+
+def main():
+    input_file = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_INPUT
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with open(input_file, 'r') as f:
+        lines = [line for line in f if line.strip()]
+
+    print(f"Arquivo: {input_file} ({len(lines)} linhas)")
+
+    mismatches = check_compatibility(lines)
+    if mismatches:
+        print(f"❌ {mismatches} divergências encontradas")
+        sys.exit(1)
+    print("✅ Resultados idênticos a ast.literal_eval em todas as linhas\n")
+
+    baseline = measure("ast.literal_eval", ast.literal_eval, lines, repeats)
+    fast = measure("parse_data_line", parse_data_line, lines, repeats)
+    weather_only = measure("parse_data_line (só WeatherData)",
+                           lambda line: parse_data_line(line, {'WeatherData'}), lines, repeats)
+
+    print(f"\nGanho: {baseline / fast:.1f}x (todos os tópicos), {baseline / weather_only:.1f}x (com filtro de tópico)")
+
+if __name__ == "__main__":
+    main()
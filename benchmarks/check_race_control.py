@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Verifica de ponta a ponta as mensagens do controle de corrida no formato gravado.
+
+O tópico RaceControlMessages traz ``Messages`` como lista no primeiro registro
+(``_kf``) e como dicionário indexado nas atualizações. As linhas do arquivo
+gravado (por padrão f1_data_q1.txt, com a lista) e as de uma sessão do
+load_generator (lista e dicionário) passam pelo F1DataTransformer e pelo
+SupabaseLoader real, contra uma conexão substituta que grava as linhas de
+race_control_messages e rejeita, como o asyncpg, um ``utc_time`` que não seja
+texto. Cada mensagem deve chegar ao banco uma vez, com o ``Utc`` original —
+o mesmo valor que o monitor_race_control grava na chave natural.
+
+Uso: python benchmarks/check_race_control.py [arquivo]
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg
+
+from line_parser import parse_data_line
+from load_generator import SessionGenerator
+from pipeline_bench import DEFAULT_INPUT, NullConnection, NullPool
+from supabase_loader import SupabaseLoader
+from transformer import F1DataTransformer
+
+# Posição de utc_time nas linhas de race_control_messages (statements.RACE_CONTROL_MESSAGES_COLUMNS)
+UTC_TIME_INDEX = 2
+
+class RecordingConnection(NullConnection):
+    """Conexão substituta que guarda as linhas de race_control_messages"""
+
+    def __init__(self):
+        super().__init__()
+        self.race_control_rows = []
+
+    async def executemany(self, query, values):
+        values = list(values)
+        if 'race_control_messages' in query:
+            for row in values:
+                # Mesmo erro do asyncpg ao codificar um parâmetro de uma coluna text
+                if row[UTC_TIME_INDEX] is not None and not isinstance(row[UTC_TIME_INDEX], str):
+                    raise asyncpg.DataError(f"invalid input for query argument $3: {row[UTC_TIME_INDEX]!r} "
+                                            f"(expected str, got {type(row[UTC_TIME_INDEX]).__name__})")
+            self.race_control_rows.extend(values)
+        await super().executemany(query, values)
+
+def expected_messages(lines):
+    """Mensagens (Utc, Category, Message) contidas nas linhas, na ordem, e os formatos encontrados"""
+    messages, shapes = [], set()
+    for line in lines:
+        record = parse_data_line(line, {'RaceControlMessages'})
+        if record is None:
+            continue
+        payload = record[1].get('Messages', [])
+        shapes.add(type(payload).__name__)
+        if isinstance(payload, dict):
+            payload = list(payload.values())
+        messages.extend((m.get('Utc'), m.get('Category', ''), m.get('Message', '')) for m in payload)
+    return messages, shapes
+
+async def check(label, lines):
+    """Passa as linhas pelo transformador e pelo loader; retorna o número de divergências"""
+    expected, shapes = expected_messages(lines)
+
+    transformer = F1DataTransformer()
+    loader = SupabaseLoader(spool_dir='')
+    loader.pool = NullPool()
+    loader.pool.connection = RecordingConnection()
+    loader.retrying.dead_letter.path = ''  # linhas rejeitadas só no log
+
+    await loader.load_batch(transformer.process_data_batch(lines))
+    rows = loader.pool.connection.race_control_rows
+    loaded = [(row[UTC_TIME_INDEX], row[3], row[4]) for row in rows]
+
+    failures = 0
+    if loaded != expected:
+        failures += 1
+        print(f"❌ {label}: {len(loaded)} mensagens carregadas, esperado {len(expected)}")
+        for row in sorted(set(expected) - set(loaded))[:5]:
+            print(f"   faltando: {row}")
+    rejected = loader.retrying.dead_letter.rows['race_control_messages']
+    if rejected:
+        failures += 1
+        print(f"❌ {label}: {rejected} mensagens rejeitadas pelo banco")
+
+    if not failures:
+        print(f"✅ {label}: {len(loaded)} mensagens ({', '.join(sorted(shapes))}) carregadas com o Utc original")
+    return failures
+
+async def main():
+    input_file = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_INPUT
+    with open(input_file, 'r') as f:
+        recorded = [line for line in f if line.strip()]
+    generated = list(SessionGenerator(cars=4, duration=600.0, race_control_interval=60.0).lines())
+
+    failures = await check(os.path.basename(input_file), recorded)
+    failures += await check('load_generator', generated)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Benchmark de ponta a ponta do pipeline sobre sessões gravadas.
+
+Executa extração → análise → decodificação → transformação → carga sobre um
+arquivo gravado pelo fastf1_livetiming (por padrão f1_data_q1.txt), lote a
+lote, como o main_supabase.py. A extração usa o ReplaySource sem pausas e a
+carga roda o SupabaseLoader real contra uma conexão substituta que apenas
+consome as linhas montadas, sem banco de dados.
+
+Para simular uma corrida inteira, ``--repeat N`` concatena N cópias do arquivo
+(com os timestamps deslocados) em um arquivo temporário.
+
+Para cada etapa são medidos linhas/s, registros/s, latência p50/p99 por lote e
+o pico de memória residente (RSS). Os resultados podem ser gravados em JSON e
+comparados com uma execução anterior:
+
+    python benchmarks/pipeline_bench.py --repeat 100 --output antes.json
+    python benchmarks/pipeline_bench.py --repeat 100 --compare antes.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+
+import json_codec
+from decoder import DEFAULT_WORKERS, PayloadDecoder
+from line_parser import peek_timestamp
+from replay_source import ReplaySource
+from supabase_loader import SupabaseLoader
+from timestamps import from_epoch_us, to_epoch_us
+from transformer import F1DataTransformer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_INPUT = os.path.join(ROOT_DIR, 'f1_data_q1.txt')
+
+STAGES = ('extract', 'parse', 'decode', 'transform', 'load')
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+class NullConnection:
+    """Conexão substituta: consome as linhas enviadas pelo loader sem banco de dados"""
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self._staged = 0  # Linhas do último COPY (a tabela temporária do CopyLoader)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, query, *args):
+        self.statements += 1
+        self.rows += 1
+        # Status no formato do asyncpg; o INSERT ... SELECT da tabela temporária grava o último COPY
+        return f"INSERT 0 {self._staged if 'SELECT' in query else 1}"
+
+    async def executemany(self, query, values):
+        self.statements += 1
+        self.rows += sum(1 for _ in values)
+
+    async def copy_records_to_table(self, table_name, records, columns=None, **kwargs):
+        self.statements += 1
+        self._staged = sum(1 for _ in records)
+        self.rows += self._staged
+
+    async def fetch(self, query, *args):
+        return []
+
+    async def prepare(self, query):
+        return NullStatement(self, query)
+
+    def is_in_transaction(self):
+        return False
+
+class NullStatement:
+    """Instrução preparada substituta (StatementRegistry fora do modo pooler)"""
+
+    def __init__(self, connection, query):
+        self.connection = connection
+        self.query = query
+
+    async def executemany(self, values):
+        await self.connection.executemany(self.query, values)
+
+class NullPool:
+    """Pool substituto com uma única NullConnection"""
+
+    def __init__(self):
+        self.connection = NullConnection()
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+    async def close(self):
+        pass
+
+class StageStats:
+    """Acumula tempos, volumes e pico de memória de uma etapa"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.lines = 0
+        self.records = 0
+        self.peak_rss = 0
+
+    def record(self, elapsed, lines, records):
+        self.latencies.append(elapsed)
+        self.lines += lines
+        self.records += records
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+    def summary(self):
+        busy = sum(self.latencies)
+        return {
+            'batches': len(self.latencies),
+            'lines': self.lines,
+            'records': self.records,
+            'seconds': round(busy, 6),
+            'lines_per_s': round(self.lines / busy, 1) if busy else None,
+            'records_per_s': round(self.records / busy, 1) if busy else None,
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 3),
+            'p99_ms': round(percentile(self.latencies, 99) * 1000, 3),
+            'peak_rss_mb': round(self.peak_rss / 1024 / 1024, 1),
+        }
+
+def percentile(values, pct):
+    """Percentil por vizinho mais próximo; 0 para uma lista vazia"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def current_rss():
+    """Memória residente atual do processo (bytes)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        # Sem /proc: usa o pico informado pelo sistema (KB no Linux, bytes no macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def build_synthetic_input(input_file, repeat):
+    """Concatena ``repeat`` cópias do arquivo, deslocando os timestamps de cada cópia"""
+    with open(input_file, 'rb') as f:
+        lines = [line if line.endswith(b'\n') else line + b'\n' for line in f if line.strip()]
+
+    stamps = [peek_timestamp(line) for line in lines]
+    epochs = [to_epoch_us(stamp) for stamp in stamps if stamp]
+    span_us = (max(epochs) - min(epochs) + 1_000_000) if epochs else 0
+
+    fd, path = tempfile.mkstemp(prefix='f1_bench_', suffix='.txt')
+    with os.fdopen(fd, 'wb') as out:
+        for copy in range(repeat):
+            shift = copy * span_us
+            for line, stamp in zip(lines, stamps):
+                if copy and stamp:
+                    shifted = from_epoch_us(to_epoch_us(stamp) + shift).strftime('%Y-%m-%dT%H:%M:%S.%f') + '0Z'
+                    line = line[:line.rfind(b", '") + 3] + shifted.encode('ascii') + b"']\n"
+                out.write(line)
+    return path
+
+async def run_pipeline(input_file, batch_size, workers):
+    """Executa o pipeline lote a lote e retorna as estatísticas de cada etapa"""
+    stats = {name: StageStats(name) for name in STAGES}
+    source = ReplaySource(input_file, speed=0, max_batch=batch_size)
+    transformer = F1DataTransformer()
+    decoder = PayloadDecoder(workers=workers)
+    loader = SupabaseLoader(spool_dir='')  # a conexão substituta nunca falha
+    loader.pool = NullPool()
+    decoder.start()
+
+    wall_start = time.perf_counter()
+    latencies = []
+    try:
+        while True:
+            batch_start = time.perf_counter()
+            lines = await source.read_batch(timeout=0)
+            if not lines:
+                break
+            t1 = time.perf_counter()
+            stats['extract'].record(t1 - batch_start, len(lines), len(lines))
+
+            records = transformer.parse_lines(lines)
+            t2 = time.perf_counter()
+            stats['parse'].record(t2 - t1, len(lines), len(records))
+
+            records = await decoder.decode_records(records)
+            t3 = time.perf_counter()
+            stats['decode'].record(t3 - t2, len(lines), len(records))
+
+            transformed = transformer.process_records(records)
+            transformed_count = sum(len(value) for value in transformed.values())
+            t4 = time.perf_counter()
+            stats['transform'].record(t4 - t3, len(lines), transformed_count)
+
+            await loader.load_batch(transformed)
+            t5 = time.perf_counter()
+            stats['load'].record(t5 - t4, len(lines), transformed_count)
+
+            latencies.append(t5 - batch_start)
+    finally:
+        source.close()
+        decoder.close()
+
+    wall = time.perf_counter() - wall_start
+    total_lines = stats['extract'].lines
+    total_records = stats['load'].records
+    end_to_end = {
+        'batches': len(latencies),
+        'lines': total_lines,
+        'records': total_records,
+        'seconds': round(wall, 6),
+        'lines_per_s': round(total_lines / wall, 1) if wall else None,
+        'records_per_s': round(total_records / wall, 1) if wall else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'peak_rss_mb': round(max(s.peak_rss for s in stats.values()) / 1024 / 1024, 1),
+        'rows_loaded': loader.pool.connection.rows,
+    }
+    return {name: s.summary() for name, s in stats.items()}, end_to_end
+
+def git_revision():
+    """Commit atual do repositório (None fora de um checkout git)"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(stages, end_to_end):
+    print(f"{'etapa':<10} {'lotes':>6} {'linhas/s':>12} {'registros/s':>12} {'p50 ms':>9} {'p99 ms':>9} {'RSS MB':>8}")
+    for name, s in list(stages.items()) + [('total', end_to_end)]:
+        print(f"{name:<10} {s['batches']:>6} {s['lines_per_s'] or 0:>12.0f} {s['records_per_s'] or 0:>12.0f} "
+              f"{s['p50_ms']:>9.3f} {s['p99_ms']:>9.3f} {s['peak_rss_mb']:>8.1f}")
+
+def print_comparison(result, baseline_file):
+    """Mostra a variação de vazão e latência em relação a uma execução anterior"""
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    print(f"\nComparação com {baseline_file} (commit {baseline.get('git_revision')}):")
+    current = dict(result['stages'], total=result['end_to_end'])
+    previous = dict(baseline.get('stages', {}), total=baseline.get('end_to_end', {}))
+    for name, s in current.items():
+        old = previous.get(name)
+        if not old or not old.get('lines_per_s') or not s['lines_per_s']:
+            continue
+        print(f"{name:<10} vazão {s['lines_per_s'] / old['lines_per_s']:6.2f}x   "
+              f"p99 {old['p99_ms']:.3f} → {s['p99_ms']:.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de ponta a ponta do pipeline da F1')
+    parser.add_argument('input_file', nargs='?', default=DEFAULT_INPUT, help='Arquivo gravado pelo fastf1_livetiming')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Concatena N cópias do arquivo para simular uma sessão longa')
+    parser.add_argument('--batch-size', type=int, default=500, help='Linhas por lote')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Processos de decodificação')
+    parser.add_argument('--output', help='Grava os resultados neste arquivo JSON')
+    parser.add_argument('--compare', help='Compara com os resultados JSON de uma execução anterior')
+    args = parser.parse_args()
+
+    # O loader registra avisos a cada lote; só interessam erros
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    input_file = args.input_file
+    if args.repeat > 1:
+        input_file = build_synthetic_input(args.input_file, args.repeat)
+
+    try:
+        input_bytes = os.path.getsize(input_file)
+        stages, end_to_end = asyncio.run(run_pipeline(input_file, args.batch_size, args.workers))
+    finally:
+        if input_file != args.input_file:
+            os.remove(input_file)
+
+    result = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'json_backend': json_codec.BACKEND,
+        'input_file': os.path.basename(args.input_file),
+        'repeat': args.repeat,
+        'input_bytes': input_bytes,
+        'batch_size': args.batch_size,
+        'decoder_workers': args.workers,
+        'stages': stages,
+        'end_to_end': end_to_end,
+    }
+
+    print(f"Arquivo: {args.input_file} x{args.repeat} ({input_bytes / 1024 / 1024:.1f} MB), "
+          f"lotes de {args.batch_size} linhas, {args.workers} processos de decodificação, "
+          f"JSON: {json_codec.BACKEND}\n")
+    print_table(stages, end_to_end)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResultados gravados em {args.output}")
+
+    if args.compare:
+        print_comparison(result, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Escrita em micro-lotes para os monitores.
+
+O BufferedWriter acumula linhas e as entrega à função de gravação quando o
+buffer atinge ``max_rows`` linhas ou quando a primeira linha pendente completa
+``max_delay_ms`` milissegundos, o que ocorrer primeiro. As gravações são feitas
+em ordem por uma única tarefa; se ficarem para trás (``max_pending`` lotes
+aguardando), quem adiciona linhas espera — contrapressão em vez de memória sem
+limite. Em ``close()`` o que estiver no buffer é gravado.
+
+Como as linhas só chegam ao banco depois, o checkpoint de leitura não pode ser
+gravado logo após o processamento: ``when_flushed`` registra uma função que
+roda depois que todas as linhas adicionadas até aquele momento forem gravadas.
+Se a gravação de um lote falhar, as funções registradas a partir dele não rodam
+mais: o checkpoint fica antes das linhas perdidas e a próxima execução as lê de
+novo.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+# Tamanho máximo do lote (linhas) e espera máxima da primeira linha no buffer
+DEFAULT_MAX_ROWS = int(os.getenv("WRITER_MAX_ROWS", "500"))
+DEFAULT_MAX_DELAY_MS = int(os.getenv("WRITER_MAX_DELAY_MS", "250"))
+
+# Lotes aguardando gravação (incluindo o lote em gravação) antes de aplicar contrapressão
+DEFAULT_MAX_PENDING = int(os.getenv("WRITER_MAX_PENDING", "4"))
+
+class BufferedWriter:
+    """Agrupa linhas em lotes limitados por tamanho e por tempo e os grava em ordem"""
+
+    def __init__(self, write: Callable[[List[tuple]], Awaitable[object]], name: str = 'writer',
+                 max_rows: int = DEFAULT_MAX_ROWS, max_delay_ms: int = DEFAULT_MAX_DELAY_MS,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self.write = write
+        self.name = name
+        self.max_rows = max(max_rows, 1)
+        self.max_delay = max(max_delay_ms, 0) / 1000.0
+        self.max_pending = max(max_pending, 1)
+
+        self._rows = []
+        self._callbacks = []
+        self._batches = deque()  # (linhas, callbacks); o primeiro é o lote em gravação
+        self._timer = None
+        self._task = None
+        self._wakeup = None
+        self._space = None
+        self._drained = None
+        self.failed = False  # Algum lote falhou: os callbacks pós-gravação não rodam mais
+
+        # Métricas
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.flush_count = 0
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+        self.backpressure_waits = 0
+        self.callbacks_skipped = 0
+
+    @property
+    def buffered(self) -> int:
+        """Linhas no buffer que ainda não formaram um lote"""
+        return len(self._rows)
+
+    @property
+    def pending(self) -> int:
+        """Lotes aguardando gravação (incluindo o lote em gravação)"""
+        return len(self._batches)
+
+    def _ensure_started(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Event()
+            self._drained = asyncio.Event()
+            self._drained.set()
+            self._task = asyncio.create_task(self._run())
+
+    def _start_timer(self) -> None:
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._seal)
+
+    def _seal(self) -> None:
+        """Fecha o buffer atual como um lote e o entrega à tarefa de gravação"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._rows and not self._callbacks:
+            return
+
+        self._batches.append((self._rows, self._callbacks))
+        self._rows, self._callbacks = [], []
+        self._drained.clear()
+        self._wakeup.set()
+
+    async def add(self, row: tuple) -> None:
+        """Adiciona uma linha ao buffer"""
+        await self.extend((row,))
+
+    async def extend(self, rows: Iterable[tuple]) -> None:
+        """Adiciona linhas ao buffer; aguarda se as gravações estiverem atrasadas"""
+        self._ensure_started()
+        self._rows.extend(rows)
+
+        # Lotes limitados a max_rows mesmo quando muitas linhas chegam de uma vez
+        while len(self._rows) >= self.max_rows:
+            overflow = self._rows[self.max_rows:]
+            del self._rows[self.max_rows:]
+            self._seal()
+            self._rows = overflow
+        if self._rows:
+            self._start_timer()
+
+        # Contrapressão: espera a gravação alcançar antes de aceitar mais linhas
+        while len(self._batches) > self.max_pending:
+            self.backpressure_waits += 1
+            self._space.clear()
+            await self._space.wait()
+
+    def when_flushed(self, callback: Callable[[], None]) -> None:
+        """Executa ``callback`` depois que todas as linhas já adicionadas forem gravadas"""
+        if self.failed:
+            self.callbacks_skipped += 1
+            return
+        if not self._rows and not self._batches and not self._callbacks:
+            callback()
+            return
+
+        self._ensure_started()
+        self._callbacks.append(callback)
+        self._start_timer()
+
+    async def _run(self) -> None:
+        """Grava os lotes em ordem, um de cada vez"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._batches:
+                rows, callbacks = self._batches[0]
+                if rows and not await self._write(rows) and not self.failed:
+                    self.failed = True
+                    logger.warning(f"'{self.name}': lote não gravado; o checkpoint não avança mais nesta execução")
+
+                self._batches.popleft()
+                self._space.set()
+                if self.failed:
+                    # O checkpoint ficaria depois de linhas que não chegaram ao banco
+                    self.callbacks_skipped += len(callbacks)
+                    continue
+                for callback in callbacks:
+                    try:
+                        callback()
+                    except Exception as e:
+                        logger.error(f"Erro no callback pós-gravação de '{self.name}': {e}")
+
+            self._drained.set()
+
+    async def _write(self, rows: List[tuple]) -> bool:
+        """Grava um lote; retorna False se a gravação falhou"""
+        start = time.perf_counter()
+        try:
+            await self.write(rows)
+            self.rows_written += len(rows)
+            return True
+        except Exception as e:
+            self.rows_failed += len(rows)
+            logger.error(f"Erro ao gravar lote de {len(rows)} linhas em '{self.name}': {e}")
+            return False
+        finally:
+            elapsed = time.perf_counter() - start
+            self.flush_count += 1
+            self.flush_time += elapsed
+            self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    async def flush(self) -> None:
+        """Grava imediatamente o buffer e aguarda todos os lotes pendentes"""
+        if self._task is None:
+            return
+        self._seal()
+        await self._drained.wait()
+
+    async def close(self) -> None:
+        """Grava o que estiver pendente e encerra a tarefa de gravação"""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def report(self) -> None:
+        """Registra no log as estatísticas de gravação"""
+        average = self.flush_time / self.flush_count * 1000 if self.flush_count else 0.0
+        logger.info(f"Gravação '{self.name}': {self.rows_written} linhas em {self.flush_count} lotes "
+                    f"(média {average:.1f}ms, máx. {self.max_flush_time * 1000:.1f}ms), "
+                    f"falhas={self.rows_failed}, buffer={self.buffered}, pendentes={self.pending}, "
+                    f"esperas por contrapressão={self.backpressure_waits}, "
+                    f"checkpoints descartados={self.callbacks_skipped}")
+
+def when_all_flushed(writers: Sequence[BufferedWriter], callback: Callable[[], None]) -> None:
+    """Executa ``callback`` depois que todos os writers gravarem as linhas já adicionadas"""
+    if not writers:
+        callback()
+        return
+
+    remaining = [len(writers)]
+
+    def on_flushed() -> None:
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            callback()
+
+    for writer in writers:
+        writer.when_flushed(on_flushed)
+
+def read_position(tailer) -> Tuple[int, Optional[int], int]:
+    """Posição atual do tailer (offset, checksum e tamanho da última linha)"""
+    return tailer.position, tailer.last_line_checksum, tailer.last_line_length
+
+def checkpoint_callback(store, consumer: str, tailer, position: Optional[tuple] = None) -> Callable[[], None]:
+    """Função que grava o checkpoint com ``position`` ou a posição atual do tailer (capturada agora)"""
+    position = position or read_position(tailer)
+    return lambda: store.save(consumer, tailer.path, *position)
@@ -0,0 +1,102 @@
+"""
+Checkpoints persistentes da posição de leitura de cada consumidor do arquivo de dados.
+
+Cada consumidor (monitor, serviço de ingestão, pipeline principal) grava, em
+um arquivo próprio, o offset em bytes após a última linha processada e o CRC32
+dessa linha. A gravação é atômica (arquivo temporário + fsync + rename), de modo
+que uma queda no meio da escrita nunca deixa um checkpoint corrompido. Ao reiniciar, o checksum é
+conferido contra o arquivo para detectar se ele foi recriado ou truncado.
+"""
+
+import os
+import time
+import zlib
+from typing import Dict, Optional
+
+from loguru import logger
+
+import json_codec
+
+# Diretório padrão dos checkpoints (pode ser alterado por F1_CHECKPOINT_DIR)
+DEFAULT_CHECKPOINT_DIR = os.getenv("F1_CHECKPOINT_DIR", "f1_checkpoints")
+
+def line_checksum(line) -> int:
+    """Calcula o CRC32 de uma linha (str ou bytes)"""
+    if isinstance(line, str):
+        line = line.encode('utf-8')
+    return zlib.crc32(line)
+
+class CheckpointStore:
+    """Guarda, de forma atômica, o offset e o checksum de cada consumidor"""
+
+    def __init__(self, directory: str = DEFAULT_CHECKPOINT_DIR):
+        self.directory = directory
+
+    def _path(self, consumer: str) -> str:
+        """Caminho do arquivo de checkpoint de um consumidor"""
+        safe_name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in consumer)
+        return os.path.join(self.directory, f"{safe_name}.json")
+
+    def get(self, consumer: str) -> Optional[Dict]:
+        """Retorna o checkpoint de um consumidor, se existir e for legível"""
+        path = self._path(consumer)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'r') as f:
+                return json_codec.loads(f.read())
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro ao ler checkpoint de {path}: {e}")
+            return None
+
+    def save(self, consumer: str, input_file: str, offset: int, checksum: Optional[int], line_length: int = 0) -> None:
+        """Grava o checkpoint de um consumidor de forma atômica"""
+        checkpoint = {
+            'consumer': consumer,
+            'input_file': os.path.abspath(input_file),
+            'offset': offset,
+            'checksum': checksum,
+            'line_length': line_length,
+            'updated_at': time.time()
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(consumer)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json_codec.dumps(checkpoint))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def resume_position(self, consumer: str, input_file: str) -> int:
+        """Retorna o offset para retomar a leitura, ou 0 se o checkpoint não for válido"""
+        checkpoint = self.get(consumer)
+        if not checkpoint:
+            return 0
+
+        if checkpoint.get('input_file') != os.path.abspath(input_file):
+            logger.info(f"Checkpoint de '{consumer}' refere-se a outro arquivo; lendo desde o início")
+            return 0
+
+        offset = checkpoint.get('offset', 0)
+        line_length = checkpoint.get('line_length', 0)
+        if offset <= 0 or line_length <= 0:
+            return max(offset, 0)
+
+        # Confere a última linha processada para garantir que o arquivo é o mesmo
+        try:
+            with open(input_file, 'rb') as f:
+                f.seek(offset - line_length)
+                last_line = f.read(line_length)
+        except OSError:
+            logger.warning(f"Arquivo {input_file} indisponível para validar o checkpoint de '{consumer}'")
+            return 0
+
+        if len(last_line) != line_length or line_checksum(last_line) != checkpoint.get('checksum'):
+            logger.warning(f"Checkpoint de '{consumer}' não confere com {input_file}; lendo desde o início")
+            return 0
+
+        logger.info(f"Retomando '{consumer}' a partir do byte {offset} de {input_file}")
+        return offset
@@ -38,4 +38,10 @@ F1_TOPICS = [
 F1_TIMEOUT = int(os.getenv("F1_TIMEOUT", "10800"))
 
 # Intervalo para processar lotes de dados (em milissegundos)
-BATCH_INTERVAL_MS = int(os.getenv("BATCH_INTERVAL_MS", "100"))  # Padrão: 100ms
\ No newline at end of file
+BATCH_INTERVAL_MS = int(os.getenv("BATCH_INTERVAL_MS", "100"))  # Padrão: 100ms
+
+# Modo stream: o fastf1_livetiming envia os registros pelo pipe em vez de gravar no arquivo
+F1_STREAM_MODE = os.getenv("F1_STREAM_MODE", "false").lower() == "true"
+
+# No modo stream, grava também uma cópia dos registros em F1_DATA_FILE para arquivamento
+F1_STREAM_TEE = os.getenv("F1_STREAM_TEE", "true").lower() == "true"
\ No newline at end of file
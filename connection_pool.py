@@ -0,0 +1,256 @@
+"""
+Pool de conexões compartilhado, com verificação de saúde e reconexão.
+
+Os processadores dos monitores abriam cada um uma única conexão TLS; se ela
+caísse no meio da sessão, todas as inserções seguintes falhavam. O PoolManager
+envolve um pool do asyncpg (o mesmo usado pelo SupabaseLoader) e:
+
+- abre e verifica ``min_size`` conexões na inicialização (o custo do handshake
+  TLS fica fora do caminho dos dados);
+- verifica com ``SELECT 1`` as conexões ociosas há mais de
+  ``DB_HEALTH_CHECK_IDLE`` segundos antes de entregá-las;
+- descarta conexões quebradas e tenta de novo com espera exponencial com
+  jitter, tanto na criação do pool quanto em ``acquire``/``run``.
+
+``shared_pool`` devolve um único PoolManager por DSN dentro do processo, para
+que o serviço de ingestão e o SupabaseLoader compartilhem as mesmas conexões.
+"""
+
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import asyncpg
+from loguru import logger
+
+from statements import connection_options
+
+# Tamanho do pool: conexões abertas (e verificadas) na inicialização e limite máximo
+DEFAULT_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DEFAULT_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+
+# Tentativas após uma falha de conexão e espera exponencial (com jitter) entre elas
+DEFAULT_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "5"))
+DEFAULT_BACKOFF_BASE_MS = int(os.getenv("DB_BACKOFF_BASE_MS", "200"))
+DEFAULT_BACKOFF_MAX_MS = int(os.getenv("DB_BACKOFF_MAX_MS", "10000"))
+
+# Conexões ociosas há mais de N segundos são verificadas antes do uso
+DEFAULT_HEALTH_CHECK_IDLE = float(os.getenv("DB_HEALTH_CHECK_IDLE", "30"))
+HEALTH_CHECK_TIMEOUT = 5.0
+
+# Erros que indicam conexão perdida ou servidor indisponível (a operação pode ser repetida)
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.AdminShutdownError,
+    asyncpg.TooManyConnectionsError,
+)
+
+def is_connection_error(error: BaseException) -> bool:
+    """Indica se o erro é de conexão (e não de dados ou de SQL)"""
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    # O asyncpg levanta InterfaceError ao usar uma conexão que já foi fechada
+    return isinstance(error, asyncpg.InterfaceError) and 'closed' in str(error)
+
+def backoff_delay(attempt: int, base_ms: int = DEFAULT_BACKOFF_BASE_MS,
+                  max_ms: int = DEFAULT_BACKOFF_MAX_MS) -> float:
+    """Espera (em segundos) antes da tentativa ``attempt``: exponencial com jitter completo"""
+    ceiling = min(max_ms, base_ms * (2 ** attempt))
+    return random.uniform(0, ceiling) / 1000.0
+
+class TrackedConnection(asyncpg.Connection):
+    """Conexão do asyncpg que registra o último uso (para a verificação de saúde)"""
+
+    __slots__ = ('last_used',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+
+    def mark_used(self) -> None:
+        self.last_used = time.monotonic()
+
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_used
+
+class PoolManager:
+    """Pool de conexões com aquecimento, verificação de saúde e reconexão automática"""
+
+    def __init__(self, dsn: str, min_size: int = DEFAULT_POOL_MIN_SIZE,
+                 max_size: int = DEFAULT_POOL_MAX_SIZE, ssl: Optional[str] = "require",
+                 retries: int = DEFAULT_CONNECT_RETRIES,
+                 health_check_idle: float = DEFAULT_HEALTH_CHECK_IDLE, **pool_options):
+        self.dsn = dsn
+        self.min_size = max(min_size, 0)
+        self.max_size = max(max_size, self.min_size, 1)
+        self.ssl = ssl
+        self.retries = max(retries, 0)
+        self.health_check_idle = health_check_idle
+        # Sem cache de instruções quando o DSN aponta para o pooler em modo transação
+        self.pool_options = {**connection_options(dsn), **pool_options}
+        self.pool = None
+        self.users = 0  # Quantos componentes usam este pool (ver shared_pool)
+        self._start_lock = asyncio.Lock()
+
+        # Métricas
+        self.acquired = 0
+        self.health_checks = 0
+        self.broken_connections = 0
+        self.retried_operations = 0
+
+    async def start(self) -> None:
+        """Cria o pool (com novas tentativas) e aquece as conexões mínimas"""
+        async with self._start_lock:
+            if self.pool is not None:
+                return
+
+            for attempt in range(self.retries + 1):
+                try:
+                    start = time.perf_counter()
+                    self.pool = await asyncpg.create_pool(
+                        dsn=self.dsn,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        ssl=self.ssl,
+                        connection_class=TrackedConnection,
+                        **self.pool_options
+                    )
+                    break
+                except CONNECTION_ERRORS as e:
+                    if attempt == self.retries:
+                        raise
+                    delay = backoff_delay(attempt)
+                    logger.warning(f"Falha ao criar o pool de conexões ({e}); "
+                                   f"nova tentativa em {delay:.2f}s ({attempt + 1}/{self.retries})")
+                    await asyncio.sleep(delay)
+
+            await self._warmup()
+            logger.info(f"Pool de conexões pronto: {self.pool.get_size()} conexões abertas "
+                        f"(mín. {self.min_size}, máx. {self.max_size}) em {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    async def _warmup(self) -> None:
+        """Verifica as conexões mínimas já abertas pelo pool, em paralelo"""
+        async def ping(_):
+            async with self.acquire() as conn:
+                await conn.fetchval('SELECT 1', timeout=HEALTH_CHECK_TIMEOUT)
+
+        # Todas são adquiridas ao mesmo tempo para que cada uma seja uma conexão diferente
+        await asyncio.gather(*(ping(i) for i in range(self.min_size)))
+
+    async def _acquire_healthy(self, timeout: Optional[float] = None):
+        """Adquire uma conexão, verificando-a se estava ociosa; descarta conexões quebradas"""
+        for attempt in range(self.retries + 1):
+            conn = None
+            try:
+                conn = await self.pool.acquire(timeout=timeout)
+                if conn.idle_seconds() > self.health_check_idle:
+                    self.health_checks += 1
+                    await conn.fetchval('SELECT 1', timeout=HEALTH_CHECK_TIMEOUT)
+                self.acquired += 1
+                return conn
+            except CONNECTION_ERRORS as e:
+                self.broken_connections += 1
+                if conn is not None:
+                    # Conexão encerrada volta ao pool, que abre uma nova no próximo acquire
+                    conn.terminate()
+                    await self.pool.release(conn)
+                if attempt == self.retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"Conexão indisponível ({e}); nova tentativa em {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None):
+        """Empresta uma conexão verificada do pool (``async with manager.acquire() as conn``)"""
+        if self.pool is None:
+            await self.start()
+
+        conn = await self._acquire_healthy(timeout)
+        try:
+            yield conn
+        except BaseException as e:
+            # Conexão com erro de rede não volta a ser usada
+            if isinstance(e, Exception) and is_connection_error(e):
+                self.broken_connections += 1
+                conn.terminate()
+            raise
+        finally:
+            conn.mark_used()
+            await self.pool.release(conn)
+
+    async def run(self, operation: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Executa ``operation(conn, *args)``, repetindo em outra conexão se a conexão cair.
+
+        Use para operações que podem ser repetidas com segurança (o que falhou por
+        queda de conexão não foi confirmado no banco)."""
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.acquire() as conn:
+                    return await operation(conn, *args, **kwargs)
+            except Exception as e:
+                if not is_connection_error(e) or attempt == self.retries:
+                    raise
+                self.retried_operations += 1
+                delay = backoff_delay(attempt)
+                logger.warning(f"Conexão perdida durante a operação ({e}); repetindo em {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def execute(self, query: str, *args, **kwargs) -> str:
+        return await self.run(lambda conn: conn.execute(query, *args, **kwargs))
+
+    async def executemany(self, query: str, args, **kwargs) -> None:
+        return await self.run(lambda conn: conn.executemany(query, args, **kwargs))
+
+    async def fetch(self, query: str, *args, **kwargs):
+        return await self.run(lambda conn: conn.fetch(query, *args, **kwargs))
+
+    async def fetchrow(self, query: str, *args, **kwargs):
+        return await self.run(lambda conn: conn.fetchrow(query, *args, **kwargs))
+
+    async def fetchval(self, query: str, *args, **kwargs):
+        return await self.run(lambda conn: conn.fetchval(query, *args, **kwargs))
+
+    async def close(self) -> None:
+        """Libera o pool; ele só é fechado quando o último componente que o usa o libera"""
+        self.users = max(self.users - 1, 0)
+        if self.users > 0 or self.pool is None:
+            return
+
+        self.report()
+        await self.pool.close()
+        self.pool = None
+        if _shared.get(self.dsn) is self:
+            del _shared[self.dsn]
+
+    def report(self) -> None:
+        """Registra no log o uso do pool e as reconexões"""
+        size = self.pool.get_size() if self.pool else 0
+        idle = self.pool.get_idle_size() if self.pool else 0
+        logger.info(f"Pool de conexões: {size} abertas ({idle} ociosas), {self.acquired} empréstimos, "
+                    f"{self.health_checks} verificações, {self.broken_connections} conexões descartadas, "
+                    f"{self.retried_operations} operações repetidas")
+
+# Um PoolManager por DSN dentro do processo
+_shared: Dict[str, PoolManager] = {}
+
+async def shared_pool(dsn: str, **options) -> PoolManager:
+    """Retorna (e inicia) o PoolManager compartilhado do DSN; cada chamada deve ter um ``close()``"""
+    manager = _shared.get(dsn)
+    if manager is None:
+        manager = _shared[dsn] = PoolManager(dsn, **options)
+    manager.users += 1
+    try:
+        await manager.start()
+    except Exception:
+        manager.users -= 1
+        if manager.users == 0 and _shared.get(dsn) is manager:
+            del _shared[dsn]
+        raise
+    return manager
@@ -0,0 +1,145 @@
+"""
+Carga em massa via COPY para as tabelas de alto volume.
+
+As tabelas ``car_telemetry`` e ``car_positions`` recebem dezenas de linhas por
+mensagem da F1; o COPY (``copy_records_to_table`` do asyncpg, em formato
+binário) envia o lote inteiro em um único comando, sem o custo de um INSERT
+por linha. Tabelas que precisam de ON CONFLICT — ou em que o COPY falhar (por
+exemplo, sem permissão) — são carregadas com INSERT via ``executemany``.
+
+Nas tabelas de ``skip_conflicts`` (com chave natural única, ver
+sql/natural_keys.sql) o COPY vai para uma tabela temporária e as linhas passam
+para a tabela final com ``INSERT ... SELECT ... ON CONFLICT DO NOTHING``: uma
+reprodução ou um reinício só grava as linhas novas.
+"""
+
+import time
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence
+
+import asyncpg
+from loguru import logger
+
+# Tabelas de alto volume carregadas com COPY por padrão
+COPY_TABLES = frozenset({'car_telemetry', 'car_positions'})
+
+# Cláusula das tabelas com chave natural: linhas já existentes são ignoradas
+SKIP_CONFLICTS = 'ON CONFLICT DO NOTHING'
+
+# Colunas carregadas em cada tabela de alto volume (mesma ordem das tuplas de valores)
+CAR_TELEMETRY_COLUMNS = (
+    'timestamp', 'utc_timestamp', 'session_id', 'driver_number',
+    'rpm', 'speed', 'gear', 'throttle', 'brake', 'drs',
+    'created_at', 'updated_at'
+)
+CAR_POSITIONS_COLUMNS = (
+    'session_id', 'timestamp', 'utc_time', 'driver_number',
+    'x_coord', 'y_coord', 'z_coord', 'created_at', 'updated_at'
+)
+
+class CopyLoader:
+    """Carrega lotes de linhas com COPY, caindo para INSERT quando necessário"""
+
+    def __init__(self, schema: str = 'public', copy_tables: Iterable[str] = COPY_TABLES,
+                 statements=None, skip_conflicts: Iterable[str] = ()):
+        self.schema = schema
+        self.skip_conflicts = set(skip_conflicts)  # Tabelas em que linhas já existentes são ignoradas
+        # StatementRegistry opcional: o INSERT de reserva usa as instruções nomeadas (tabelas em public)
+        self.statements = statements
+        self.copy_tables = set(copy_tables)
+        self.copy_disabled = set()  # Tabelas em que o COPY falhou; seguem com INSERT
+        self._insert_sql = {}
+
+        # Métricas por método de carga ('copy' ou 'insert')
+        self.rows = Counter()
+        self.seconds = Counter()
+        self.duplicates = 0  # Linhas ignoradas por já existirem (somente via COPY)
+
+    def insert_sql(self, table: str, columns: Sequence[str], on_conflict: Optional[str] = None) -> str:
+        """Monta (e guarda) o INSERT parametrizado equivalente ao COPY"""
+        key = (table, tuple(columns), on_conflict)
+        sql = self._insert_sql.get(key)
+        if sql is None:
+            placeholders = ', '.join(f'${i}' for i in range(1, len(columns) + 1))
+            sql = f"INSERT INTO {self.schema}.{table} ({', '.join(columns)}) VALUES ({placeholders})"
+            if on_conflict:
+                sql += f" {on_conflict}"
+            self._insert_sql[key] = sql
+        return sql
+
+    def uses_copy(self, table: str, on_conflict: Optional[str] = None) -> bool:
+        """Indica se a tabela é carregada com COPY (o COPY não suporta ON CONFLICT, exceto via tabela temporária)"""
+        if table not in self.copy_tables or table in self.copy_disabled:
+            return False
+        return on_conflict is None or (table in self.skip_conflicts and on_conflict == SKIP_CONFLICTS)
+
+    async def load(self, conn, table: str, columns: Sequence[str], rows: List[tuple],
+                   on_conflict: Optional[str] = None) -> int:
+        """Carrega as linhas na tabela e retorna a quantidade carregada"""
+        if not rows:
+            return 0
+
+        if on_conflict is None and table in self.skip_conflicts:
+            on_conflict = SKIP_CONFLICTS
+
+        start = time.perf_counter()
+        method = 'insert'
+        if self.uses_copy(table, on_conflict):
+            try:
+                if on_conflict == SKIP_CONFLICTS:
+                    await self._copy_skipping_conflicts(conn, table, columns, rows)
+                # Dentro de uma transação, o savepoint mantém a transação utilizável se o COPY falhar
+                elif conn.is_in_transaction():
+                    async with conn.transaction():
+                        await self._copy(conn, table, columns, rows)
+                else:
+                    await self._copy(conn, table, columns, rows)
+                method = 'copy'
+            except (asyncpg.InsufficientPrivilegeError, asyncpg.FeatureNotSupportedError) as e:
+                logger.warning(f"COPY indisponível para {self.schema}.{table} ({e}); usando INSERT")
+                self.copy_disabled.add(table)
+
+        if method == 'insert':
+            if self._registered(table, columns, on_conflict):
+                await self.statements.executemany(conn, table, rows)
+            else:
+                await conn.executemany(self.insert_sql(table, columns, on_conflict), rows)
+
+        self.rows[method] += len(rows)
+        self.seconds[method] += time.perf_counter() - start
+        return len(rows)
+
+    def _registered(self, table: str, columns: Sequence[str], on_conflict: Optional[str]) -> bool:
+        """Indica se o INSERT equivale a uma instrução do registro"""
+        return (self.statements is not None and table in self.statements
+                and self.statements.sql(table) == self.insert_sql(table, columns, on_conflict))
+
+    async def _copy(self, conn, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+        await conn.copy_records_to_table(table, records=rows, columns=list(columns), schema_name=self.schema)
+
+    async def _copy_skipping_conflicts(self, conn, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+        """COPY para uma tabela temporária e INSERT ... SELECT ignorando as linhas já existentes"""
+        stage = f"_stage_{table}"
+        column_list = ', '.join(columns)
+        # Tudo na mesma transação: funciona também pelo pooler em modo transação
+        async with conn.transaction():
+            await conn.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {stage} ON COMMIT DROP AS "
+                f"SELECT {column_list} FROM {self.schema}.{table} WITH NO DATA"
+            )
+            await conn.execute(f"TRUNCATE {stage}")
+            await conn.copy_records_to_table(stage, records=rows, columns=list(columns))
+            status = await conn.execute(
+                f"INSERT INTO {self.schema}.{table} ({column_list}) "
+                f"SELECT {column_list} FROM {stage} {SKIP_CONFLICTS}"
+            )
+        self.duplicates += len(rows) - int(status.split()[-1])
+
+    def report(self) -> None:
+        """Registra no log a vazão de cada método de carga"""
+        for method, rows in self.rows.items():
+            seconds = self.seconds[method]
+            rate = rows / seconds if seconds else 0.0
+            logger.info(f"Carga via {method.upper()}: {rows} linhas, {rate:.0f} linhas/s")
+        if self.duplicates:
+            logger.info(f"Linhas já existentes ignoradas: {self.duplicates}")
@@ -0,0 +1,155 @@
+"""
+Decodificação dos payloads comprimidos da F1 (CarData.z e Position.z).
+
+Cada payload é base64 de um JSON comprimido com deflate "cru" (wbits negativo).
+O PayloadDecoder recebe lotes de payloads e os decodifica em um pool de
+processos, devolvendo os resultados na mesma ordem, para que o custo de CPU
+não bloqueie o event loop (e o I/O com o banco) durante catch-up ou backfill.
+Sem workers, ou se o pool falhar, a decodificação é feita em série.
+"""
+
+import asyncio
+import base64
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, List, Optional, Tuple
+
+from loguru import logger
+
+import json_codec
+
+# Tópicos cujo payload chega comprimido
+COMPRESSED_TOPICS = frozenset({'CarData.z', 'Position.z'})
+
+# Número padrão de processos de decodificação (0 = decodificação em série).
+# Com um único núcleo o pool só acrescenta o custo de serialização dos resultados.
+DEFAULT_WORKERS = int(os.getenv("DECODER_WORKERS", str(min(2, (os.cpu_count() or 1) - 1))))
+
+def decode_compressed_data(encoded_data):
+    """
+    Decodifica dados da F1 que estão em formato comprimido (base64 + zlib)
+    """
+    # Remove aspas se presentes
+    if isinstance(encoded_data, str) and encoded_data.startswith('"') and encoded_data.endswith('"'):
+        encoded_data = encoded_data[1:-1]
+
+    # Decodifica base64 e descomprime zlib com o wbits negativo (formato específico da F1)
+    decoded_data = zlib.decompress(base64.b64decode(encoded_data), -zlib.MAX_WBITS)
+
+    # Converte para JSON
+    return json_codec.loads(decoded_data)
+
+def _decode_chunk(payloads: List[str]) -> List[Optional[Any]]:
+    """Decodifica uma fatia de payloads (executado nos processos do pool); falhas viram None"""
+    results = []
+    for payload in payloads:
+        try:
+            results.append(decode_compressed_data(payload))
+        except Exception:
+            results.append(None)
+    return results
+
+class PayloadDecoder:
+    """Decodifica lotes de payloads comprimidos em um pool de processos, preservando a ordem"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, chunk_size: int = 64, min_parallel_batch: int = 16):
+        self.workers = max(workers, 0)
+        self.chunk_size = chunk_size
+        self.min_parallel_batch = min_parallel_batch  # Lotes menores são decodificados em série
+        self.pool = None
+
+        # Métricas
+        self.decoded_count = 0
+        self.failed_count = 0
+        self.busy_time = 0.0
+
+    def start(self) -> None:
+        """Cria o pool de processos (se houver workers configurados)"""
+        if self.workers > 0 and self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(f"Decodificador de payloads iniciado com {self.workers} processos")
+
+    @property
+    def parallel(self) -> bool:
+        """Indica se a decodificação está usando o pool de processos"""
+        return self.pool is not None
+
+    @property
+    def throughput(self) -> float:
+        """Payloads decodificados por segundo de decodificação"""
+        return self.decoded_count / self.busy_time if self.busy_time > 0 else 0.0
+
+    async def _decode_parallel(self, payloads: List[str]) -> List[Optional[Any]]:
+        """Distribui o lote em fatias pelo pool e junta os resultados na ordem original"""
+        loop = asyncio.get_running_loop()
+        # Fatias menores que chunk_size quando o lote não ocupa todos os workers
+        size = max(1, min(self.chunk_size, -(-len(payloads) // self.workers)))
+        futures = [
+            loop.run_in_executor(self.pool, _decode_chunk, payloads[i:i + size])
+            for i in range(0, len(payloads), size)
+        ]
+        results = []
+        for chunk in await asyncio.gather(*futures):
+            results.extend(chunk)
+        return results
+
+    async def decode_batch(self, payloads: List[str]) -> List[Optional[Any]]:
+        """Decodifica um lote de payloads; a posição de cada resultado é a do payload (None em falha)"""
+        if not payloads:
+            return []
+
+        start = time.perf_counter()
+        results = None
+
+        if self.pool is not None and len(payloads) >= self.min_parallel_batch:
+            try:
+                results = await self._decode_parallel(payloads)
+            except (BrokenProcessPool, OSError, RuntimeError) as e:
+                logger.warning(f"Pool de decodificação indisponível ({e}); decodificando em série")
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
+
+        if results is None:
+            results = _decode_chunk(payloads)
+
+        failures = sum(1 for result in results if result is None)
+        if failures:
+            logger.error(f"Falha ao decodificar {failures} de {len(payloads)} payloads")
+
+        self.busy_time += time.perf_counter() - start
+        self.decoded_count += len(payloads) - failures
+        self.failed_count += failures
+        return results
+
+    async def decode_records(self, records: List[Tuple[str, Any, str]]) -> List[Tuple[str, Any, str]]:
+        """Substitui os payloads comprimidos dos registros [tópico, dados, timestamp] pelos dados decodificados.
+
+        Registros cujo payload não pôde ser decodificado são descartados.
+        """
+        indexes = [i for i, (topic, data, _) in enumerate(records)
+                   if topic in COMPRESSED_TOPICS and isinstance(data, str)]
+        if not indexes:
+            return records
+
+        decoded = await self.decode_batch([records[i][1] for i in indexes])
+
+        records = list(records)
+        for i, data in zip(indexes, decoded):
+            topic, _, timestamp = records[i]
+            records[i] = (topic, data, timestamp) if data is not None else None
+        return [record for record in records if record is not None]
+
+    def report(self) -> None:
+        """Registra no log as métricas de decodificação"""
+        mode = f"{self.workers} processos" if self.parallel else "série"
+        logger.info(f"Decodificação ({mode}): {self.decoded_count} payloads, {self.failed_count} falhas, "
+                    f"{self.throughput:.0f} payloads/s")
+
+    def close(self) -> None:
+        """Encerra o pool de processos"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
@@ -1,92 +1,243 @@
 import asyncio
-import os
-import subprocess
 import sys
 import time
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 
 from loguru import logger
 
-from config import F1_DATA_FILE, F1_TOPICS, F1_TIMEOUT
+from config import F1_DATA_FILE, F1_TOPICS, F1_TIMEOUT, F1_STREAM_MODE, F1_STREAM_TEE
+from checkpoint import CheckpointStore
+from file_tailer import FileTailer
+from replay_source import ReplaySource
+
+# Destino usado no modo stream: o cliente grava cada registro direto no pipe
+STREAM_TARGET = "/dev/stdout"
+
+# Tamanho máximo de uma linha lida dos pipes do processo (DriverList e afins passam de 64 KB)
+STREAM_LINE_LIMIT = 16 * 1024 * 1024
 
 class F1DataExtractor:
-    """Extrator de dados da Fórmula 1 usando fastf1_livetiming"""
+    """Extrator de dados da Fórmula 1 usando fastf1_livetiming.
+    
+    No modo padrão, o cliente grava em ``output_file`` e as linhas são lidas do
+    arquivo. No modo stream, o cliente grava no stdout e os registros chegam ao
+    pipeline pelo pipe; opcionalmente são copiados para ``tee_file`` para arquivamento.
     
-    def __init__(self, output_file: str = F1_DATA_FILE):
-        self.output_file = output_file
+    Com ``replay_file``, nenhum processo é iniciado: as linhas de uma sessão
+    gravada são entregues no ritmo original multiplicado por ``replay_speed``.
+    """
+    
+    def __init__(self, output_file: str = F1_DATA_FILE, consumer: Optional[str] = None,
+                 stream: bool = F1_STREAM_MODE, tee_file: Optional[str] = None,
+                 replay_file: Optional[str] = None, replay_speed: float = 1.0):
+        self.output_file = replay_file or output_file
         self.process = None
-        self.last_position = 0
+        self.consumer = consumer
+        self.checkpoints = CheckpointStore()
+        self.stream = stream
+        self.tee_file = tee_file if tee_file is not None else (output_file if stream and F1_STREAM_TEE else None)
+        
+        # Registros recebidos pelo pipe no modo stream (limitado para aplicar contrapressão)
+        self._stream_queue = asyncio.Queue(maxsize=10000)
+        self._tee = None
+        self._stderr_tail = deque(maxlen=50)
+        self._stopping = False
+        
+        self.replay = replay_file is not None
+        if self.replay:
+            # A reprodução sempre começa do início e não grava checkpoints
+            self.stream = False
+            self.consumer = None
+            self.tee_file = None
+            self.tailer = ReplaySource(replay_file, speed=replay_speed)
+            return
+        
+        # Com um nome de consumidor, a leitura é retomada do último checkpoint gravado
+        start_position = self.checkpoints.resume_position(consumer, output_file) if consumer and not stream else 0
+        self.tailer = FileTailer(output_file, start_position=start_position)
+    
+    @property
+    def finished(self) -> bool:
+        """Indica se a reprodução de uma sessão gravada já entregou todas as linhas"""
+        return self.replay and self.tailer.exhausted
+    
+    @property
+    def last_position(self) -> int:
+        """Posição (bytes) após a última linha completa lida do arquivo de saída"""
+        return self.tailer.position
     
     async def start_extraction(self) -> None:
         """Inicia o processo de extração de dados da F1"""
-        cmd = [sys.executable, "-m", "fastf1_livetiming", "save", self.output_file] + F1_TOPICS + ["--timeout", str(F1_TIMEOUT)]
+        if self.replay:
+            speed = self.tailer.speed
+            logger.info(f"Reproduzindo sessão gravada: {self.output_file} "
+                        f"({'o mais rápido possível' if not speed else f'{speed:g}x'})")
+            await self.tailer.finished.wait()
+            return
         
-        logger.info(f"Iniciando extração de dados da F1 para: {self.output_file}")
+        target = STREAM_TARGET if self.stream else self.output_file
+        cmd = [sys.executable, "-m", "fastf1_livetiming", "save", target] + F1_TOPICS + ["--timeout", str(F1_TIMEOUT)]
+        
+        if self.stream:
+            logger.info("Iniciando extração de dados da F1 em modo stream (pipe)"
+                        + (f", com cópia em: {self.tee_file}" if self.tee_file else ""))
+        else:
+            logger.info(f"Iniciando extração de dados da F1 para: {self.output_file}")
         logger.debug(f"Comando: {' '.join(cmd)}")
         
+        drain_tasks = []
         try:
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1
+            self.process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=STREAM_LINE_LIMIT
             )
             
             logger.info(f"Processo de extração iniciado com PID: {self.process.pid}")
             
-            # Monitora a saída do processo para debug
-            while self.process.poll() is None:
-                output = self.process.stdout.readline()
-                if output:
-                    logger.debug(f"F1 Extractor: {output.strip()}")
-                await asyncio.sleep(0.1)
+            if self.tee_file:
+                self._tee = open(self.tee_file, 'a')
+            
+            # Drena stdout e stderr em paralelo: nenhum dos pipes pode encher e travar o processo
+            drain_tasks = [
+                asyncio.create_task(self._drain_stdout()),
+                asyncio.create_task(self._drain_stderr())
+            ]
+            await asyncio.gather(*drain_tasks)
+            returncode = await self.process.wait()
             
-            # Verifica se o processo terminou com erro
-            if self.process.returncode != 0:
-                error = self.process.stderr.read()
-                logger.error(f"Processo terminou com código de erro {self.process.returncode}: {error}")
+            # Verifica se o processo terminou com erro (o encerramento solicitado não é erro)
+            if returncode != 0 and not self._stopping:
+                error = "\n".join(self._stderr_tail)
+                logger.error(f"Processo terminou com código de erro {returncode}: {error}")
                 raise RuntimeError(f"Extração falhou: {error}")
             
-            logger.info("Processo de extração concluído com sucesso")
+            logger.info(f"Processo de extração concluído (código {returncode})")
             
+        except asyncio.CancelledError:
+            self._terminate()
+            raise
         except Exception as e:
             logger.error(f"Erro ao executar a extração: {e}")
-            if self.process and self.process.poll() is None:
-                self.process.terminate()
+            self._terminate()
             raise
+        finally:
+            for task in drain_tasks:
+                task.cancel()
+            if self._tee:
+                self._tee.close()
+                self._tee = None
+    
+    async def _drain_stdout(self) -> None:
+        """Consome o stdout do processo: registros (modo stream) ou mensagens de log"""
+        while True:
+            output = await self.process.stdout.readline()
+            if not output:
+                break
+            
+            line = output.decode('utf-8', 'replace')
+            if self.stream and line.startswith('['):
+                await self._on_record(line)
+            else:
+                logger.debug(f"F1 Extractor: {line.strip()}")
+    
+    async def _drain_stderr(self) -> None:
+        """Consome o stderr do processo, guardando as últimas linhas para o relatório de erro"""
+        while True:
+            output = await self.process.stderr.readline()
+            if not output:
+                break
+            
+            line = output.decode('utf-8', 'replace').rstrip()
+            self._stderr_tail.append(line)
+            logger.debug(f"F1 Extractor (stderr): {line}")
     
-    async def get_new_data(self) -> List[str]:
-        """Recupera dados novos do arquivo de saída desde a última leitura"""
-        if not os.path.exists(self.output_file):
-            logger.warning(f"Arquivo de dados {self.output_file} ainda não existe")
+    async def _on_record(self, line: str) -> None:
+        """Entrega um registro recebido pelo pipe ao pipeline e à cópia em arquivo"""
+        if self._tee:
+            self._tee.write(line)
+            self._tee.flush()
+        await self._stream_queue.put(line)
+    
+    async def _get_streamed_data(self, timeout: Optional[float]) -> List[str]:
+        """Aguarda o primeiro registro do pipe e retorna todos os que já chegaram"""
+        try:
+            first = await asyncio.wait_for(self._stream_queue.get(), 1.0 if timeout is None else timeout)
+        except asyncio.TimeoutError:
             return []
         
+        lines = [first]
+        while not self._stream_queue.empty():
+            lines.append(self._stream_queue.get_nowait())
+        return lines
+    
+    async def get_new_data(self, timeout: Optional[float] = None) -> List[str]:
+        """Recupera dados novos desde a última leitura.
+        
+        Aguarda até ``timeout`` segundos por um evento de escrita no arquivo ou,
+        no modo stream, pela chegada de registros pelo pipe.
+        """
         try:
-            with open(self.output_file, 'r') as f:
-                # Move para a última posição lida
-                f.seek(self.last_position)
-                
-                # Lê as novas linhas
-                new_lines = f.readlines()
-                
-                # Atualiza a posição
-                self.last_position = f.tell()
-            
-            return new_lines
+            if self.stream:
+                return await self._get_streamed_data(timeout)
+            return await self.tailer.read_batch(timeout)
         except Exception as e:
             logger.error(f"Erro ao ler dados do arquivo: {e}")
             return []
     
+    def position_snapshot(self) -> Tuple[int, Optional[int], int]:
+        """Posição de leitura atual (offset, checksum e tamanho da última linha), para commit posterior"""
+        return self.tailer.position, self.tailer.last_line_checksum, self.tailer.last_line_length
+    
+    def commit_position(self, snapshot: Optional[Tuple[int, Optional[int], int]] = None) -> None:
+        """Grava o checkpoint da posição lida; chamar após carregar o lote correspondente.
+        
+        Com ``snapshot`` (obtido por ``position_snapshot`` na leitura do lote), grava
+        aquela posição em vez da posição atual do leitor.
+        """
+        # No modo stream não há posição em arquivo a retomar
+        if not self.consumer or self.stream:
+            return
+        
+        try:
+            if snapshot is None:
+                self.tailer.save_checkpoint(self.checkpoints, self.consumer)
+            else:
+                self.checkpoints.save(self.consumer, self.output_file, *snapshot)
+        except OSError as e:
+            logger.error(f"Erro ao gravar checkpoint de '{self.consumer}': {e}")
+    
+    def _terminate(self) -> None:
+        """Envia SIGTERM ao processo, se ainda estiver em execução"""
+        if self.process and self.process.returncode is None:
+            try:
+                self.process.terminate()
+            except ProcessLookupError:
+                pass
+    
+    def _kill_if_running(self) -> None:
+        """Força o encerramento do processo que não respondeu ao SIGTERM"""
+        if self.process and self.process.returncode is None:
+            logger.warning("Processo não encerrou no tempo limite, forçando...")
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+    
     def stop_extraction(self) -> None:
-        """Para o processo de extração"""
-        if self.process and self.process.poll() is None:
+        """Para o processo de extração sem bloquear o event loop"""
+        if self.process and self.process.returncode is None:
             logger.info("Parando processo de extração...")
-            self.process.terminate()
+            self._stopping = True
+            self._terminate()
+            
+            # A conclusão é observada pela tarefa de start_extraction; força o encerramento após 5s
             try:
-                self.process.wait(timeout=5)
-                logger.info("Processo de extração encerrado")
-            except subprocess.TimeoutExpired:
-                logger.warning("Processo não encerrou no tempo limite, forçando...")
-                self.process.kill()
\ No newline at end of file
+                asyncio.get_running_loop().call_later(5, self._kill_if_running)
+            except RuntimeError:
+                pass
+        
+        self.tailer.close()
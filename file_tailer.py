@@ -0,0 +1,263 @@
+"""
+Leitura contínua ("tail -f") assíncrona do arquivo de dados da F1.
+
+O FileTailer acorda por eventos de escrita do inotify (Linux) em vez de
+consultar ``os.path.getsize`` em intervalos fixos. Quando o inotify não está
+disponível, usa polling adaptativo: o intervalo começa curto e dobra a cada
+verificação sem dados novos, voltando ao mínimo assim que chegam linhas.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import zlib
+from typing import List, Optional, Union
+
+from loguru import logger
+
+# Constantes do inotify (sys/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+class InotifyWatcher:
+    """Sinaliza um asyncio.Event quando um arquivo específico é criado ou alterado"""
+
+    def __init__(self, path: str, event: asyncio.Event):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(self.path).encode()
+        self.event = event
+        self.fd = None
+        self.loop = None
+
+    def start(self) -> None:
+        """Registra o watch no diretório do arquivo (funciona mesmo antes de sua criação)"""
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify não disponível nesta plataforma")
+
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "Falha em inotify_init1")
+
+        directory = os.path.dirname(self.path).encode()
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(fd, directory, mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, "Falha em inotify_add_watch")
+
+        self.fd = fd
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(fd, self._on_readable)
+
+    def _on_readable(self) -> None:
+        """Consome os eventos pendentes e sinaliza apenas os que tratam do arquivo observado"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+
+            if name == self.name or mask & IN_Q_OVERFLOW:
+                self.event.set()
+                return
+
+    def close(self) -> None:
+        """Remove o watch e fecha o descritor do inotify"""
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+class FileTailer:
+    """Lê de forma assíncrona as linhas completas adicionadas a um arquivo"""
+
+    def __init__(self, path: str, start_position: int = 0, use_inotify: bool = True,
+                 min_poll_interval: float = 0.01, max_poll_interval: float = 1.0,
+                 max_wait: float = 1.0, chunk_size: int = 1024 * 1024, decode: bool = True):
+        self.path = path
+        self.position = start_position  # Posição (bytes) após a última linha completa entregue
+        self.use_inotify = use_inotify
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_wait = max_wait
+        self.chunk_size = chunk_size
+        self.decode = decode
+        self.file_size = 0
+        self.last_line_checksum = None  # CRC32 da última linha completa entregue
+        self.last_line_length = 0
+
+        self._file = None
+        self._inode = None
+        self._buffer = b''
+        self._event = None
+        self._watcher = None
+        self._watcher_failed = False
+        self._poll_interval = min_poll_interval
+        self._stopped = False
+
+    @property
+    def event_driven(self) -> bool:
+        """Indica se o tailer está usando inotify"""
+        return self._watcher is not None
+
+    def _ensure_watcher(self) -> None:
+        """Cria o watcher do inotify na primeira espera; em caso de falha, usa polling"""
+        if self._event is None:
+            self._event = asyncio.Event()
+
+        if self._watcher or self._watcher_failed or not self.use_inotify:
+            return
+
+        try:
+            watcher = InotifyWatcher(self.path, self._event)
+            watcher.start()
+            self._watcher = watcher
+            logger.debug(f"Observando {self.path} via inotify")
+        except (OSError, AttributeError, NotImplementedError) as e:
+            self._watcher_failed = True
+            logger.info(f"inotify indisponível ({e}); usando polling adaptativo para {self.path}")
+
+    def _open(self) -> bool:
+        """Abre o arquivo, se existir, posicionando na última posição lida"""
+        try:
+            self._file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+
+        stat = os.fstat(self._file.fileno())
+        self._inode = stat.st_ino
+        if stat.st_size < self.position:
+            logger.warning(f"Arquivo {self.path} menor que a posição salva; lendo desde o início")
+            self.position = 0
+
+        self._file.seek(self.position)
+        self._buffer = b''
+        return True
+
+    def _check_rotation(self) -> None:
+        """Reabre o arquivo se ele foi truncado ou substituído"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+
+        if stat.st_ino != self._inode:
+            logger.warning(f"Arquivo {self.path} foi substituído; reabrindo desde o início")
+            self._file.close()
+            self._file = None
+            self.position = 0
+            self.last_line_checksum = None
+            self.last_line_length = 0
+        elif stat.st_size < self.position + len(self._buffer):
+            logger.warning(f"Arquivo {self.path} foi truncado; lendo desde o início")
+            self.position = 0
+            self._buffer = b''
+            self.last_line_checksum = None
+            self.last_line_length = 0
+            self._file.seek(0)
+
+    def _read_available(self) -> List[Union[str, bytes]]:
+        """Lê os dados disponíveis e retorna apenas as linhas completas"""
+        if self._file is None and not self._open():
+            return []
+
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self._check_rotation()
+            return []
+
+        data = self._buffer + chunk
+        end = data.rfind(b'\n') + 1
+        self._buffer = data[end:]
+        if end == 0:
+            return []
+
+        complete = data[:end]
+        self.position += end
+        self.file_size = os.fstat(self._file.fileno()).st_size
+
+        lines = complete.splitlines(keepends=True)
+        self.last_line_length = len(lines[-1])
+        self.last_line_checksum = zlib.crc32(lines[-1])
+        if self.decode:
+            return [line.decode('utf-8', 'replace') for line in lines]
+        return lines
+
+    async def _wait_for_data(self, timeout: float) -> None:
+        """Aguarda um evento de escrita (inotify) ou o próximo ciclo de polling"""
+        self._ensure_watcher()
+
+        if self._watcher:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._event.clear()
+        else:
+            await asyncio.sleep(min(self._poll_interval, timeout))
+            self._poll_interval = min(self._poll_interval * 2, self.max_poll_interval)
+
+    async def read_batch(self, timeout: Optional[float] = None) -> List[Union[str, bytes]]:
+        """Retorna as novas linhas completas, aguardando até ``timeout`` segundos por elas.
+
+        Retorna uma lista vazia se nada chegar no período ou se o tailer for parado.
+        """
+        timeout = self.max_wait if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while not self._stopped:
+            lines = self._read_available()
+            if lines:
+                self._poll_interval = self.min_poll_interval
+                return lines
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await self._wait_for_data(remaining)
+
+        return []
+
+    def save_checkpoint(self, store, consumer: str) -> None:
+        """Persiste a posição atual no CheckpointStore informado"""
+        store.save(consumer, self.path, self.position, self.last_line_checksum, self.last_line_length)
+
+    def stop(self) -> None:
+        """Interrompe as esperas pendentes e encerra a iteração"""
+        self._stopped = True
+        if self._event is not None:
+            self._event.set()
+
+    def close(self) -> None:
+        """Fecha o arquivo e o watcher do inotify"""
+        self.stop()
+        if self._watcher:
+            self._watcher.close()
+            self._watcher = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __aiter__(self):
+        return self._iterate_lines()
+
+    async def _iterate_lines(self):
+        """Iterador assíncrono das linhas completas, até que stop() seja chamado"""
+        while not self._stopped:
+            for line in await self.read_batch():
+                yield line
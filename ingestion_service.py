@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Serviço único de ingestão: lê e analisa cada linha do arquivo de dados F1 uma
+única vez e distribui os registros por tópico para os processadores registrados.
+
+Substitui a execução dos quatro monitores em processos separados, que liam e
+analisavam o mesmo arquivo quatro vezes.
+"""
+
+import asyncio
+import os
+import signal
+import time
+import traceback
+import argparse
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
+from dotenv import load_dotenv
+
+from loguru import logger
+
+from buffered_writer import checkpoint_callback, when_all_flushed
+from checkpoint import CheckpointStore
+from decoder import PayloadDecoder
+from file_tailer import FileTailer
+from line_parser import parse_data_line
+from monitor_weather import WeatherDataProcessor
+from monitor_car_telemetry import TelemetryProcessor
+from monitor_car_positions import PositionProcessor
+from monitor_race_control import RaceControlProcessor
+
+# Processadores disponíveis: nome -> (tópico, classe do processador, método de processamento)
+PROCESSORS = {
+    'weather': ('WeatherData', WeatherDataProcessor, 'process_weather_data'),
+    'telemetry': ('CarData.z', TelemetryProcessor, 'process_telemetry_data'),
+    'positions': ('Position.z', PositionProcessor, 'process_position_data'),
+    'control': ('RaceControlMessages', RaceControlProcessor, 'process_race_control'),
+}
+
+# Flag para controlar o encerramento
+shutdown_requested = False
+
+def handle_shutdown(signum, frame):
+    """Manipula solicitações de encerramento gracioso"""
+    global shutdown_requested
+    logger.info(f"Sinal de encerramento recebido ({signum})")
+    shutdown_requested = True
+
+class TopicRoute:
+    """Encaminha os registros de um tópico para um processador, com fila própria"""
+
+    def __init__(self, name: str, topic: str, handler: Callable[..., Awaitable[Any]],
+                 queue_size: int = 1000, max_batch: int = 100):
+        self.name = name
+        self.topic = topic
+        self.handler = handler
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.task = None
+        self.received_count = 0
+        self.processed_count = 0
+
+    def start(self) -> None:
+        """Inicia a tarefa que consome a fila do processador"""
+        self.task = asyncio.create_task(self._run())
+
+    async def put(self, record: Tuple[str, Any, str]) -> None:
+        """Enfileira um registro; aguarda se a fila estiver cheia"""
+        self.received_count += 1
+        await self.queue.put(record)
+
+    async def _run(self) -> None:
+        """Consome a fila em lotes, entregando cada registro ao processador"""
+        while True:
+            batch = [await self.queue.get()]
+
+            # Agrupa os registros que já estão disponíveis na fila
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            for topic, data, timestamp in batch:
+                try:
+                    result = await self.handler(topic, data, timestamp)
+                    self.processed_count += int(result or 0)
+                except Exception as e:
+                    logger.error(f"Erro no processador '{self.name}': {e}")
+                    logger.debug(traceback.format_exc())
+
+            for _ in batch:
+                self.queue.task_done()
+
+    async def stop(self) -> None:
+        """Aguarda o esvaziamento da fila e encerra a tarefa"""
+        if self.task:
+            await self.queue.join()
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+class IngestionService:
+    """Lê o arquivo de dados uma única vez e distribui os registros por tópico"""
+
+    def __init__(self, input_file: str, consumer: Optional[str] = None,
+                 checkpoints: Optional[CheckpointStore] = None,
+                 decoder: Optional[PayloadDecoder] = None):
+        self.input_file = input_file
+        self.consumer = consumer
+        self.checkpoints = checkpoints or CheckpointStore()
+        # Os payloads comprimidos do lote são decodificados de uma vez antes da distribuição
+        self.decoder = decoder or PayloadDecoder()
+
+        # Sem nome de consumidor não há checkpoint: a leitura começa do início
+        start_position = self.checkpoints.resume_position(consumer, input_file) if consumer else 0
+        self.tailer = FileTailer(input_file, start_position=start_position)
+        self.routes: Dict[str, List[TopicRoute]] = {}
+        self.processors = []
+        self.total_lines = 0
+        self.parsed_lines = 0
+
+    def register(self, name: str, topic: str, handler: Callable[..., Awaitable[Any]], **route_options) -> TopicRoute:
+        """Registra um processador para receber os registros de um tópico"""
+        route = TopicRoute(name, topic, handler, **route_options)
+        self.routes.setdefault(topic, []).append(route)
+        return route
+
+    def add_processor(self, name: str, session_id: int, conn_string: str) -> None:
+        """Cria e registra um dos processadores de monitor conhecidos"""
+        if name not in PROCESSORS:
+            raise ValueError(f"Processador '{name}' não reconhecido")
+
+        topic, processor_class, method_name = PROCESSORS[name]
+        processor = processor_class(session_id=session_id, conn_string=conn_string)
+        self.processors.append(processor)
+        self.register(name, topic, getattr(processor, method_name))
+
+    def _all_routes(self) -> List[TopicRoute]:
+        return [route for routes in self.routes.values() for route in routes]
+
+    async def start(self) -> None:
+        """Conecta cada processador (todos compartilham o pool de conexões) e inicia as filas"""
+        self.decoder.start()
+        for processor in self.processors:
+            await processor.connect()
+
+        for route in self._all_routes():
+            route.start()
+
+    async def dispatch_lines(self, lines: List[str]) -> None:
+        """Analisa cada linha uma única vez e a entrega às rotas do seu tópico"""
+        records = []
+        for line in lines:
+            try:
+                # Linhas de tópicos sem processador são descartadas pelo prefixo
+                record = parse_data_line(line, self.routes.keys())
+            except ValueError:
+                # Ignora erros de linhas malformadas
+                continue
+
+            if record is not None:
+                records.append(record)
+
+        self.parsed_lines += len(records)
+        for topic, data, timestamp in await self.decoder.decode_records(records):
+            for route in self.routes.get(topic, ()):
+                await route.put((topic, data, timestamp))
+
+    async def commit(self) -> None:
+        """Aguarda os processadores consumirem o lote e grava o checkpoint.
+        
+        Para processadores com escrita em micro-lotes, o checkpoint só é gravado
+        depois que as linhas do lote chegarem ao banco.
+        """
+        await asyncio.gather(*(route.queue.join() for route in self._all_routes()))
+        if self.consumer:
+            writers = [processor.writer for processor in self.processors if hasattr(processor, 'writer')]
+            when_all_flushed(writers, checkpoint_callback(self.checkpoints, self.consumer, self.tailer))
+
+    async def read_new_lines(self) -> List[str]:
+        """Aguarda e retorna as linhas adicionadas ao arquivo desde a última leitura"""
+        lines = await self.tailer.read_batch()
+        self.total_lines += len(lines)
+        return lines
+
+    def report(self, elapsed: float) -> None:
+        """Registra no log as estatísticas de ingestão e de cada processador"""
+        logger.info(f"Tempo em execução: {elapsed:.1f}s")
+        logger.info(f"Linhas lidas: {self.total_lines} (analisadas: {self.parsed_lines})")
+        for route in self._all_routes():
+            logger.info(f"  {route.name} ({route.topic}): recebidos={route.received_count}, "
+                        f"processados={route.processed_count}, fila={route.queue.qsize()}")
+        for processor in self.processors:
+            # Profundidade do spool local e taxa de reenvio de cada processador
+            if processor.drainer:
+                processor.drainer.report()
+        self.decoder.report()
+
+    async def stop(self) -> None:
+        """Esvazia as filas e fecha o arquivo e as conexões dos processadores"""
+        self.tailer.close()
+        for route in self._all_routes():
+            await route.stop()
+
+        for processor in self.processors:
+            try:
+                await processor.close()
+            except Exception as e:
+                logger.error(f"Erro ao fechar processador: {e}")
+
+        self.decoder.close()
+
+async def run_ingestion(input_file: str, session_id: int, monitors: List[str]):
+    """Executa o serviço de ingestão para os monitores selecionados"""
+    # Carrega variáveis de ambiente
+    load_dotenv()
+
+    # Configurações do banco de dados
+    db_host = os.getenv("DB_HOST")
+    db_port = os.getenv("DB_PORT")
+    db_name = os.getenv("DB_NAME")
+    db_user = os.getenv("DB_USER")
+    db_password = os.getenv("DB_PASSWORD")
+
+    conn_string = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+    # Registra manipuladores de sinais para encerramento gracioso
+    signal.signal(signal.SIGINT, handle_shutdown)
+    signal.signal(signal.SIGTERM, handle_shutdown)
+
+    logger.info(f"Iniciando serviço de ingestão para a sessão ID={session_id}")
+    logger.info(f"Arquivo de entrada: {input_file}")
+    logger.info(f"Processadores: {', '.join(monitors)}")
+
+    # O checkpoint é por sessão: um reinício continua de onde o lote anterior terminou
+    service = IngestionService(input_file, consumer=f"ingestion-{session_id}")
+    for name in monitors:
+        service.add_processor(name, session_id, conn_string)
+
+    try:
+        await service.start()
+
+        if not os.path.exists(input_file):
+            logger.warning(f"Arquivo {input_file} não encontrado. Aguardando sua criação...")
+
+        start_time = time.time()
+        last_report_time = start_time
+
+        # Loop principal: uma única leitura do arquivo para todos os processadores
+        while not shutdown_requested:
+            try:
+                # Aguarda novas linhas (acorda por evento de escrita ou após o timeout)
+                lines = await service.read_new_lines()
+                if lines:
+                    await service.dispatch_lines(lines)
+                    await service.commit()
+
+                # Relatório periódico
+                current_time = time.time()
+                if current_time - last_report_time >= 60:  # a cada minuto
+                    logger.info("=== Relatório de Progresso ===")
+                    service.report(current_time - start_time)
+                    last_report_time = current_time
+
+            except asyncio.CancelledError:
+                logger.info("Ingestão cancelada")
+                break
+            except Exception as e:
+                logger.error(f"Erro no loop de ingestão: {e}")
+                logger.debug(traceback.format_exc())
+                await asyncio.sleep(1)  # Espera um pouco mais em caso de erro
+
+        logger.info("=== Relatório Final ===")
+        service.report(time.time() - start_time)
+
+    except Exception as e:
+        logger.error(f"Erro fatal: {e}")
+        logger.debug(traceback.format_exc())
+
+    finally:
+        await service.stop()
+        logger.info("Ingestão encerrada")
+
+if __name__ == "__main__":
+    # Configurar o logger
+    logger.remove()
+    logger.add("f1_ingestion.log", rotation="10 MB", level="DEBUG")
+    logger.add(lambda msg: print(msg), level="INFO")
+
+    parser = argparse.ArgumentParser(description='Serviço único de ingestão dos dados da F1')
+    parser.add_argument('--session-id', type=int, required=True, help='ID da sessão')
+    parser.add_argument('--input-file', type=str, default='f1_data.txt', help='Arquivo de entrada')
+    parser.add_argument('--monitors', type=str, default=','.join(PROCESSORS),
+                        help=f'Processadores a executar, separados por vírgula (padrão: {",".join(PROCESSORS)})')
+
+    args = parser.parse_args()
+    monitors = [name.strip() for name in args.monitors.split(',') if name.strip()]
+
+    unknown = [name for name in monitors if name not in PROCESSORS]
+    if unknown:
+        parser.error(f"Processadores não reconhecidos: {', '.join(unknown)}")
+
+    try:
+        asyncio.run(run_ingestion(args.input_file, args.session_id, monitors))
+    except KeyboardInterrupt:
+        print("\nPrograma encerrado pelo usuário")
@@ -0,0 +1,75 @@
+"""
+Codec JSON único do pipeline.
+
+Usa o backend mais rápido instalado (orjson, depois msgspec) e cai para o
+módulo ``json`` da biblioteca padrão quando nenhum está disponível. O backend
+pode ser fixado pela variável de ambiente JSON_BACKEND (orjson, msgspec ou json).
+
+Todos os backends aceitam ``str`` ou ``bytes`` em ``loads`` e geram ValueError
+para documentos inválidos.
+"""
+
+import json
+import os
+from typing import Any, Union
+
+from loguru import logger
+
+_REQUESTED_BACKEND = os.getenv("JSON_BACKEND", "").lower()
+
+def _load_orjson():
+    import orjson
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+
+    return loads, dumps
+
+def _load_msgspec():
+    import msgspec
+
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+
+    def loads(data: Union[str, bytes]) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            # Mantém o contrato de erro do json da biblioteca padrão
+            raise ValueError(str(e)) from e
+
+    def dumps(obj: Any) -> str:
+        return encoder.encode(obj).decode('utf-8')
+
+    return loads, dumps
+
+def _load_stdlib():
+    return json.loads, json.dumps
+
+_BACKENDS = {
+    'orjson': _load_orjson,
+    'msgspec': _load_msgspec,
+    'json': _load_stdlib,
+}
+
+def _select_backend():
+    """Escolhe o backend solicitado ou o mais rápido disponível"""
+    if _REQUESTED_BACKEND:
+        if _REQUESTED_BACKEND not in _BACKENDS:
+            logger.warning(f"JSON_BACKEND '{_REQUESTED_BACKEND}' não reconhecido; escolhendo automaticamente")
+        else:
+            try:
+                return (_REQUESTED_BACKEND,) + _BACKENDS[_REQUESTED_BACKEND]()
+            except ImportError:
+                logger.warning(f"JSON_BACKEND '{_REQUESTED_BACKEND}' não instalado; escolhendo automaticamente")
+
+    for name in ('orjson', 'msgspec', 'json'):
+        try:
+            return (name,) + _BACKENDS[name]()
+        except ImportError:
+            continue
+
+BACKEND, loads, dumps = _select_backend()
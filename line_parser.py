@@ -0,0 +1,126 @@
+"""
+Parser especializado para o formato salvo pelo fastf1_livetiming.
+
+Cada linha do arquivo é a representação Python de uma lista
+``[tópico, dados, timestamp]``. Em vez de montar uma AST com ``ast.literal_eval``
+para a linha inteira (caro para payloads base64 de 1–2 KB), os três campos são
+recortados diretamente da string. O ``ast.literal_eval`` continua sendo usado
+apenas como fallback para linhas fora do padrão.
+"""
+
+import ast
+from typing import Any, Optional, Set, Tuple, Union
+
+import json_codec
+
+# Prefixo de toda linha no formato salvo: "['<tópico>', "
+_LINE_PREFIX = "['"
+_LINE_PREFIX_BYTES = b"['"
+
+def peek_topic(line: Union[str, bytes]) -> Optional[Union[str, bytes]]:
+    """Retorna o tópico da linha olhando apenas para os primeiros bytes"""
+    if isinstance(line, bytes):
+        if not line.startswith(_LINE_PREFIX_BYTES):
+            return None
+        end = line.find(b"'", 2)
+    else:
+        if not line.startswith(_LINE_PREFIX):
+            return None
+        end = line.find("'", 2)
+
+    if end < 0:
+        return None
+    return line[2:end]
+
+def peek_timestamp(line: Union[str, bytes]) -> Optional[str]:
+    """Retorna o timestamp (último campo) da linha sem analisar o restante"""
+    if isinstance(line, bytes):
+        line = line.rstrip(b'\r\n')
+        if not line.endswith(b"']"):
+            return None
+        start = line.rfind(b", '")
+        timestamp = line[start + 3:-2].decode('ascii', 'replace') if start >= 0 else None
+    else:
+        line = line.rstrip('\r\n')
+        if not line.endswith("']"):
+            return None
+        start = line.rfind(", '")
+        timestamp = line[start + 3:-2] if start >= 0 else None
+
+    if timestamp is None or "'" in timestamp:
+        return None
+    return timestamp
+
+def _python_literal_to_json(source: str) -> str:
+    """Converte um literal Python (dict/list) sem aspas duplas nem escapes em JSON"""
+    # Segmentos pares estão fora das strings; só neles True/False/None são palavras-chave
+    parts = source.split("'")
+    for i in range(0, len(parts), 2):
+        parts[i] = parts[i].replace('True', 'true').replace('False', 'false').replace('None', 'null')
+    return '"'.join(parts)
+
+def _parse_payload(source: str) -> Any:
+    """Converte o campo de dados da linha para o objeto Python correspondente"""
+    # Payload comprimido (.z): string base64, que nunca contém aspas ou escapes
+    if len(source) >= 2 and source[0] == "'" and source[-1] == "'":
+        inner = source[1:-1]
+        if "'" not in inner and '\\' not in inner:
+            return inner
+
+    # Dicionários e listas sem aspas duplas ou escapes podem ser lidos como JSON
+    elif source[:1] in ('{', '[') and '"' not in source and '\\' not in source:
+        try:
+            return json_codec.loads(_python_literal_to_json(source))
+        except ValueError:
+            pass
+
+    return ast.literal_eval(source)
+
+def _parse_with_ast(line: str) -> Tuple[str, Any, str]:
+    """Caminho lento: avalia a linha inteira com ast.literal_eval"""
+    parsed_data = ast.literal_eval(line)
+
+    # Formato esperado: [tópico, dados, timestamp]
+    if isinstance(parsed_data, list) and len(parsed_data) >= 3:
+        return parsed_data[0], parsed_data[1], parsed_data[2]
+
+    raise ValueError("Formato de dados inesperado")
+
+def parse_data_line(line: Union[str, bytes], topics: Optional[Set[str]] = None) -> Optional[Tuple[str, Any, str]]:
+    """Analisa uma linha no formato [tópico, dados, timestamp].
+
+    Se ``topics`` for informado, linhas de outros tópicos são descartadas
+    (retorna None) antes de qualquer outro processamento. Linhas malformadas
+    geram ValueError.
+    """
+    topic = peek_topic(line)
+
+    if isinstance(line, bytes):
+        if topic is not None and topics is not None and topic.decode('utf-8', 'replace') not in topics:
+            return None
+        line = line.decode('utf-8')
+        topic = topic.decode('utf-8') if topic is not None else None
+    elif topic is not None and topics is not None and topic not in topics:
+        return None
+
+    try:
+        line = line.strip()
+        body_start = len(topic) + 5 if topic is not None else -1
+
+        if topic is None or line[body_start - 3:body_start] != "', " or not line.endswith("']"):
+            record = _parse_with_ast(line)
+        else:
+            ts_start = line.rfind(", '", body_start)
+            timestamp = line[ts_start + 3:-2]
+
+            if ts_start < 0 or "'" in timestamp or '\\' in timestamp:
+                record = _parse_with_ast(line)
+            else:
+                record = (topic, _parse_payload(line[body_start:ts_start]), timestamp)
+
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError) as e:
+        raise ValueError(f"Erro ao analisar linha: {e}")
+
+    if topics is not None and record[0] not in topics:
+        return None
+    return record
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Gerador sintético de sessões da F1 em escala de corrida.
+
+Produz um arquivo no mesmo formato gravado pelo fastf1_livetiming
+(``[tópico, dados, timestamp]`` por linha), com mensagens ``CarData.z`` e
+``Position.z`` comprimidas de verdade (JSON + deflate cru + base64) e as
+mensagens ``TimingData``, ``WeatherData`` e ``RaceControlMessages``
+correspondentes, para N carros, taxas de amostragem e duração configuráveis.
+Os parsers, o decoder e o transformer do pipeline aceitam o arquivo sem
+nenhuma adaptação.
+
+Os carros percorrem uma pista fechada com ritmos ligeiramente diferentes, o que
+gera voltas completadas, ultrapassagens (mudanças de posição) e telemetria
+coerente com a velocidade. Com ``--burst``, as mensagens de telemetria e
+posição são emitidas N vezes mais rápido durante uma janela da sessão, como em
+uma retomada após queda da conexão.
+
+Exemplos:
+
+    # Corrida de 2 horas com 20 carros
+    python load_generator.py --output f1_race_2h.txt --cars 20 --duration 7200
+
+    # 10 minutos com um pico de 10x durante 1 minuto a partir de 5 minutos
+    python load_generator.py --output f1_burst.txt --duration 600 --burst 10 --burst-at 300 --burst-length 60
+"""
+
+import argparse
+import base64
+import json
+import math
+import random
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from loguru import logger
+
+from timestamps import from_epoch_us, to_epoch_us
+
+# Números dos pilotos do grid; carros adicionais recebem números a partir de 100
+DRIVER_NUMBERS = [1, 4, 5, 6, 10, 12, 14, 16, 18, 22, 23, 27, 30, 31, 43, 44, 55, 63, 81, 87]
+
+# Número de curvas da pista simulada (trechos de frenagem por volta)
+TRACK_CORNERS = 6
+
+# Valores do canal DRS observados nos dados reais: 8 = fechado, 12 = aberto
+DRS_CLOSED, DRS_OPEN = 8, 12
+
+DEFAULT_START = '2025-05-17T14:00:00Z'
+
+def format_timestamp(epoch_us: int, digits: int = 7) -> str:
+    """Formata um instante no padrão da F1: fração com 7 dígitos (telemetria) ou 3 (demais tópicos)"""
+    text = from_epoch_us(epoch_us).strftime('%Y-%m-%dT%H:%M:%S.%f') + '0'
+    return text[:20 + digits] + 'Z'
+
+def format_lap_time(seconds: float) -> str:
+    """Formata um tempo de volta como M:SS.mmm"""
+    minutes, rest = divmod(seconds, 60)
+    return f"{int(minutes)}:{rest:06.3f}"
+
+def compress_payload(document) -> str:
+    """Comprime um documento como o feed da F1: JSON compacto, deflate cru e base64"""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    raw = json.dumps(document, separators=(',', ':')).encode('utf-8')
+    return base64.b64encode(compressor.compress(raw) + compressor.flush()).decode('ascii')
+
+def format_line(topic: str, data, timestamp: str) -> str:
+    """Monta a linha no formato gravado pelo fastf1_livetiming (repr de uma lista Python)"""
+    return repr([topic, data, timestamp]) + '\n'
+
+class SimulatedCar:
+    """Carro que percorre a pista simulada com um ritmo próprio"""
+
+    def __init__(self, number: int, lap_time: float, offset: float):
+        self.number = number
+        self.lap_time = lap_time
+        self.offset = offset  # Fração de volta de vantagem na largada
+        self.laps = 0
+
+    def progress(self, t: float) -> float:
+        """Voltas percorridas (com fração) no instante t (segundos desde o início)"""
+        return self.offset + t / self.lap_time
+
+    def channels(self, t: float, rng: random.Random) -> Dict[str, int]:
+        """Canais de telemetria (CarData.z) no instante t"""
+        angle = 2 * math.pi * (self.progress(t) % 1.0)
+        straight = math.cos(TRACK_CORNERS * angle)  # 1 no meio da reta, -1 no ápice da curva
+
+        speed = int(205 + 110 * straight + rng.uniform(-3, 3))
+        gear = max(1, min(8, speed // 40 + 1))
+        rpm = int(10500 + (speed % 40) * 60 + rng.uniform(-150, 150))
+        braking = straight < -0.55
+        return {
+            '0': rpm,
+            '2': speed,
+            '3': gear,
+            '4': 0 if braking else (100 if straight > -0.2 else int(60 + 100 * (straight + 0.55))),
+            '5': 100 if braking else 0,
+            '45': DRS_OPEN if straight > 0.9 else DRS_CLOSED,
+        }
+
+    def coordinates(self, t: float) -> Dict[str, int]:
+        """Coordenadas (Position.z) no instante t"""
+        angle = 2 * math.pi * (self.progress(t) % 1.0)
+        return {
+            'X': int(6000 * math.cos(angle)),
+            'Y': int(3000 * math.sin(2 * angle) + 1500 * math.sin(angle)),
+            'Z': int(80 * math.sin(angle)),
+        }
+
+class SessionGenerator:
+    """Gera as linhas de uma sessão sintética em ordem de timestamp"""
+
+    def __init__(self, cars: int = 20, duration: float = 600.0, car_rate: float = 4.0,
+                 position_rate: float = 4.0, message_interval: float = 1.0,
+                 weather_interval: float = 60.0, race_control_interval: float = 120.0,
+                 burst: float = 1.0, burst_at: float = 0.0, burst_length: float = 0.0,
+                 start: str = DEFAULT_START, seed: int = 0):
+        self.duration = duration
+        self.car_rate = car_rate
+        self.position_rate = position_rate
+        self.message_interval = message_interval
+        self.weather_interval = weather_interval
+        self.race_control_interval = race_control_interval
+        self.burst = max(burst, 1.0)
+        self.burst_at = burst_at
+        self.burst_length = burst_length
+        self.start_us = to_epoch_us(start)
+        self.rng = random.Random(seed)
+
+        numbers = DRIVER_NUMBERS[:cars] + list(range(100, 100 + max(0, cars - len(DRIVER_NUMBERS))))
+        self.cars = [
+            SimulatedCar(number, lap_time=self.rng.uniform(88.0, 92.0), offset=-index * 0.004)
+            for index, number in enumerate(numbers)
+        ]
+        self.order = [car.number for car in self.cars]
+        self.race_control_count = 0
+        self.counts = Counter()
+
+    def _in_burst(self, t: float) -> bool:
+        return self.burst > 1 and self.burst_at <= t < self.burst_at + self.burst_length
+
+    def _timestamp(self, t: float, digits: int = 7) -> str:
+        return format_timestamp(self.start_us + int(t * 1_000_000), digits)
+
+    def _car_data(self, t0: float, t1: float) -> str:
+        samples = max(1, round(self.car_rate * self.message_interval))
+        entries = []
+        for i in range(samples):
+            t = t0 + (t1 - t0) * (i + 1) / samples
+            entries.append({
+                'Utc': self._timestamp(t),
+                'Cars': {str(car.number): {'Channels': car.channels(t, self.rng)} for car in self.cars},
+            })
+        return compress_payload({'Entries': entries})
+
+    def _positions(self, t0: float, t1: float) -> str:
+        samples = max(1, round(self.position_rate * self.message_interval))
+        position = []
+        for i in range(samples):
+            t = t0 + (t1 - t0) * (i + 1) / samples
+            position.append({
+                'Timestamp': self._timestamp(t),
+                'Entries': {str(car.number): dict(Status='OnTrack', **car.coordinates(t)) for car in self.cars},
+            })
+        return compress_payload({'Position': position})
+
+    def _timing(self, t: float) -> List[Tuple[float, str, dict]]:
+        """Voltas completadas e mudanças de posição até o instante t"""
+        events = []
+        for car in self.cars:
+            laps = int(car.progress(t))
+            if laps > car.laps and laps > 0:
+                car.laps = laps
+                lap_time = car.lap_time + self.rng.uniform(-0.4, 0.4)
+                sectors = [lap_time * share for share in (0.31, 0.36)]
+                sectors.append(lap_time - sum(sectors))
+                line = {
+                    'NumberOfLaps': laps,
+                    'LastLapTime': {'Value': format_lap_time(lap_time)},
+                    'BestSpeed': {'Value': str(300 + self.rng.randint(0, 25))},
+                }
+                for index, sector in enumerate(sectors, start=1):
+                    line[f'Sector{index}Time'] = {'Value': f"{sector:.3f}"}
+                events.append((t, 'TimingData', {'Lines': {str(car.number): line}}))
+
+        order = [car.number for car in sorted(self.cars, key=lambda car: -car.progress(t))]
+        if order != self.order:
+            changed = {
+                str(number): {'Line': index, 'Position': str(index)}
+                for index, number in enumerate(order, start=1)
+                if index > len(self.order) or self.order[index - 1] != number
+            }
+            self.order = order
+            events.append((t, 'TimingData', {'Lines': changed}))
+        return events
+
+    def _weather(self, t: float) -> dict:
+        drift = t / max(self.duration, 1.0)
+        return {
+            'AirTemp': f"{22.0 + 2 * drift + self.rng.uniform(-0.2, 0.2):.1f}",
+            'Humidity': f"{31.0 + self.rng.uniform(-1, 1):.1f}",
+            'Pressure': f"{1008.6 + self.rng.uniform(-0.3, 0.3):.1f}",
+            'Rainfall': '0',
+            'TrackTemp': f"{39.4 + 4 * drift + self.rng.uniform(-0.3, 0.3):.1f}",
+            'WindDirection': str(self.rng.randint(280, 320)),
+            'WindSpeed': f"{self.rng.uniform(0.5, 2.5):.1f}",
+        }
+
+    def _race_control(self, t: float) -> dict:
+        if self.race_control_count == 0:
+            message = {'Utc': self._timestamp(t)[:19], 'Category': 'Flag', 'Flag': 'GREEN',
+                       'Scope': 'Track', 'Message': 'GREEN LIGHT - PIT EXIT OPEN'}
+        else:
+            car = self.rng.choice(self.cars)
+            message = self.rng.choice([
+                {'Category': 'Flag', 'Flag': 'BLUE', 'Scope': 'Driver', 'RacingNumber': str(car.number),
+                 'Message': f"WAVED BLUE FLAG FOR CAR {car.number}"},
+                {'Category': 'Flag', 'Flag': 'YELLOW', 'Scope': 'Sector', 'Sector': self.rng.randint(1, 20),
+                 'Message': 'YELLOW IN TRACK SECTOR'},
+                {'Category': 'Other', 'Message': f"CAR {car.number} TIME DELETED - TRACK LIMITS AT TURN "
+                                                 f"{self.rng.randint(1, 15)} LAP {max(car.laps, 1)}"},
+            ])
+            message = dict(Utc=self._timestamp(t)[:19], **message)
+
+        self.race_control_count += 1
+        # O primeiro registro traz a lista; as atualizações seguintes chegam indexadas
+        if self.race_control_count == 1:
+            return {'Messages': [message], '_kf': True}
+        return {'Messages': {str(self.race_control_count - 1): message}}
+
+    def lines(self):
+        """Gera as linhas da sessão, em ordem de timestamp"""
+        t = 0.0
+        next_weather = 0.0
+        next_race_control = 0.0
+
+        while t < self.duration:
+            step = self.message_interval / (self.burst if self._in_burst(t) else 1.0)
+            t_next = min(t + step, self.duration)
+
+            # Assim como no feed real, a mensagem é emitida logo após a última amostra que contém
+            events = [
+                (t_next + 0.28, 'CarData.z', self._car_data(t, t_next)),
+                (t_next + 0.39, 'Position.z', self._positions(t, t_next)),
+            ]
+            events.extend(self._timing(t_next))
+            if t_next >= next_weather:
+                events.append((t_next, 'WeatherData', self._weather(t_next)))
+                next_weather += self.weather_interval
+            if t_next >= next_race_control:
+                events.append((t_next, 'RaceControlMessages', self._race_control(t_next)))
+                next_race_control += self.race_control_interval
+
+            events.sort(key=lambda event: event[0])
+            for event_time, topic, data in events:
+                self.counts[topic] += 1
+                yield format_line(topic, data, self._timestamp(event_time, 7 if topic.endswith('.z') else 3))
+
+            t = t_next
+
+def generate(output_file: str, generator: SessionGenerator) -> None:
+    """Grava a sessão sintética em ``output_file``"""
+    start = time.time()
+    written = 0
+    with open(output_file, 'w') as out:
+        for line in generator.lines():
+            out.write(line)
+            written += len(line)
+
+    elapsed = time.time() - start
+    total = sum(generator.counts.values())
+    logger.info(f"{total} linhas ({written / 1024 / 1024:.1f} MB) geradas em {output_file} em {elapsed:.1f}s")
+    for topic, count in generator.counts.most_common():
+        logger.info(f"  {topic:<22} {count:>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Gera uma sessão sintética da F1 no formato do fastf1_livetiming')
+    parser.add_argument('--output', required=True, help='Arquivo de saída')
+    parser.add_argument('--cars', type=int, default=20, help='Número de carros')
+    parser.add_argument('--duration', type=float, default=600.0, help='Duração da sessão em segundos')
+    parser.add_argument('--car-rate', type=float, default=4.0, help='Amostras de telemetria por segundo e por carro')
+    parser.add_argument('--position-rate', type=float, default=4.0, help='Amostras de posição por segundo e por carro')
+    parser.add_argument('--message-interval', type=float, default=1.0,
+                        help='Intervalo (s) entre mensagens CarData.z/Position.z')
+    parser.add_argument('--weather-interval', type=float, default=60.0, help='Intervalo (s) entre mensagens WeatherData')
+    parser.add_argument('--race-control-interval', type=float, default=120.0,
+                        help='Intervalo (s) entre mensagens do controle de corrida')
+    parser.add_argument('--burst', type=float, default=1.0,
+                        help='Multiplicador da taxa de mensagens durante o pico (ex.: 10)')
+    parser.add_argument('--burst-at', type=float, default=0.0, help='Início do pico (s desde o início da sessão)')
+    parser.add_argument('--burst-length', type=float, default=60.0, help='Duração do pico em segundos')
+    parser.add_argument('--start', default=DEFAULT_START, help='Horário de início da sessão (ISO-8601, UTC)')
+    parser.add_argument('--seed', type=int, default=0, help='Semente do gerador aleatório (saída reprodutível)')
+    args = parser.parse_args()
+
+    generate(args.output, SessionGenerator(
+        cars=args.cars,
+        duration=args.duration,
+        car_rate=args.car_rate,
+        position_rate=args.position_rate,
+        message_interval=args.message_interval,
+        weather_interval=args.weather_interval,
+        race_control_interval=args.race_control_interval,
+        burst=args.burst,
+        burst_at=args.burst_at,
+        burst_length=args.burst_length,
+        start=args.start,
+        seed=args.seed,
+    ))
@@ -1,19 +1,119 @@
 import asyncio
 import asyncpg
+import os
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Sequence
 
 from loguru import logger
 
 from models import Driver, Session, LapData, Position, TelemetryData, RaceControl, Weather
+from statements import StatementRegistry, connection_options, insert_statement
 from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
 
+# Limite de parâmetros ($n) de uma instrução no protocolo do PostgreSQL
+MAX_BIND_PARAMETERS = 32767
+
+# Linhas por INSERT de várias linhas (também limitado por MAX_BIND_PARAMETERS) e
+# INSERTs executados ao mesmo tempo, cada um em uma conexão do pool
+BULK_INSERT_MAX_ROWS = int(os.getenv("BULK_INSERT_MAX_ROWS", "1000"))
+BULK_INSERT_CONCURRENCY = int(os.getenv("BULK_INSERT_CONCURRENCY", "4"))
+
+def rows_per_chunk(column_count: int, max_rows: int = BULK_INSERT_MAX_ROWS) -> int:
+    """Linhas por INSERT sem ultrapassar o limite de parâmetros"""
+    return max(1, min(max_rows, MAX_BIND_PARAMETERS // max(column_count, 1)))
+
+@lru_cache(maxsize=64)
+def multi_row_insert_sql(table_name: str, columns: Sequence[str], row_count: int) -> str:
+    """INSERT com ``row_count`` tuplas de valores: ($1, $2), ($3, $4), ..."""
+    width = len(columns)
+    rows = ', '.join(
+        '(' + ', '.join(f'${row * width + column + 1}' for column in range(width)) + ')'
+        for row in range(row_count)
+    )
+    return f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES {rows}"
+
+# Tabelas só de inserção (INSERT de várias linhas, ver _bulk_insert)
+POSITIONS_COLUMNS = ('driver_number', 'position', 'timestamp')
+TELEMETRY_COLUMNS = (
+    'driver_number', 'timestamp', 'speed', 'rpm', 'gear',
+    'throttle', 'brake', 'drs', 'x', 'y', 'z'
+)
+RACE_CONTROL_COLUMNS = (
+    'timestamp', 'message', 'category', 'flag',
+    'driver_number', 'scope', 'sector', 'lap_number'
+)
+WEATHER_COLUMNS = (
+    'timestamp', 'air_temp', 'track_temp', 'humidity',
+    'pressure', 'wind_speed', 'wind_direction', 'rainfall'
+)
+
+# Tabelas com upsert: a mesma chave pode aparecer mais de uma vez no lote (e as voltas
+# combinam atualizações parciais com COALESCE), então as linhas vão uma a uma, na ordem,
+# em um único executemany da instrução preparada
+SESSIONS_COLUMNS = (
+    'session_key', 'meeting_key', 'name', 'date', 'circuit',
+    'type', 'location', 'country_name'
+)
+DRIVERS_COLUMNS = (
+    'driver_number', 'name', 'team', 'country_code', 'team_color',
+    'first_name', 'last_name', 'short_name', 'headshot_url', 'broadcast_name'
+)
+LAP_DATA_COLUMNS = (
+    'driver_number', 'lap_number', 'lap_time', 'sector_1_time',
+    'sector_2_time', 'sector_3_time', 'speed_trap', 'timestamp'
+)
+
+# Instruções nomeadas do PostgreSQLLoader (o nome é também o da tabela)
+LOADER_STATEMENTS = {
+    'sessions': insert_statement('sessions', SESSIONS_COLUMNS, '''
+        ON CONFLICT (session_key) DO UPDATE SET
+            meeting_key = EXCLUDED.meeting_key,
+            name = EXCLUDED.name,
+            date = EXCLUDED.date,
+            circuit = EXCLUDED.circuit,
+            type = EXCLUDED.type,
+            location = EXCLUDED.location,
+            country_name = EXCLUDED.country_name
+    '''),
+    'drivers': insert_statement('drivers', DRIVERS_COLUMNS, '''
+        ON CONFLICT (driver_number) DO UPDATE SET
+            name = EXCLUDED.name,
+            team = EXCLUDED.team,
+            country_code = EXCLUDED.country_code,
+            team_color = EXCLUDED.team_color,
+            first_name = EXCLUDED.first_name,
+            last_name = EXCLUDED.last_name,
+            short_name = EXCLUDED.short_name,
+            headshot_url = EXCLUDED.headshot_url,
+            broadcast_name = EXCLUDED.broadcast_name,
+            updated_at = CURRENT_TIMESTAMP
+    '''),
+    'lap_data': insert_statement('lap_data', LAP_DATA_COLUMNS, '''
+        ON CONFLICT (driver_number, lap_number) DO UPDATE SET
+            lap_time = COALESCE(EXCLUDED.lap_time, lap_data.lap_time),
+            sector_1_time = COALESCE(EXCLUDED.sector_1_time, lap_data.sector_1_time),
+            sector_2_time = COALESCE(EXCLUDED.sector_2_time, lap_data.sector_2_time),
+            sector_3_time = COALESCE(EXCLUDED.sector_3_time, lap_data.sector_3_time),
+            speed_trap = COALESCE(EXCLUDED.speed_trap, lap_data.speed_trap),
+            timestamp = EXCLUDED.timestamp
+    '''),
+    # Resto de cada lote que não completa um INSERT de várias linhas
+    'positions': insert_statement('positions', POSITIONS_COLUMNS),
+    'telemetry': insert_statement('telemetry', TELEMETRY_COLUMNS),
+    'race_control': insert_statement('race_control', RACE_CONTROL_COLUMNS),
+    'weather': insert_statement('weather', WEATHER_COLUMNS),
+}
+
 class PostgreSQLLoader:
     """Carrega dados da F1 no PostgreSQL/Supabase"""
     
     def __init__(self):
         self.pool = None
         self.conn_string = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        self._bulk_slots = asyncio.Semaphore(max(BULK_INSERT_CONCURRENCY, 1))
+        # INSERTs nomeados, preparados por conexão quando o pooler permite
+        self.statements = StatementRegistry(self.conn_string, LOADER_STATEMENTS)
     
     async def connect(self) -> None:
         """Estabelece conexão com o banco de dados"""
@@ -22,7 +122,8 @@ class PostgreSQLLoader:
             self.pool = await asyncpg.create_pool(
                 dsn=self.conn_string,
                 min_size=1,
-                max_size=10
+                max_size=10,
+                **connection_options(self.conn_string)
             )
             logger.info("Conexão estabelecida com sucesso")
             
@@ -38,6 +139,7 @@ class PostgreSQLLoader:
         if self.pool:
             await self.pool.close()
             logger.info("Conexão com o PostgreSQL fechada")
+        self.statements.report()
     
     async def _ensure_tables_exist(self) -> None:
         """Verifica se as tabelas necessárias existem, caso contrário, cria-as"""
@@ -176,14 +278,6 @@ class PostgreSQLLoader:
                 if batch_data.get('lap_data'):
                     await self._load_lap_data(conn, batch_data['lap_data'])
                 
-                # Carrega posições
-                if batch_data.get('positions'):
-                    await self._load_positions(conn, batch_data['positions'])
-                
-                # Carrega telemetria
-                if batch_data.get('telemetry'):
-                    await self._load_telemetry(conn, batch_data['telemetry'])
-                
                 # Carrega controle de corrida
                 if batch_data.get('race_control'):
                     await self._load_race_control(conn, batch_data['race_control'])
@@ -191,93 +285,62 @@ class PostgreSQLLoader:
                 # Carrega dados meteorológicos
                 if batch_data.get('weather'):
                     await self._load_weather(conn, batch_data['weather'])
+        
+        # Posições e telemetria (só inserções, alto volume) vão em INSERTs de várias linhas
+        # executados em paralelo em conexões do pool, fora da transação do lote
+        await asyncio.gather(
+            self._load_positions(None, batch_data.get('positions')),
+            self._load_telemetry(None, batch_data.get('telemetry'))
+        )
     
     async def _load_sessions(self, conn, sessions: List[Session]) -> None:
         """Carrega dados de sessão no banco de dados"""
         if not sessions:
             return
             
-        for session in sessions:
-            try:
-                await conn.execute('''
-                    INSERT INTO sessions (
-                        session_key, meeting_key, name, date, circuit, 
-                        type, location, country_name
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                    ON CONFLICT (session_key) DO UPDATE SET
-                        meeting_key = EXCLUDED.meeting_key,
-                        name = EXCLUDED.name,
-                        date = EXCLUDED.date,
-                        circuit = EXCLUDED.circuit,
-                        type = EXCLUDED.type,
-                        location = EXCLUDED.location,
-                        country_name = EXCLUDED.country_name
-                ''', 
-                    session.session_key, session.meeting_key, session.name, 
-                    session.date, session.circuit, getattr(session, 'type', None),
-                    getattr(session, 'location', None), getattr(session, 'country_name', None)
-                )
-            except Exception as e:
-                logger.error(f"Erro ao inserir sessão {session.session_key}: {e}")
+        try:
+            values = [(
+                session.session_key, session.meeting_key, session.name,
+                session.date, session.circuit, getattr(session, 'type', None),
+                getattr(session, 'location', None), getattr(session, 'country_name', None)
+            ) for session in sessions]
+            
+            await self.statements.executemany(conn, 'sessions', values)
+        except Exception as e:
+            logger.error(f"Erro ao inserir sessões em lote: {e}")
     
     async def _load_drivers(self, conn, drivers: List[Driver]) -> None:
         """Carrega dados de pilotos no banco de dados"""
         if not drivers:
             return
             
-        for driver in drivers:
-            try:
-                await conn.execute('''
-                    INSERT INTO drivers (
-                        driver_number, name, team, country_code, team_color,
-                        first_name, last_name, short_name, headshot_url, broadcast_name
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                    ON CONFLICT (driver_number) DO UPDATE SET
-                        name = EXCLUDED.name,
-                        team = EXCLUDED.team,
-                        country_code = EXCLUDED.country_code,
-                        team_color = EXCLUDED.team_color,
-                        first_name = EXCLUDED.first_name,
-                        last_name = EXCLUDED.last_name,
-                        short_name = EXCLUDED.short_name,
-                        headshot_url = EXCLUDED.headshot_url,
-                        broadcast_name = EXCLUDED.broadcast_name,
-                        updated_at = CURRENT_TIMESTAMP
-                ''', 
-                    driver.driver_number, driver.name, driver.team, driver.country_code,
-                    getattr(driver, 'team_color', None), getattr(driver, 'first_name', None),
-                    getattr(driver, 'last_name', None), getattr(driver, 'short_name', None),
-                    getattr(driver, 'headshot_url', None), getattr(driver, 'broadcast_name', None)
-                )
-            except Exception as e:
-                logger.error(f"Erro ao inserir piloto {driver.driver_number}: {e}")
+        try:
+            values = [(
+                driver.driver_number, driver.name, driver.team, driver.country_code,
+                getattr(driver, 'team_color', None), getattr(driver, 'first_name', None),
+                getattr(driver, 'last_name', None), getattr(driver, 'short_name', None),
+                getattr(driver, 'headshot_url', None), getattr(driver, 'broadcast_name', None)
+            ) for driver in drivers]
+            
+            await self.statements.executemany(conn, 'drivers', values)
+        except Exception as e:
+            logger.error(f"Erro ao inserir pilotos em lote: {e}")
     
     async def _load_lap_data(self, conn, lap_data_list: List[LapData]) -> None:
         """Carrega dados de voltas no banco de dados"""
         if not lap_data_list:
             return
             
-        for lap_data in lap_data_list:
-            try:
-                await conn.execute('''
-                    INSERT INTO lap_data (
-                        driver_number, lap_number, lap_time, sector_1_time,
-                        sector_2_time, sector_3_time, speed_trap, timestamp
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                    ON CONFLICT (driver_number, lap_number) DO UPDATE SET
-                        lap_time = COALESCE(EXCLUDED.lap_time, lap_data.lap_time),
-                        sector_1_time = COALESCE(EXCLUDED.sector_1_time, lap_data.sector_1_time),
-                        sector_2_time = COALESCE(EXCLUDED.sector_2_time, lap_data.sector_2_time),
-                        sector_3_time = COALESCE(EXCLUDED.sector_3_time, lap_data.sector_3_time),
-                        speed_trap = COALESCE(EXCLUDED.speed_trap, lap_data.speed_trap),
-                        timestamp = EXCLUDED.timestamp
-                ''', 
-                    lap_data.driver_number, lap_data.lap_number, lap_data.lap_time,
-                    lap_data.sector_1_time, lap_data.sector_2_time, lap_data.sector_3_time,
-                    lap_data.speed_trap, lap_data.timestamp
-                )
-            except Exception as e:
-                logger.error(f"Erro ao inserir lap data para piloto {lap_data.driver_number}, volta {lap_data.lap_number}: {e}")
+        try:
+            values = [(
+                lap_data.driver_number, lap_data.lap_number, lap_data.lap_time,
+                lap_data.sector_1_time, lap_data.sector_2_time, lap_data.sector_3_time,
+                lap_data.speed_trap, lap_data.timestamp
+            ) for lap_data in lap_data_list]
+            
+            await self.statements.executemany(conn, 'lap_data', values)
+        except Exception as e:
+            logger.error(f"Erro ao inserir lap data em lote: {e}")
     
     async def _load_positions(self, conn, positions: List[Position]) -> None:
         """Carrega dados de posição no banco de dados"""
@@ -287,10 +350,7 @@ class PostgreSQLLoader:
         # Para posições, inserimos tudo sem verificação de duplicidade
         try:
             values = [(p.driver_number, p.position, p.timestamp) for p in positions]
-            await conn.executemany('''
-                INSERT INTO positions (driver_number, position, timestamp)
-                VALUES ($1, $2, $3)
-            ''', values)
+            await self._bulk_insert(conn, 'positions', POSITIONS_COLUMNS, values)
         except Exception as e:
             logger.error(f"Erro ao inserir posições em lote: {e}")
     
@@ -306,12 +366,7 @@ class PostgreSQLLoader:
                 t.throttle, t.brake, t.drs, t.x, t.y, t.z
             ) for t in telemetry_list]
             
-            await conn.executemany('''
-                INSERT INTO telemetry (
-                    driver_number, timestamp, speed, rpm, gear,
-                    throttle, brake, drs, x, y, z
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-            ''', values)
+            await self._bulk_insert(conn, 'telemetry', TELEMETRY_COLUMNS, values)
         except Exception as e:
             logger.error(f"Erro ao inserir telemetria em lote: {e}")
     
@@ -327,12 +382,7 @@ class PostgreSQLLoader:
                 getattr(rc, 'sector', None), getattr(rc, 'lap_number', None)
             ) for rc in race_control_list]
             
-            await conn.executemany('''
-                INSERT INTO race_control (
-                    timestamp, message, category, flag,
-                    driver_number, scope, sector, lap_number
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-            ''', values)
+            await self._bulk_insert(conn, 'race_control', RACE_CONTROL_COLUMNS, values)
         except Exception as e:
             logger.error(f"Erro ao inserir race control em lote: {e}")
     
@@ -348,30 +398,46 @@ class PostgreSQLLoader:
                 w.pressure, w.wind_speed, w.wind_direction, w.rainfall
             ) for w in weather_list]
             
-            await conn.executemany('''
-                INSERT INTO weather (
-                    timestamp, air_temp, track_temp, humidity,
-                    pressure, wind_speed, wind_direction, rainfall
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-            ''', values)
+            await self._bulk_insert(conn, 'weather', WEATHER_COLUMNS, values)
         except Exception as e:
             logger.error(f"Erro ao inserir weather em lote: {e}")
 
-    async def _bulk_insert(self, conn, table_name: str, columns: List[str], values_list: List[tuple]) -> None:
-        """Realiza inserção em massa para melhor desempenho"""
+    async def _bulk_insert(self, conn, name: str, columns: Sequence[str], values_list: List[tuple]) -> None:
+        """Realiza inserção em massa com INSERTs de várias linhas, divididos pelo limite de parâmetros.
+        
+        Todos os INSERTs de várias linhas de uma tabela têm o mesmo tamanho (um único texto SQL
+        por tabela no cache de instruções); o resto que não completa um INSERT vai pela instrução
+        nomeada ``name`` de uma linha, com executemany. Com ``conn``, tudo roda em sequência nessa
+        conexão (e na sua transação); com ``conn=None``, em paralelo em conexões do pool."""
         if not values_list:
             return
-            
-        try:
-            # Cria a query de inserção em massa
-            placeholders = ', '.join([f'(${i * len(columns) + j + 1})' for i in range(len(values_list)) for j in range(len(columns))])
-            columns_str = ', '.join(columns)
-            query = f"INSERT INTO {table_name} ({columns_str}) VALUES {placeholders}"
-            
-            # Achata a lista de valores
-            flat_values = [val for tup in values_list for val in tup]
-            
-            # Executa a query
-            await conn.execute(query, *flat_values)
-        except Exception as e:
-            logger.error(f"Erro ao fazer inserção em massa na tabela {table_name}: {e}")
\ No newline at end of file
+        
+        columns = tuple(columns)
+        size = rows_per_chunk(len(columns))
+        full = len(values_list) - len(values_list) % size
+        chunks = [values_list[i:i + size] for i in range(0, full, size)]
+        tail = values_list[full:]
+        
+        if conn is not None:
+            for chunk in chunks:
+                await self._insert_chunk(conn, name, columns, chunk)
+            await self.statements.executemany(conn, name, tail)
+            return
+        
+        async def insert_pooled(chunk: List[tuple], multi_row: bool) -> None:
+            async with self._bulk_slots:
+                async with self.pool.acquire() as pooled_conn:
+                    if multi_row:
+                        await self._insert_chunk(pooled_conn, name, columns, chunk)
+                    else:
+                        await self.statements.executemany(pooled_conn, name, chunk)
+        
+        tasks = [insert_pooled(chunk, True) for chunk in chunks]
+        if tail:
+            tasks.append(insert_pooled(tail, False))
+        await asyncio.gather(*tasks)
+    
+    async def _insert_chunk(self, conn, table_name: str, columns: tuple, rows: List[tuple]) -> None:
+        """Executa um INSERT de várias linhas (o SQL de cada tabela fica em cache)"""
+        query = multi_row_insert_sql(table_name, columns, len(rows))
+        await conn.execute(query, *[value for row in rows for value in row])
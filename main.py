@@ -3,7 +3,6 @@ import os
 import signal
 import time
 import traceback
-import json
 import argparse
 from datetime import datetime
 from typing import Dict, List, Any, Optional
@@ -11,9 +10,11 @@ from dotenv import load_dotenv
 
 from loguru import logger
 
-from config_supabase import F1_DATA_FILE, BATCH_INTERVAL_MS, F1_TOPICS
+from config_supabase import F1_DATA_FILE, BATCH_INTERVAL_MS, F1_TOPICS, F1_STREAM_MODE
 from extractor import F1DataExtractor
+from line_parser import parse_data_line
 from supabase_loader import SupabaseLoader
+from timestamps import parse_timestamp
 
 # Configura o parser de argumentos da linha de comando
 def parse_args():
@@ -24,6 +25,8 @@ def parse_args():
                         help=f'Caminho para o arquivo de saída (padrão: {F1_DATA_FILE})')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Modo verboso - exibe mais logs de debug')
+    parser.add_argument('--stream', action='store_true', default=F1_STREAM_MODE,
+                        help='Recebe os registros pelo pipe do fastf1_livetiming (o arquivo de saída vira apenas cópia)')
     
     return parser.parse_args()
 
@@ -135,9 +138,8 @@ class WeatherDataProcessor:
             # Parse do timestamp - IMPORTANTE: usar timestamp without time zone
             if timestamp_str:
                 try:
-                    # Parse como timezone-aware e depois converter para naive (without time zone)
-                    aware_dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                    timestamp = aware_dt.replace(tzinfo=None)  # Remove timezone info
+                    # UTC sem informação de fuso horário (without time zone)
+                    timestamp = parse_timestamp(timestamp_str, aware=False)
                 except ValueError:
                     timestamp = datetime.now()
             else:
@@ -241,7 +243,7 @@ async def main():
         await weather_processor.initialize()
         
         # Inicializa apenas o extrator
-        extractor = F1DataExtractor(output_file=output_file)
+        extractor = F1DataExtractor(output_file=output_file, consumer=f"main-{args.session_id}", stream=args.stream)
         
         # Inicia a extração em segundo plano
         logger.info(f"Iniciando extração de dados da F1 para arquivo: {output_file}")
@@ -252,62 +254,49 @@ async def main():
         
         logger.info("Monitorando arquivo de dados...")
         
-        # Posição da última leitura do arquivo
-        last_position = 0
-        
         # Loop principal - monitoramento e processamento de dados meteorológicos
         while not shutdown_requested:
             try:
-                # Monitora o arquivo
-                if os.path.exists(output_file):
-                    file_size = os.path.getsize(output_file)
-                    perf_monitor.record_file_size(file_size)
-                    
-                    # Verifica se há novos dados para ler
-                    if file_size > last_position:
-                        with open(output_file, 'r') as f:
-                            # Move para a última posição lida
-                            f.seek(last_position)
-                            
-                            # Lê as novas linhas
-                            new_lines = f.readlines()
-                            last_position = f.tell()
-                            
-                            perf_monitor.total_lines_processed += len(new_lines)
-                            
-                            # Processa apenas linhas com dados meteorológicos
-                            weather_data_count = 0
-                            for line in new_lines:
-                                try:
-                                    # Parse do formato [topic, data, timestamp]
-                                    import ast
-                                    parsed_data = ast.literal_eval(line)
-                                    
-                                    if isinstance(parsed_data, list) and len(parsed_data) >= 3:
-                                        topic, data_content, timestamp = parsed_data
-                                        
-                                        if topic == 'WeatherData':
-                                            # Reconstroi o formato esperado pela função
-                                            data_dict = {
-                                                'topic': topic,
-                                                'data': data_content,
-                                                'timestamp': timestamp
-                                            }
-                                            count = await weather_processor.process_weather_data(data_dict)
-                                            weather_data_count += count
-                                except Exception as e:
-                                    logger.debug(f"Erro ao processar linha: {e}")
+                # Aguarda novas linhas (acorda por evento de escrita no arquivo ou após 1s)
+                new_lines = await extractor.get_new_data(timeout=1.0)
+                perf_monitor.record_file_size(extractor.tailer.file_size)
+                perf_monitor.total_lines_processed += len(new_lines)
+                
+                # Processa apenas linhas com dados meteorológicos
+                weather_data_count = 0
+                for line in new_lines:
+                    try:
+                        # Parse do formato [topic, data, timestamp], descartando outros tópicos
+                        parsed_data = parse_data_line(line, {'WeatherData'})
+                        
+                        if parsed_data is not None:
+                            topic, data_content, timestamp = parsed_data
                             
-                            if weather_data_count > 0:
-                                logger.info(f"Processados {weather_data_count} novos registros de dados meteorológicos")
-                                perf_monitor.record_weather_data(weather_data_count)
+                            if topic == 'WeatherData':
+                                # Reconstroi o formato esperado pela função
+                                data_dict = {
+                                    'topic': topic,
+                                    'data': data_content,
+                                    'timestamp': timestamp
+                                }
+                                count = await weather_processor.process_weather_data(data_dict)
+                                weather_data_count += count
+                    except Exception as e:
+                        logger.debug(f"Erro ao processar linha: {e}")
+                
+                if weather_data_count > 0:
+                    logger.info(f"Processados {weather_data_count} novos registros de dados meteorológicos")
+                    perf_monitor.record_weather_data(weather_data_count)
+                
+                # Registra o progresso somente depois que o lote foi processado
+                if new_lines:
+                    extractor.commit_position()
                 
                 # Mostra sinal de vida periodicamente
                 heartbeat_counter += 1
-                if heartbeat_counter >= 300:  # A cada 5 minutos (com intervalo de 1s)
-                    if os.path.exists(output_file):
-                        file_size = os.path.getsize(output_file)
-                        logger.info(f"Extração ativa, tamanho atual do arquivo: {file_size/1024:.2f} KB")
+                if heartbeat_counter >= 300:  # A cada 300 leituras (aprox. 5 minutos sem dados)
+                    if extractor.tailer.file_size > 0:
+                        logger.info(f"Extração ativa, tamanho atual do arquivo: {extractor.tailer.file_size/1024:.2f} KB")
                     else:
                         logger.info("Extração ativa, aguardando criação do arquivo...")
                     heartbeat_counter = 0
@@ -315,9 +304,6 @@ async def main():
                 # Gera relatório de performance periódico
                 perf_monitor.report_if_needed()
                 
-                # Pequena pausa
-                await asyncio.sleep(1)
-                
             except asyncio.CancelledError:
                 logger.info("Loop de monitoramento cancelado externamente")
                 break
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import os
 import signal
@@ -10,14 +11,26 @@ from dotenv import load_dotenv
 from loguru import logger
 
 from config_supabase import F1_DATA_FILE, BATCH_INTERVAL_MS
+from decoder import PayloadDecoder
 from extractor import F1DataExtractor
+from parquet_sink import ARROW_AVAILABLE, ParquetSink
+from staged_pipeline import (Batch, Stage, StagedPipeline, DEFAULT_DECODE_CONCURRENCY,
+                             DEFAULT_LOAD_CONCURRENCY)
 from transformer import F1DataTransformer
 from supabase_loader import SupabaseLoader
+from telemetry_compression import DEFAULT_TELEMETRY_COMPRESSION, DeadbandFilter
 
 class PerformanceMonitor:
     """Monitora a performance do pipeline"""
     
-    def __init__(self):
+    def __init__(self, decoder: Optional[PayloadDecoder] = None, pipeline: Optional[StagedPipeline] = None,
+                 loader: Optional[SupabaseLoader] = None, compressor: Optional[DeadbandFilter] = None,
+                 archive: Optional[ParquetSink] = None):
+        self.decoder = decoder
+        self.pipeline = pipeline
+        self.loader = loader
+        self.compressor = compressor
+        self.archive = archive
         self.start_time = time.time()
         self.last_report_time = self.start_time
         self.total_lines_processed = 0
@@ -53,6 +66,18 @@ class PerformanceMonitor:
                 logger.info(f"Tempo máximo de processamento por lote: {max_batch_time*1000:.2f}ms")
                 logger.info(f"Taxa de processamento: {len(recent_batches)/sum(recent_batches):.2f} lotes/s")
             
+            if self.pipeline:
+                self.pipeline.report()
+            if self.loader:
+                self.loader.report_latencies()
+                self.loader.report_spool()
+            if self.compressor:
+                self.compressor.report()
+            if self.archive:
+                self.archive.report()
+            if self.decoder:
+                self.decoder.report()
+            
             self.last_report_time = current_time
 
 # Configura o logger
@@ -67,27 +92,43 @@ def handle_shutdown(signum, frame):
     logger.info(f"Sinal de encerramento recebido ({signum})")
     shutdown_requested = True
 
-async def main():
+async def main(replay_file: Optional[str] = None, replay_speed: float = 1.0,
+               compress_telemetry: bool = DEFAULT_TELEMETRY_COMPRESSION,
+               archive_dir: Optional[str] = None, archive_session: Optional[str] = None):
     """Função principal do pipeline ETL que orquestra o processo de extração,
-    transformação e carga dos dados da F1 em tempo quase real no Supabase."""
+    transformação e carga dos dados da F1 em tempo quase real no Supabase.
+    
+    Leitura, análise/decodificação, transformação e carga rodam em etapas
+    concorrentes ligadas por filas limitadas (ver staged_pipeline.py).
+    
+    Com ``replay_file``, uma sessão gravada é reproduzida no lugar da extração ao vivo.
+    Com ``compress_telemetry``, uma etapa entre a transformação e a carga descarta as
+    amostras de telemetria dentro da banda morta (ver telemetry_compression.py).
+    Com ``archive_dir``, os lotes transformados também são gravados em arquivos Parquet
+    por sessão e por tópico (ver parquet_sink.py)."""
     
     # Registra manipuladores de sinais para encerramento gracioso
     signal.signal(signal.SIGINT, handle_shutdown)
     signal.signal(signal.SIGTERM, handle_shutdown)
     
-    # Converte o intervalo de milissegundos para segundos para uso com asyncio.sleep
+    # Converte o intervalo de milissegundos para segundos (meta de tempo por lote)
     batch_interval_sec = BATCH_INTERVAL_MS / 1000.0
     
     logger.info(f"Iniciando pipeline F1 com intervalo de processamento de {BATCH_INTERVAL_MS}ms")
     logger.info(f"Dados serão carregados no Supabase")
     
+    # Decodificação dos payloads comprimidos em um pool de processos (DECODER_WORKERS)
+    decoder = PayloadDecoder()
+    
     # Inicializa o monitor de performance
-    perf_monitor = PerformanceMonitor()
+    perf_monitor = PerformanceMonitor(decoder)
     
     try:
         # Inicializa componentes do pipeline
-        extractor = F1DataExtractor(output_file=F1_DATA_FILE)
+        extractor = F1DataExtractor(output_file=F1_DATA_FILE, consumer="main_supabase",
+                                    replay_file=replay_file, replay_speed=replay_speed)
         transformer = F1DataTransformer()
+        decoder.start()
         loader = SupabaseLoader()  # Usando o novo SupabaseLoader
         
         # Conecta ao banco de dados
@@ -95,106 +136,164 @@ async def main():
         await loader.connect()
         logger.info("Conexão com o Supabase estabelecida")
         
-        # Inicia a extração em segundo plano
-        logger.info(f"Iniciando extração de dados da F1 para arquivo: {F1_DATA_FILE}")
+        # Inicia a extração (ou a reprodução) em segundo plano
+        if not replay_file:
+            logger.info(f"Iniciando extração de dados da F1 para arquivo: {F1_DATA_FILE}")
         extraction_task = asyncio.create_task(extractor.start_extraction())
         
         # Estatísticas de processamento para logs frequentes
-        last_log_time = time.time()
-        records_since_last_log = 0
-        batches_since_last_log = 0
-        empty_batches_count = 0
+        stats = {'records': 0, 'batches': 0, 'empty_batches': 0}
         
-        # Contador de operações para o coração do loop
-        heartbeat_counter = 0
+        async def read_batch():
+            """Etapa de leitura: acorda por evento de escrita no arquivo ou após 1s sem dados"""
+            new_lines = await extractor.get_new_data(timeout=1.0)
+            
+            # Na reprodução de uma sessão gravada, o pipeline termina junto com o arquivo
+            if not new_lines and extractor.finished:
+                logger.info("Reprodução concluída, encerrando pipeline")
+                return None
+            return new_lines, extractor.position_snapshot()
         
-        logger.info("Iniciando loop principal de processamento...")
+        async def decode_batch(batch: Batch):
+            """Etapa de análise das linhas e decodificação em lote dos payloads comprimidos"""
+            batch.records = await decoder.decode_records(transformer.parse_lines(batch.lines))
         
-        # Loop principal de processamento
-        while not shutdown_requested:
-            try:
-                batch_start_time = time.time()
-                
-                # Obtém novos dados
-                new_lines = await extractor.get_new_data()
-                
-                # Mostra sinal de vida periodicamente mesmo sem dados
-                heartbeat_counter += 1
-                if heartbeat_counter >= 1000:  # Aproximadamente a cada 100 segundos com intervalo de 100ms
-                    logger.debug("Pipeline ativo, aguardando dados...")
-                    heartbeat_counter = 0
-                
-                if new_lines:
-                    # Processa os dados
-                    transformed_data = transformer.process_data_batch(new_lines)
-                    
-                    # Conta registros do lote atual
-                    current_batch_records = sum(len(value) for value in transformed_data.values())
-                    records_since_last_log += current_batch_records
-                    batches_since_last_log += 1
-                    
-                    # Carrega no banco de dados se houver dados transformados
-                    if current_batch_records > 0:
-                        await loader.load_batch(transformed_data)
-                        
-                        # Detalha os tipos de dados processados no log em modo debug
-                        record_counts = {key: len(value) for key, value in transformed_data.items() if len(value) > 0}
-                        if record_counts:
-                            logger.debug(f"Processados: {record_counts}")
-                    else:
-                        empty_batches_count += 1
-                        if empty_batches_count % 50 == 0:  # Log a cada 50 lotes vazios
-                            logger.debug(f"Recebidos {empty_batches_count} lotes sem dados transformáveis")
-                
-                # Registra a duração do processamento do lote
-                batch_duration = time.time() - batch_start_time
-                perf_monitor.record_batch(
-                    lines_count=len(new_lines) if new_lines else 0,
-                    records_count=current_batch_records if 'current_batch_records' in locals() else 0,
-                    batch_time=batch_duration
-                )
-                
-                # Logs periódicos de atividade a cada 5 segundos, se houver atividade
-                current_time = time.time()
-                if current_time - last_log_time >= 5:
-                    if records_since_last_log > 0:
-                        logger.info(f"Últimos 5s: {batches_since_last_log} lotes, {records_since_last_log} registros")
-                        avg_batch_ms = (current_time - last_log_time) * 1000 / batches_since_last_log if batches_since_last_log > 0 else 0
-                        logger.info(f"Tempo médio por lote: {avg_batch_ms:.2f}ms, taxa: {records_since_last_log / 5:.1f} registros/s")
-                    
-                    # Gera relatório de performance completo a cada minuto
-                    perf_monitor.report_if_needed()
-                    
-                    # Reseta contadores
-                    records_since_last_log = 0
-                    batches_since_last_log = 0
-                    last_log_time = current_time
-                
-                # Calcula o tempo de sono adaptativo para manter o intervalo desejado
-                elapsed = time.time() - batch_start_time
-                sleep_time = max(0, batch_interval_sec - elapsed)
+        async def transform_batch(batch: Batch):
+            """Etapa de transformação dos registros em modelos"""
+            batch.data = transformer.process_records(batch.records)
+            batch.records = None
+            batch.record_count = sum(len(value) for value in batch.data.values())
+        
+        # Arquivo colunar da sessão, com a telemetria completa (antes da compressão)
+        archive = None
+        if archive_dir and not ARROW_AVAILABLE:
+            logger.error("--archive-dir requer pyarrow (pip install pyarrow); arquivo Parquet desativado")
+        elif archive_dir:
+            if not archive_session:
+                archive_session = (os.path.splitext(os.path.basename(replay_file))[0] if replay_file
+                                   else f"live-{datetime.now():%Y%m%d-%H%M%S}")
+            archive = ParquetSink(archive_dir, archive_session)
+            perf_monitor.archive = archive
+            logger.info(f"Arquivando a sessão em Parquet: {archive.directory}")
+        
+        async def archive_batch(batch: Batch):
+            """Etapa de arquivamento em Parquet (grava um row group quando o buffer do tópico enche)"""
+            if batch.record_count > 0:
+                await archive.write_batch(batch.data)
+        
+        # Compressão da telemetria: o filtro guarda estado por carro e recebe os lotes em ordem
+        compressor = DeadbandFilter() if compress_telemetry else None
+        perf_monitor.compressor = compressor
+        read_position = {'last': None}  # Posição lida até o último lote comprimido (origem do próximo)
+        
+        async def compress_batch(batch: Batch):
+            """Etapa de compressão por banda morta da telemetria"""
+            source, read_position['last'] = read_position['last'], batch.position
+            if batch.data.get('telemetry'):
+                batch.data['telemetry'] = compressor.filter(batch.data['telemetry'], source)
+                batch.record_count = sum(len(value) for value in batch.data.values())
+            # O checkpoint não passa do ponto de onde as amostras retidas podem ser relidas
+            batch.position = compressor.safe_position(batch.position)
+        
+        def commit_position(snapshot):
+            """Grava o checkpoint do lote; sem posição segura (amostra retida do primeiro lote), mantém o anterior"""
+            if snapshot is not None:
+                extractor.commit_position(snapshot)
+        
+        async def load_batch(batch: Batch):
+            """Etapa de carga no banco de dados"""
+            if batch.record_count > 0:
+                await loader.load_batch(batch.data)
                 
-                # Pequena pausa adaptativa em milissegundos
-                if sleep_time > 0:
-                    await asyncio.sleep(sleep_time)
-                else:
-                    # Se estamos atrasados, permite que o event loop respire
-                    # usando sleep(0) para dar chance a outras tarefas assíncronas
-                    await asyncio.sleep(0)
-                    if elapsed > batch_interval_sec * 5:  # Se estiver muito atrasado, log de alerta
-                        logger.warning(f"Processamento lento: {elapsed*1000:.2f}ms (meta: {BATCH_INTERVAL_MS}ms)")
+                # Detalha os tipos de dados processados no log em modo debug
+                record_counts = {key: len(value) for key, value in batch.data.items() if len(value) > 0}
+                logger.debug(f"Processados: {record_counts}")
+            else:
+                stats['empty_batches'] += 1
+                if stats['empty_batches'] % 50 == 0:  # Log a cada 50 lotes vazios
+                    logger.debug(f"Recebidos {stats['empty_batches']} lotes sem dados transformáveis")
+        
+        def on_complete(batch: Batch):
+            """Registra a duração de ponta a ponta (leitura até a carga) de cada lote"""
+            batch_duration = time.perf_counter() - batch.created_at
+            stats['records'] += batch.record_count
+            stats['batches'] += 1
+            perf_monitor.record_batch(
+                lines_count=len(batch.lines),
+                records_count=batch.record_count,
+                batch_time=batch_duration
+            )
             
-            except asyncio.CancelledError:
-                logger.info("Loop de processamento cancelado externamente")
-                break
-            except Exception as e:
-                logger.error(f"Erro no loop de processamento: {e}")
-                logger.debug(f"Detalhes do erro: {traceback.format_exc()}")
-                # Espera um pouco mais em caso de erro para não sobrecarregar em caso de falhas
-                await asyncio.sleep(1)
+            if batch_duration > batch_interval_sec * 5:  # Se estiver muito atrasado, log de alerta
+                logger.warning(f"Processamento lento: {batch_duration*1000:.2f}ms (meta: {BATCH_INTERVAL_MS}ms)")
+        
+        # O checkpoint é gravado somente depois que o lote (e todos os anteriores) foram carregados.
+        # A transformação guarda estado entre lotes (drivers_cache, session_info) e recebe os lotes em ordem.
+        stages = [
+            Stage('decode', decode_batch, DEFAULT_DECODE_CONCURRENCY),
+            Stage('transform', transform_batch, ordered=True),
+            Stage('load', load_batch, DEFAULT_LOAD_CONCURRENCY),
+        ]
+        if compressor:
+            stages.insert(2, Stage('compress', compress_batch, ordered=True))
+        if archive:
+            stages.insert(2, Stage('archive', archive_batch))
+        pipeline = StagedPipeline(
+            read_batch,
+            stages,
+            commit=commit_position,
+            on_complete=on_complete
+        )
+        perf_monitor.pipeline = pipeline
+        perf_monitor.loader = loader
+        
+        stage_names = {'decode': 'decodificação', 'transform': 'transformação', 'archive': 'arquivo Parquet',
+                       'compress': 'compressão', 'load': 'carga'}
+        logger.info(f"Iniciando pipeline em etapas (leitura → {' → '.join(stage_names[stage.name] for stage in stages)})...")
+        pipeline_task = asyncio.create_task(pipeline.run())
+        
+        # Logs periódicos de atividade a cada 5 segundos, se houver atividade
+        last_log_time = time.time()
+        while not shutdown_requested and not pipeline_task.done():
+            await asyncio.wait({pipeline_task}, timeout=5)
+            
+            current_time = time.time()
+            if stats['records'] > 0:
+                logger.info(f"Últimos 5s: {stats['batches']} lotes, {stats['records']} registros, "
+                            f"filas: {pipeline.queue_depths()}")
+                logger.info(f"Taxa: {stats['records'] / (current_time - last_log_time):.1f} registros/s")
+            
+            # Gera relatório de performance completo a cada minuto
+            perf_monitor.report_if_needed()
+            
+            # Reseta contadores
+            stats['records'] = 0
+            stats['batches'] = 0
+            last_log_time = current_time
         
-        # Encerramento do pipeline
+        # Encerramento do pipeline: para a leitura e esvazia as filas
         logger.info("Encerrando pipeline...")
+        pipeline.stop()
+        try:
+            await pipeline_task
+        except Exception as e:
+            logger.error(f"Erro no pipeline: {e}")
+            logger.debug(f"Detalhes do erro: {traceback.format_exc()}")
+        
+        # Última amostra dos trechos constantes ainda retidos pela compressão
+        if compressor:
+            held = compressor.flush()
+            if held:
+                await loader.load_batch({'telemetry': held})
+            # Com as amostras retidas gravadas, o checkpoint alcança o último lote lido
+            commit_position(read_position['last'])
+        
+        # Grava os buffers e compacta as partes do arquivo Parquet da sessão
+        if archive:
+            try:
+                await archive.close()
+            except Exception as e:
+                logger.error(f"Erro ao compactar o arquivo Parquet: {e}")
         
         # Encerra a extração
         logger.info("Interrompendo extração de dados...")
@@ -216,6 +315,9 @@ async def main():
         logger.info("Fechando conexão com o Supabase...")
         await loader.disconnect()
         
+        # Encerra o pool de decodificação
+        decoder.close()
+        
         # Relatório final de performance
         logger.info("Gerando relatório final de performance...")
         perf_monitor.report_if_needed(force=True)
@@ -227,5 +329,21 @@ async def main():
     logger.info("Pipeline encerrado")
     
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pipeline de dados da F1 para o Supabase')
+    parser.add_argument('--replay', metavar='ARQUIVO',
+                        help='Reproduz uma sessão gravada em vez de iniciar a extração ao vivo')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Multiplicador de velocidade da reprodução (0 = o mais rápido possível)')
+    parser.add_argument('--compress-telemetry', action=argparse.BooleanOptionalAction,
+                        default=DEFAULT_TELEMETRY_COMPRESSION,
+                        help='Descarta as amostras de telemetria dentro da banda morta (TELEMETRY_DEADBAND)')
+    parser.add_argument('--archive-dir', metavar='DIRETÓRIO', default=os.getenv("ARCHIVE_DIR") or None,
+                        help='Também grava os dados em Parquet por sessão e tópico neste diretório (requer pyarrow)')
+    parser.add_argument('--archive-session', metavar='NOME',
+                        help='Nome da sessão no arquivo Parquet (padrão: nome da captura reproduzida ou live-<data>)')
+    args = parser.parse_args()
+    
     logger.info("Iniciando pipeline de dados F1 para Supabase")
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(replay_file=args.replay, replay_speed=args.speed,
+                     compress_telemetry=args.compress_telemetry,
+                     archive_dir=args.archive_dir, archive_session=args.archive_session))
\ No newline at end of file
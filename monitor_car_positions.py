@@ -3,22 +3,27 @@ import os
 import signal
 import time
 import traceback
-import ast
-import base64
-import zlib
-import json
 import argparse
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Optional, List
 from dotenv import load_dotenv
 
 from loguru import logger
-import asyncpg
 
-# Configurar o logger
-logger.remove()
-logger.add("f1_positions.log", rotation="10 MB", level="DEBUG")
-logger.add(lambda msg: print(msg), level="INFO")
+from buffered_writer import BufferedWriter, checkpoint_callback
+from checkpoint import CheckpointStore
+from connection_pool import shared_pool
+from copy_loader import CAR_POSITIONS_COLUMNS, CopyLoader
+from decoder import decode_compressed_data
+from file_tailer import FileTailer
+from line_parser import parse_data_line
+from spool import open_spool
+from statements import NATURAL_KEYS, StatementRegistry
+from write_retry import RetryingWriter
+from timestamps import parse_timestamp
+
+# Tópicos processados por este monitor
+MONITORED_TOPICS = {'Position.z'}
 
 # Flag para controlar o encerramento
 shutdown_requested = False
@@ -29,48 +34,39 @@ def handle_shutdown(signum, frame):
     logger.info(f"Sinal de encerramento recebido ({signum})")
     shutdown_requested = True
 
-def decode_compressed_data(encoded_data):
-    """
-    Decodifica dados da F1 que estão em formato comprimido (base64 + zlib)
-    """
-    try:
-        # Remove aspas se presentes
-        if isinstance(encoded_data, str) and encoded_data.startswith('"') and encoded_data.endswith('"'):
-            encoded_data = encoded_data[1:-1]
-            
-        # Decodifica base64 e descomprime zlib com o wbits negativo (formato específico da F1)
-        decoded_data = zlib.decompress(base64.b64decode(encoded_data), -zlib.MAX_WBITS)
-        
-        # Converte para JSON
-        return json.loads(decoded_data)
-    except Exception as e:
-        logger.error(f"Erro ao decodificar dados: {e}")
-        raise
-
 class PositionProcessor:
     """Processa dados de posição dos carros e insere no banco de dados"""
     
     def __init__(self, session_id: int, conn_string: str):
         self.session_id = session_id
         self.conn_string = conn_string
-        self.conn = None
+        self.pool = None
+        # INSERTs nomeados, preparados por conexão quando o pooler permite
+        self.statements = StatementRegistry(conn_string)
         self.processed_count = 0
         self.connected = False
+        self.copy_loader = CopyLoader(statements=self.statements, skip_conflicts=NATURAL_KEYS)
+        # Novas tentativas e divisão dos lotes rejeitados; linhas inválidas vão para o dead-letter
+        self.retrying = RetryingWriter()
+        # Linhas agrupadas em micro-lotes (WRITER_MAX_ROWS linhas ou WRITER_MAX_DELAY_MS)
+        self.writer = BufferedWriter(self._write_or_spool, name='car_positions')
+        # Micro-lotes que não chegam ao banco (queda ou lentidão) vão para o spool local
+        self.spool, self.drainer = open_spool(f'car_positions-{session_id}', {'car_positions': self._write_rows})
         self.drivers_processed = set()  # Para estatísticas
     
     async def connect(self):
         """Estabelece conexão com o banco de dados"""
         try:
-            self.conn = await asyncpg.connect(
-                dsn=self.conn_string,
-                ssl="require"
-            )
+            # Pool compartilhado pelos processadores do processo, com reconexão automática
+            self.pool = await shared_pool(self.conn_string)
             self.connected = True
+            if self.drainer:
+                self.drainer.start()
             logger.info(f"Conexão com o banco de dados estabelecida para session_id={self.session_id}")
             
             # Verifica sessão
             try:
-                session = await self.conn.fetchrow(
+                session = await self.pool.fetchrow(
                     "SELECT id, name, type FROM public.sessions WHERE id = $1",
                     self.session_id
                 )
@@ -98,7 +94,7 @@ class PositionProcessor:
         # Parse do timestamp
         if timestamp_str:
             try:
-                timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+                timestamp = parse_timestamp(timestamp_str)
             except ValueError:
                 timestamp = datetime.now()
         else:
@@ -107,13 +103,14 @@ class PositionProcessor:
         # Decodifica os dados
         try:
             try:
-                # Decodificar dados no formato específico da F1
-                data = decode_compressed_data(encoded_data)
+                # Decodificar dados no formato específico da F1 (o serviço de ingestão já entrega decodificado)
+                data = decode_compressed_data(encoded_data) if isinstance(encoded_data, str) else encoded_data
             except Exception as e:
                 logger.error(f"Falha ao decodificar dados de posição: {e}")
                 return 0
             
-            positions_inserted = 0
+            rows = []
+            created_at = datetime.now()
             
             # Extrai as posições dos carros
             if "Position" in data:
@@ -121,13 +118,13 @@ class PositionProcessor:
                 for position_entry in data["Position"]:
                     if "Timestamp" in position_entry and "Entries" in position_entry:
                         entry_time_str = position_entry["Timestamp"]
-
-                    # Converter o timestamp de string para datetime
-                    try:
-                        entry_time = datetime.fromisoformat(entry_time_str.replace('Z', '+00:00')).replace(tzinfo=None)
-                    except ValueError:
-                        logger.warning(f"Formato de timestamp inválido: {entry_time_str}, usando timestamp principal")
-                        entry_time = timestamp                        
+                        
+                        # Converter o timestamp de string para datetime
+                        try:
+                            entry_time = parse_timestamp(entry_time_str, aware=False)
+                        except ValueError:
+                            logger.warning(f"Formato de timestamp inválido: {entry_time_str}, usando timestamp principal")
+                            entry_time = timestamp.replace(tzinfo=None)
                         
                         # Ciclo através das posições de cada piloto
                         for driver_number, coords in position_entry["Entries"].items():
@@ -136,22 +133,17 @@ class PositionProcessor:
                             y_coord = coords.get("Y", 0)
                             z_coord = coords.get("Z", 0)
                             
-                            # Insere no banco de dados
-                            await self.conn.execute("""
-                                INSERT INTO public.car_positions (
-                                    session_id, timestamp, utc_time, driver_number, 
-                                    x_coord, y_coord, z_coord,
-                                    created_at, updated_at
-                                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-                            """,
+                            rows.append((
                                 self.session_id, timestamp, entry_time, str(driver_number),
                                 x_coord, y_coord, z_coord,
-                                datetime.now(), datetime.now()
-                            )
-                            
-                            positions_inserted += 1
+                                created_at, created_at
+                            ))
                             self.drivers_processed.add(str(driver_number))
             
+            # As linhas da mensagem vão para o buffer; a gravação (COPY) é feita em micro-lotes
+            await self.writer.extend(rows)
+            positions_inserted = len(rows)
+            
             if positions_inserted > 0:
                 self.processed_count += positions_inserted
                 # Log apenas a cada 50 processamentos para não sobrecarregar
@@ -165,29 +157,32 @@ class PositionProcessor:
             logger.error(f"Erro ao processar dados de posição: {e}")
             return 0
     
-    async def close(self):
-        """Fecha a conexão com o banco de dados"""
-        if self.conn:
-            await self.conn.close()
-            logger.info("Conexão com o banco de dados fechada")
-
-def parse_data_line(line: str) -> Tuple[str, Any, str]:
-    """Analisa uma linha de dados no formato específico"""
-    try:
-        # Use ast.literal_eval para processar seguramente a lista Python
-        parsed_data = ast.literal_eval(line)
-        
-        # Formato esperado: [tópico, dados, timestamp]
-        if isinstance(parsed_data, list) and len(parsed_data) >= 3:
-            topic = parsed_data[0]
-            data = parsed_data[1]
-            timestamp = parsed_data[2]
-            return topic, data, timestamp
-        
-        raise ValueError("Formato de dados inesperado")
+    async def _write_rows(self, rows: List[tuple]) -> None:
+        """Grava um micro-lote de linhas na tabela car_positions"""
+        await self.pool.run(self.retrying.write, 'car_positions', rows, self.copy_loader.load, 'car_positions', CAR_POSITIONS_COLUMNS)
     
-    except Exception as e:
-        raise ValueError(f"Erro ao analisar linha: {e}")
+    async def _write_or_spool(self, rows: List[tuple]) -> None:
+        """Grava o micro-lote no banco ou, se o banco estiver fora ou lento, no spool local"""
+        if self.spool:
+            await self.spool.write_through('car_positions', self._write_rows, rows)
+        else:
+            await self._write_rows(rows)
+    
+    async def close(self):
+        """Grava as linhas pendentes e fecha a conexão com o banco de dados"""
+        await self.writer.close()
+        self.writer.report()
+        if self.drainer:
+            await self.drainer.stop()
+            self.drainer.report()
+            await self.spool.close()
+        self.statements.report()
+        self.retrying.report()
+        self.retrying.dead_letter.close()
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Conexão com o banco de dados liberada")
 
 async def monitor_positions(input_file: str, session_id: int):
     """Monitora um arquivo de dados F1 para posições dos carros"""
@@ -213,6 +208,11 @@ async def monitor_positions(input_file: str, session_id: int):
     # Inicializa o processador
     processor = PositionProcessor(session_id=session_id, conn_string=conn_string)
     
+    # Leitura contínua do arquivo, retomando do último checkpoint desta sessão
+    checkpoints = CheckpointStore()
+    consumer = f"monitor_car_positions-{session_id}"
+    tailer = FileTailer(input_file, start_position=checkpoints.resume_position(consumer, input_file))
+    
     try:
         # Conecta ao banco de dados
         await processor.connect()
@@ -221,9 +221,6 @@ async def monitor_positions(input_file: str, session_id: int):
         if not os.path.exists(input_file):
             logger.warning(f"Arquivo {input_file} não encontrado. Aguardando sua criação...")
         
-        # Posição da última leitura
-        last_position = 0
-        
         # Estatísticas
         start_time = time.time()
         last_report_time = start_time
@@ -233,42 +230,33 @@ async def monitor_positions(input_file: str, session_id: int):
         # Loop principal de monitoramento
         while not shutdown_requested:
             try:
-                # Verifica se o arquivo existe
-                if not os.path.exists(input_file):
-                    await asyncio.sleep(1)
-                    continue
+                # Aguarda novas linhas (acorda por evento de escrita ou após o timeout)
+                lines = await tailer.read_batch()
+                total_lines += len(lines)
                 
-                # Obtém tamanho atual do arquivo
-                file_size = os.path.getsize(input_file)
-                
-                # Se há novos dados
-                if file_size > last_position:
-                    with open(input_file, 'r') as f:
-                        # Move para a última posição lida
-                        f.seek(last_position)
-                        
-                        # Lê as novas linhas
-                        lines = f.readlines()
-                        last_position = f.tell()
-                        
-                        total_lines += len(lines)
-                        
-                        # Processsa cada linha
-                        for line in lines:
-                            try:
-                                # Analisa a linha no formato específico
-                                topic, data, timestamp = parse_data_line(line)
-                                
-                                # Se for dados de posição, processa
-                                if topic == 'Position.z':
-                                    count = await processor.process_position_data(topic, data, timestamp)
-                                    positions_found += count
-                            except ValueError:
-                                # Ignora erros de linhas malformadas
-                                pass
-                            except Exception as e:
-                                logger.error(f"Erro ao processar linha: {e}")
+                # Processa cada linha
+                for line in lines:
+                    try:
+                        # Analisa a linha no formato específico, descartando outros tópicos
+                        record = parse_data_line(line, MONITORED_TOPICS)
+                        if record is None:
+                            continue
+                        topic, data, timestamp = record
+
+                        # Se for dados de posição, processa
+                        if topic == 'Position.z':
+                            count = await processor.process_position_data(topic, data, timestamp)
+                            positions_found += count
+                    except ValueError:
+                        # Ignora erros de linhas malformadas
+                        pass
+                    except Exception as e:
+                        logger.error(f"Erro ao processar linha: {e}")
                 
+                # Registra o progresso somente depois que as linhas do lote forem gravadas
+                if lines:
+                    processor.writer.when_flushed(checkpoint_callback(checkpoints, consumer, tailer))
+
                 # Relatório periódico
                 current_time = time.time()
                 if current_time - last_report_time >= 60:  # a cada minuto
@@ -279,16 +267,16 @@ async def monitor_positions(input_file: str, session_id: int):
                     logger.info(f"Posições encontradas: {positions_found}")
                     logger.info(f"Posições inseridas: {processor.processed_count}")
                     logger.info(f"Pilotos rastreados: {len(processor.drivers_processed)}")
+                    processor.writer.report()
+                    if processor.drainer:
+                        processor.drainer.report()
                     
-                    if file_size > 0:
-                        logger.info(f"Tamanho do arquivo: {file_size/1024:.1f} KB")
-                        logger.info(f"Posição atual: {last_position/1024:.1f} KB ({last_position/file_size*100:.1f}%)")
+                    if tailer.file_size > 0:
+                        logger.info(f"Tamanho do arquivo: {tailer.file_size/1024:.1f} KB")
+                        logger.info(f"Posição atual: {tailer.position/1024:.1f} KB ({tailer.position/tailer.file_size*100:.1f}%)")
                     
                     last_report_time = current_time
                 
-                # Pequena pausa
-                await asyncio.sleep(0.5)
-                
             except asyncio.CancelledError:
                 logger.info("Monitoramento cancelado")
                 break
@@ -311,11 +299,17 @@ async def monitor_positions(input_file: str, session_id: int):
         logger.debug(traceback.format_exc())
     
     finally:
-        # Fecha a conexão
+        # Fecha o arquivo e a conexão
+        tailer.close()
         await processor.close()
         logger.info("Monitoramento encerrado")
 
 if __name__ == "__main__":
+    # Configurar o logger
+    logger.remove()
+    logger.add("f1_positions.log", rotation="10 MB", level="DEBUG")
+    logger.add(lambda msg: print(msg), level="INFO")
+    
     parser = argparse.ArgumentParser(description='Monitora posições dos carros da F1')
     parser.add_argument('--session-id', type=int, required=True, help='ID da sessão')
     parser.add_argument('--input-file', type=str, default='f1_data.txt', help='Arquivo de entrada')
@@ -3,22 +3,28 @@ import os
 import signal
 import time
 import traceback
-import ast
-import base64
-import zlib
-import json
 import argparse
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Callable, Optional, List
 from dotenv import load_dotenv
 
 from loguru import logger
-import asyncpg
 
-# Configurar o logger
-logger.remove()
-logger.add("f1_telemetry.log", rotation="10 MB", level="DEBUG")
-logger.add(lambda msg: print(msg), level="INFO")
+from buffered_writer import BufferedWriter, checkpoint_callback, read_position
+from checkpoint import CheckpointStore
+from connection_pool import shared_pool
+from copy_loader import CAR_TELEMETRY_COLUMNS, CopyLoader
+from decoder import decode_compressed_data
+from file_tailer import FileTailer
+from line_parser import parse_data_line
+from spool import open_spool
+from statements import NATURAL_KEYS, StatementRegistry
+from telemetry_compression import DEFAULT_TELEMETRY_COMPRESSION, DeadbandFilter, row_key, row_values
+from write_retry import RetryingWriter
+from timestamps import parse_timestamp
+
+# Tópicos processados por este monitor
+MONITORED_TOPICS = {'CarData.z'}
 
 # Flag para controlar o encerramento
 shutdown_requested = False
@@ -29,48 +35,42 @@ def handle_shutdown(signum, frame):
     logger.info(f"Sinal de encerramento recebido ({signum})")
     shutdown_requested = True
 
-def decode_compressed_data(encoded_data):
-    """
-    Decodifica dados da F1 que estão em formato comprimido (base64 + zlib)
-    """
-    try:
-        # Remove aspas se presentes
-        if isinstance(encoded_data, str) and encoded_data.startswith('"') and encoded_data.endswith('"'):
-            encoded_data = encoded_data[1:-1]
-            
-        # Decodifica base64 e descomprime zlib com o wbits negativo (formato específico da F1)
-        decoded_data = zlib.decompress(base64.b64decode(encoded_data), -zlib.MAX_WBITS)
-        
-        # Converte para JSON
-        return json.loads(decoded_data)
-    except Exception as e:
-        logger.error(f"Erro ao decodificar dados: {e}")
-        raise
-
 class TelemetryProcessor:
     """Processa dados de telemetria dos carros e insere no banco de dados"""
     
     def __init__(self, session_id: int, conn_string: str):
         self.session_id = session_id
         self.conn_string = conn_string
-        self.conn = None
+        self.pool = None
+        # INSERTs nomeados, preparados por conexão quando o pooler permite
+        self.statements = StatementRegistry(conn_string)
         self.processed_count = 0
         self.connected = False
+        self.copy_loader = CopyLoader(statements=self.statements, skip_conflicts=NATURAL_KEYS)
+        # Novas tentativas e divisão dos lotes rejeitados; linhas inválidas vão para o dead-letter
+        self.retrying = RetryingWriter()
+        # Linhas agrupadas em micro-lotes (WRITER_MAX_ROWS linhas ou WRITER_MAX_DELAY_MS)
+        self.writer = BufferedWriter(self._write_or_spool, name='car_telemetry')
+        # Micro-lotes que não chegam ao banco (queda ou lentidão) vão para o spool local
+        self.spool, self.drainer = open_spool(f'car_telemetry-{session_id}', {'car_telemetry': self._write_rows})
+        # Compressão opcional: amostras dentro da banda morta não são gravadas (TELEMETRY_COMPRESSION)
+        self.compressor = DeadbandFilter(row_key, row_values) if DEFAULT_TELEMETRY_COMPRESSION else None
+        self.source_position = None  # Posição de onde as linhas em processamento podem ser relidas
         self.drivers_processed = set()  # Para estatísticas
     
     async def connect(self):
         """Estabelece conexão com o banco de dados"""
         try:
-            self.conn = await asyncpg.connect(
-                dsn=self.conn_string,
-                ssl="require"
-            )
+            # Pool compartilhado pelos processadores do processo, com reconexão automática
+            self.pool = await shared_pool(self.conn_string)
             self.connected = True
+            if self.drainer:
+                self.drainer.start()
             logger.info(f"Conexão com o banco de dados estabelecida para session_id={self.session_id}")
             
             # Verifica sessão
             try:
-                session = await self.conn.fetchrow(
+                session = await self.pool.fetchrow(
                     "SELECT id, name, type FROM public.sessions WHERE id = $1",
                     self.session_id
                 )
@@ -98,10 +98,8 @@ class TelemetryProcessor:
         # Parse do timestamp
         if timestamp_str:
             try:
-                # Primeiro parse como timezone-aware
-                aware_dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                # Depois converte para naive removendo a informação de fuso horário
-                timestamp = aware_dt.replace(tzinfo=None)
+                # UTC sem informação de fuso horário (coluna timestamp without time zone)
+                timestamp = parse_timestamp(timestamp_str, aware=False)
             except ValueError:
                 timestamp = datetime.now()
         else:
@@ -110,13 +108,14 @@ class TelemetryProcessor:
         # Decodifica os dados
         try:
             try:
-                # Decodificar dados no formato específico da F1
-                data = decode_compressed_data(encoded_data)
+                # Decodificar dados no formato específico da F1 (o serviço de ingestão já entrega decodificado)
+                data = decode_compressed_data(encoded_data) if isinstance(encoded_data, str) else encoded_data
             except Exception as e:
                 logger.error(f"Falha ao decodificar dados de telemetria: {e}")
                 return 0
             
-            telemetry_inserted = 0
+            rows = []
+            created_at = datetime.now()
             
             # Extrai os dados de telemetria
             if "Entries" in data:
@@ -127,7 +126,7 @@ class TelemetryProcessor:
                         entry_time_str = entry["Utc"]
                         try:
                             # Converter o timestamp de string para datetime
-                            entry_time = datetime.fromisoformat(entry_time_str.replace('Z', '+00:00')).replace(tzinfo=None)
+                            entry_time = parse_timestamp(entry_time_str, aware=False)
                         except ValueError:
                             logger.warning(f"Formato de timestamp inválido: {entry_time_str}, usando timestamp principal")
                             entry_time = timestamp
@@ -146,22 +145,20 @@ class TelemetryProcessor:
                                 brake = channels.get("5")
                                 drs = channels.get("45")
                                 
-                                # Insere no banco de dados
-                                await self.conn.execute("""
-                                    INSERT INTO public.car_telemetry (
-                                        timestamp, utc_timestamp, session_id, driver_number,
-                                        rpm, speed, gear, throttle, brake, drs,
-                                        created_at, updated_at
-                                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-                                """,
+                                rows.append((
                                     timestamp, entry_time, self.session_id, str(driver_number),
                                     rpm, speed, gear, throttle, brake, drs,
-                                    datetime.now(), datetime.now()
-                                )
-                                
-                                telemetry_inserted += 1
+                                    created_at, created_at
+                                ))
                                 self.drivers_processed.add(str(driver_number))
             
+            if self.compressor:
+                rows = self.compressor.filter(rows, self.source_position)
+            
+            # As linhas da mensagem vão para o buffer; a gravação (COPY) é feita em micro-lotes
+            await self.writer.extend(rows)
+            telemetry_inserted = len(rows)
+            
             if telemetry_inserted > 0:
                 self.processed_count += telemetry_inserted
                 # Log apenas a cada 50 processamentos para não sobrecarregar
@@ -176,29 +173,42 @@ class TelemetryProcessor:
             logger.debug(f"Detalhes: {traceback.format_exc()}")
             return 0
         
-    async def close(self):
-        """Fecha a conexão com o banco de dados"""
-        if self.conn:
-            await self.conn.close()
-            logger.info("Conexão com o banco de dados fechada")
-
-def parse_data_line(line: str) -> Tuple[str, Any, str]:
-    """Analisa uma linha de dados no formato específico"""
-    try:
-        # Use ast.literal_eval para processar seguramente a lista Python
-        parsed_data = ast.literal_eval(line)
-        
-        # Formato esperado: [tópico, dados, timestamp]
-        if isinstance(parsed_data, list) and len(parsed_data) >= 3:
-            topic = parsed_data[0]
-            data = parsed_data[1]
-            timestamp = parsed_data[2]
-            return topic, data, timestamp
-        
-        raise ValueError("Formato de dados inesperado")
+    async def _write_rows(self, rows: List[tuple]) -> None:
+        """Grava um micro-lote de linhas na tabela car_telemetry"""
+        await self.pool.run(self.retrying.write, 'car_telemetry', rows, self.copy_loader.load, 'car_telemetry', CAR_TELEMETRY_COLUMNS)
     
-    except Exception as e:
-        raise ValueError(f"Erro ao analisar linha: {e}")
+    async def _write_or_spool(self, rows: List[tuple]) -> None:
+        """Grava o micro-lote no banco ou, se o banco estiver fora ou lento, no spool local"""
+        if self.spool:
+            await self.spool.write_through('car_telemetry', self._write_rows, rows)
+        else:
+            await self._write_rows(rows)
+    
+    def checkpoint_position(self, position: tuple) -> Optional[tuple]:
+        """Posição que pode ir para o checkpoint depois das linhas lidas até ``position``"""
+        return self.compressor.safe_position(position) if self.compressor else position
+    
+    async def close(self, on_flushed: Optional[Callable[[], None]] = None):
+        """Grava as linhas pendentes (e então executa ``on_flushed``) e fecha a conexão com o banco de dados"""
+        if self.compressor:
+            # Última amostra dos trechos constantes ainda retidos
+            await self.writer.extend(self.compressor.flush())
+            self.compressor.report()
+        if on_flushed:
+            self.writer.when_flushed(on_flushed)
+        await self.writer.close()
+        self.writer.report()
+        if self.drainer:
+            await self.drainer.stop()
+            self.drainer.report()
+            await self.spool.close()
+        self.statements.report()
+        self.retrying.report()
+        self.retrying.dead_letter.close()
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Conexão com o banco de dados liberada")
 
 async def monitor_telemetry(input_file: str, session_id: int):
     """Monitora um arquivo de dados F1 para telemetria dos carros"""
@@ -224,6 +234,11 @@ async def monitor_telemetry(input_file: str, session_id: int):
     # Inicializa o processador
     processor = TelemetryProcessor(session_id=session_id, conn_string=conn_string)
     
+    # Leitura contínua do arquivo, retomando do último checkpoint desta sessão
+    checkpoints = CheckpointStore()
+    consumer = f"monitor_car_telemetry-{session_id}"
+    tailer = FileTailer(input_file, start_position=checkpoints.resume_position(consumer, input_file))
+    
     try:
         # Conecta ao banco de dados
         await processor.connect()
@@ -232,9 +247,6 @@ async def monitor_telemetry(input_file: str, session_id: int):
         if not os.path.exists(input_file):
             logger.warning(f"Arquivo {input_file} não encontrado. Aguardando sua criação...")
         
-        # Posição da última leitura
-        last_position = 0
-        
         # Estatísticas
         start_time = time.time()
         last_report_time = start_time
@@ -244,42 +256,37 @@ async def monitor_telemetry(input_file: str, session_id: int):
         # Loop principal de monitoramento
         while not shutdown_requested:
             try:
-                # Verifica se o arquivo existe
-                if not os.path.exists(input_file):
-                    await asyncio.sleep(1)
-                    continue
-                
-                # Obtém tamanho atual do arquivo
-                file_size = os.path.getsize(input_file)
+                # Aguarda novas linhas (acorda por evento de escrita ou após o timeout);
+                # as amostras retidas pela compressão podem ser relidas a partir daqui
+                processor.source_position = read_position(tailer)
+                lines = await tailer.read_batch()
+                total_lines += len(lines)
                 
-                # Se há novos dados
-                if file_size > last_position:
-                    with open(input_file, 'r') as f:
-                        # Move para a última posição lida
-                        f.seek(last_position)
-                        
-                        # Lê as novas linhas
-                        lines = f.readlines()
-                        last_position = f.tell()
-                        
-                        total_lines += len(lines)
-                        
-                        # Processsa cada linha
-                        for line in lines:
-                            try:
-                                # Analisa a linha no formato específico
-                                topic, data, timestamp = parse_data_line(line)
-                                
-                                # Se for dados de telemetria, processa
-                                if topic == 'CarData.z':
-                                    count = await processor.process_telemetry_data(topic, data, timestamp)
-                                    telemetry_found += count
-                            except ValueError:
-                                # Ignora erros de linhas malformadas
-                                pass
-                            except Exception as e:
-                                logger.error(f"Erro ao processar linha: {e}")
+                # Processa cada linha
+                for line in lines:
+                    try:
+                        # Analisa a linha no formato específico, descartando outros tópicos
+                        record = parse_data_line(line, MONITORED_TOPICS)
+                        if record is None:
+                            continue
+                        topic, data, timestamp = record
+
+                        # Se for dados de telemetria, processa
+                        if topic == 'CarData.z':
+                            count = await processor.process_telemetry_data(topic, data, timestamp)
+                            telemetry_found += count
+                    except ValueError:
+                        # Ignora erros de linhas malformadas
+                        pass
+                    except Exception as e:
+                        logger.error(f"Erro ao processar linha: {e}")
                 
+                # Registra o progresso somente depois que as linhas do lote forem gravadas
+                # (sem passar do ponto de onde as amostras retidas pela compressão podem ser relidas)
+                position = processor.checkpoint_position(read_position(tailer))
+                if lines and position:
+                    processor.writer.when_flushed(checkpoint_callback(checkpoints, consumer, tailer, position))
+
                 # Relatório periódico
                 current_time = time.time()
                 if current_time - last_report_time >= 60:  # a cada minuto
@@ -290,16 +297,18 @@ async def monitor_telemetry(input_file: str, session_id: int):
                     logger.info(f"Registros de telemetria encontrados: {telemetry_found}")
                     logger.info(f"Registros de telemetria inseridos: {processor.processed_count}")
                     logger.info(f"Pilotos rastreados: {len(processor.drivers_processed)}")
+                    processor.writer.report()
+                    if processor.compressor:
+                        processor.compressor.report()
+                    if processor.drainer:
+                        processor.drainer.report()
                     
-                    if file_size > 0:
-                        logger.info(f"Tamanho do arquivo: {file_size/1024:.1f} KB")
-                        logger.info(f"Posição atual: {last_position/1024:.1f} KB ({last_position/file_size*100:.1f}%)")
+                    if tailer.file_size > 0:
+                        logger.info(f"Tamanho do arquivo: {tailer.file_size/1024:.1f} KB")
+                        logger.info(f"Posição atual: {tailer.position/1024:.1f} KB ({tailer.position/tailer.file_size*100:.1f}%)")
                     
                     last_report_time = current_time
                 
-                # Pequena pausa
-                await asyncio.sleep(0.5)
-                
             except asyncio.CancelledError:
                 logger.info("Monitoramento cancelado")
                 break
@@ -322,11 +331,18 @@ async def monitor_telemetry(input_file: str, session_id: int):
         logger.debug(traceback.format_exc())
     
     finally:
-        # Fecha a conexão
-        await processor.close()
+        # Fecha o arquivo e a conexão; com as amostras retidas gravadas, o checkpoint alcança a posição lida
+        final_checkpoint = checkpoint_callback(checkpoints, consumer, tailer)
+        tailer.close()
+        await processor.close(final_checkpoint)
         logger.info("Monitoramento encerrado")
 
 if __name__ == "__main__":
+    # Configurar o logger
+    logger.remove()
+    logger.add("f1_telemetry.log", rotation="10 MB", level="DEBUG")
+    logger.add(lambda msg: print(msg), level="INFO")
+    
     parser = argparse.ArgumentParser(description='Monitora telemetria dos carros da F1')
     parser.add_argument('--session-id', type=int, required=True, help='ID da sessão')
     parser.add_argument('--input-file', type=str, default='f1_data.txt', help='Arquivo de entrada')
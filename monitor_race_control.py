@@ -3,19 +3,24 @@ import os
 import signal
 import time
 import traceback
-import ast  # Para avaliar expressões Python com segurança
 import argparse
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional, List, Tuple
 from dotenv import load_dotenv
 
 from loguru import logger
-import asyncpg
 
-# Configurar o logger
-logger.remove()
-logger.add("f1_race_control.log", rotation="10 MB", level="DEBUG")
-logger.add(lambda msg: print(msg), level="INFO")
+from checkpoint import CheckpointStore
+from connection_pool import shared_pool
+from file_tailer import FileTailer
+from line_parser import parse_data_line
+from spool import open_spool
+from statements import StatementRegistry
+from write_retry import RetryingWriter
+from timestamps import parse_timestamp
+
+# Tópicos processados por este monitor
+MONITORED_TOPICS = {'RaceControlMessages'}
 
 # Flag para controlar o encerramento
 shutdown_requested = False
@@ -32,24 +37,31 @@ class RaceControlProcessor:
     def __init__(self, session_id: int, conn_string: str):
         self.session_id = session_id
         self.conn_string = conn_string
-        self.conn = None
+        self.pool = None
+        # INSERTs nomeados, preparados por conexão quando o pooler permite
+        self.statements = StatementRegistry(conn_string)
+        # Novas tentativas e divisão dos lotes rejeitados; linhas inválidas vão para o dead-letter
+        self.retrying = RetryingWriter()
         self.processed_count = 0
         self.connected = False
-        self.processed_ids = set()  # Para evitar duplicações
+        # Linhas que não chegam ao banco (queda ou lentidão) vão para o spool local
+        self.spool, self.drainer = open_spool(f'race_control_messages-{session_id}', {'race_control_messages': self._write_rows})
+        # Chaves naturais (utc_time, category, message) já gravadas, para evitar duplicações
+        self.processed_keys = set()
     
     async def connect(self):
         """Estabelece conexão com o banco de dados"""
         try:
-            self.conn = await asyncpg.connect(
-                dsn=self.conn_string,
-                ssl="require"
-            )
+            # Pool compartilhado pelos processadores do processo, com reconexão automática
+            self.pool = await shared_pool(self.conn_string)
             self.connected = True
+            if self.drainer:
+                self.drainer.start()
             logger.info(f"Conexão com o banco de dados estabelecida para session_id={self.session_id}")
             
             # Verifica quais colunas existem na tabela sessions
             try:
-                columns = await self.conn.fetch("""
+                columns = await self.pool.fetch("""
                     SELECT column_name 
                     FROM information_schema.columns 
                     WHERE table_schema = 'public' AND table_name = 'sessions'
@@ -70,7 +82,7 @@ class RaceControlProcessor:
                 query = f"SELECT {', '.join(fields)} FROM public.sessions WHERE id = $1"
                 
                 # Verifica se a sessão existe
-                session = await self.conn.fetchrow(query, self.session_id)
+                session = await self.pool.fetchrow(query, self.session_id)
                 
                 if session:
                     session_info = ", ".join([f"{k}={session[k]}" for k in session.keys() if k != 'id'])
@@ -82,13 +94,17 @@ class RaceControlProcessor:
                 logger.error(f"Erro ao verificar sessão: {e}")
                 logger.info("Continuando sem verificar sessão...")
                 
-            # Carregar mensagens já processadas para evitar duplicações
+            # Carregar mensagens já gravadas para evitar duplicações após um reinício
             try:
-                existing_messages = await self.conn.fetch("""
-                    SELECT id FROM public.race_control_messages
+                existing_messages = await self.pool.fetch("""
+                    SELECT utc_time, category, message FROM public.race_control_messages
                     WHERE session_id = $1
                 """, self.session_id)
                 
+                self.processed_keys.update(
+                    self._message_key(row['utc_time'], row['category'], row['message'])
+                    for row in existing_messages
+                )
                 logger.info(f"Encontradas {len(existing_messages)} mensagens existentes para a sessão {self.session_id}")
             except Exception as e:
                 logger.error(f"Erro ao carregar mensagens existentes: {e}")
@@ -109,7 +125,7 @@ class RaceControlProcessor:
         if timestamp_str:
             try:
                 # Este timestamp pode incluir fuso horário
-                event_timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+                event_timestamp = parse_timestamp(timestamp_str)
             except ValueError:
                 event_timestamp = datetime.now()
         else:
@@ -118,35 +134,34 @@ class RaceControlProcessor:
         processed_count = 0
         
         try:
-            # As mensagens estão em um dicionário aninhado
-            messages_dict = data.get('Messages', {})
+            # A primeira mensagem da sessão chega como lista; as seguintes, como dicionário por índice
+            messages = data.get('Messages', {})
+            if isinstance(messages, list):
+                messages = dict(enumerate(messages))
             
-            for msg_id, msg_data in messages_dict.items():
-                # Verifica se já processamos esta mensagem
-                if msg_id in self.processed_ids:
-                    continue
-                
+            for msg_data in messages.values():
                 # Extrai os campos da mensagem
                 utc_time = msg_data.get('Utc', '')
                 category = msg_data.get('Category', '')
                 message = msg_data.get('Message', '')
+                
+                # Verifica se já processamos esta mensagem (nesta execução ou antes de um reinício)
+                key = self._message_key(utc_time, category, message)
+                if key in self.processed_keys:
+                    continue
+                
                 flag = msg_data.get('Flag', None)
                 scope = msg_data.get('Scope', None)
                 sector = self._parse_int(msg_data.get('Sector', None))
                 
-                # Insere no banco de dados
-                await self.conn.execute("""
-                    INSERT INTO public.race_control_messages (
-                        session_id, timestamp, utc_time, category, message,
-                        flag, scope, sector, created_at, updated_at
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                """,
+                # Insere no banco de dados (ON CONFLICT DO NOTHING na chave natural)
+                await self._write_or_spool([(
                     self.session_id, event_timestamp, utc_time, category, message,
                     flag, scope, sector, datetime.now(), datetime.now()
-                )
+                )])
                 
                 # Marca como processada
-                self.processed_ids.add(msg_id)
+                self.processed_keys.add(key)
                 processed_count += 1
                 
                 logger.debug(f"Mensagem inserida: {utc_time} - {category} - {message[:50]}...")
@@ -163,6 +178,17 @@ class RaceControlProcessor:
             logger.debug(f"Dados que causaram o erro: {data}")
             return 0
     
+    def _message_key(self, utc_time: Any, category: str, message: str) -> Tuple:
+        """Chave natural da mensagem, com o horário normalizado (texto ou timestamp do banco)"""
+        if isinstance(utc_time, str) and utc_time:
+            try:
+                utc_time = parse_timestamp(utc_time, aware=False)
+            except ValueError:
+                pass
+        elif isinstance(utc_time, datetime) and utc_time.tzinfo:
+            utc_time = utc_time.astimezone(timezone.utc).replace(tzinfo=None)
+        return utc_time, category, message
+    
     def _parse_int(self, value: Any) -> Optional[int]:
         """Converte valor para inteiro ou retorna None"""
         if value is None or value == '':
@@ -173,29 +199,30 @@ class RaceControlProcessor:
         except (ValueError, TypeError):
             return None
     
+    async def _write_rows(self, rows: List[tuple]) -> None:
+        """Grava as linhas na tabela race_control_messages em um único envio"""
+        await self.pool.run(self.retrying.write, 'race_control_messages', rows, self.statements.executemany, 'race_control_messages')
+    
+    async def _write_or_spool(self, rows: List[tuple]) -> None:
+        """Grava as linhas no banco ou, se o banco estiver fora ou lento, no spool local"""
+        if self.spool:
+            await self.spool.write_through('race_control_messages', self._write_rows, rows)
+        else:
+            await self._write_rows(rows)
+    
     async def close(self):
         """Fecha a conexão com o banco de dados"""
-        if self.conn:
-            await self.conn.close()
-            logger.info("Conexão com o banco de dados fechada")
-
-def parse_data_line(line: str) -> Tuple[str, Dict, str]:
-    """Analisa uma linha de dados no formato específico"""
-    try:
-        # Use ast.literal_eval para processar seguramente a lista Python
-        parsed_data = ast.literal_eval(line)
-        
-        # Formato esperado: [tópico, dados, timestamp]
-        if isinstance(parsed_data, list) and len(parsed_data) >= 3:
-            topic = parsed_data[0]
-            data = parsed_data[1]
-            timestamp = parsed_data[2]
-            return topic, data, timestamp
-        
-        raise ValueError("Formato de dados inesperado")
-    
-    except Exception as e:
-        raise ValueError(f"Erro ao analisar linha: {e}")
+        if self.drainer:
+            await self.drainer.stop()
+            self.drainer.report()
+            await self.spool.close()
+        self.statements.report()
+        self.retrying.report()
+        self.retrying.dead_letter.close()
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Conexão com o banco de dados liberada")
 
 async def monitor_race_control(input_file: str, session_id: int):
     """Monitora um arquivo de dados F1 para mensagens de controle de corrida"""
@@ -221,6 +248,11 @@ async def monitor_race_control(input_file: str, session_id: int):
     # Inicializa o processador de mensagens de controle
     processor = RaceControlProcessor(session_id=session_id, conn_string=conn_string)
     
+    # Leitura contínua do arquivo, retomando do último checkpoint desta sessão
+    checkpoints = CheckpointStore()
+    consumer = f"monitor_race_control-{session_id}"
+    tailer = FileTailer(input_file, start_position=checkpoints.resume_position(consumer, input_file))
+    
     try:
         # Conecta ao banco de dados
         await processor.connect()
@@ -229,9 +261,6 @@ async def monitor_race_control(input_file: str, session_id: int):
         if not os.path.exists(input_file):
             logger.warning(f"Arquivo {input_file} não encontrado. Aguardando sua criação...")
         
-        # Posição da última leitura
-        last_position = 0
-        
         # Estatísticas
         start_time = time.time()
         last_report_time = start_time
@@ -241,42 +270,33 @@ async def monitor_race_control(input_file: str, session_id: int):
         # Loop principal de monitoramento
         while not shutdown_requested:
             try:
-                # Verifica se o arquivo existe
-                if not os.path.exists(input_file):
-                    await asyncio.sleep(1)
-                    continue
+                # Aguarda novas linhas (acorda por evento de escrita ou após o timeout)
+                lines = await tailer.read_batch()
+                total_lines += len(lines)
                 
-                # Obtém tamanho atual do arquivo
-                file_size = os.path.getsize(input_file)
-                
-                # Se há novos dados
-                if file_size > last_position:
-                    with open(input_file, 'r') as f:
-                        # Move para a última posição lida
-                        f.seek(last_position)
-                        
-                        # Lê as novas linhas
-                        lines = f.readlines()
-                        last_position = f.tell()
-                        
-                        total_lines += len(lines)
-                        
-                        # Processa as linhas
-                        for line in lines:
-                            try:
-                                # Analisa a linha no formato específico
-                                topic, data, timestamp = parse_data_line(line)
-                                
-                                # Se for mensagens de controle, processa
-                                if topic == 'RaceControlMessages':
-                                    msgs_count = await processor.process_race_control(topic, data, timestamp)
-                                    control_msgs_found += msgs_count
-                            except ValueError:
-                                # Ignora erros de linhas malformadas
-                                pass
-                            except Exception as e:
-                                logger.error(f"Erro ao processar linha: {e}")
+                # Processa as linhas
+                for line in lines:
+                    try:
+                        # Analisa a linha no formato específico, descartando outros tópicos
+                        record = parse_data_line(line, MONITORED_TOPICS)
+                        if record is None:
+                            continue
+                        topic, data, timestamp = record
+
+                        # Se for mensagens de controle, processa
+                        if topic == 'RaceControlMessages':
+                            msgs_count = await processor.process_race_control(topic, data, timestamp)
+                            control_msgs_found += msgs_count
+                    except ValueError:
+                        # Ignora erros de linhas malformadas
+                        pass
+                    except Exception as e:
+                        logger.error(f"Erro ao processar linha: {e}")
                 
+                # Registra o progresso somente depois que o lote foi processado
+                if lines:
+                    tailer.save_checkpoint(checkpoints, consumer)
+
                 # Relatório periódico
                 current_time = time.time()
                 if current_time - last_report_time >= 60:  # a cada minuto
@@ -286,16 +306,15 @@ async def monitor_race_control(input_file: str, session_id: int):
                     logger.info(f"Linhas processadas: {total_lines}")
                     logger.info(f"Mensagens de controle encontradas: {control_msgs_found}")
                     logger.info(f"Mensagens de controle inseridas: {processor.processed_count}")
+                    if processor.drainer:
+                        processor.drainer.report()
                     
-                    if file_size > 0:
-                        logger.info(f"Tamanho do arquivo: {file_size/1024:.1f} KB")
-                        logger.info(f"Posição atual: {last_position/1024:.1f} KB ({last_position/file_size*100:.1f}%)")
+                    if tailer.file_size > 0:
+                        logger.info(f"Tamanho do arquivo: {tailer.file_size/1024:.1f} KB")
+                        logger.info(f"Posição atual: {tailer.position/1024:.1f} KB ({tailer.position/tailer.file_size*100:.1f}%)")
                     
                     last_report_time = current_time
                 
-                # Pequena pausa
-                await asyncio.sleep(0.5)
-                
             except asyncio.CancelledError:
                 logger.info("Monitoramento cancelado")
                 break
@@ -317,11 +336,17 @@ async def monitor_race_control(input_file: str, session_id: int):
         logger.debug(traceback.format_exc())
     
     finally:
-        # Fecha a conexão
+        # Fecha o arquivo e a conexão
+        tailer.close()
         await processor.close()
         logger.info("Monitoramento encerrado")
 
 if __name__ == "__main__":
+    # Configurar o logger
+    logger.remove()
+    logger.add("f1_race_control.log", rotation="10 MB", level="DEBUG")
+    logger.add(lambda msg: print(msg), level="INFO")
+    
     parser = argparse.ArgumentParser(description='Monitora mensagens de controle de corrida da F1')
     parser.add_argument('--session-id', type=int, required=True, help='ID da sessão')
     parser.add_argument('--input-file', type=str, default='f1_data.txt', help='Arquivo de entrada')
@@ -3,19 +3,24 @@ import os
 import signal
 import time
 import traceback
-import ast  # Para avaliar expressões Python com segurança
 import argparse
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List
 from dotenv import load_dotenv
 
 from loguru import logger
-import asyncpg
 
-# Configurar o logger
-logger.remove()
-logger.add("f1_weather_extractor.log", rotation="10 MB", level="DEBUG")
-logger.add(lambda msg: print(msg), level="INFO")
+from checkpoint import CheckpointStore
+from connection_pool import shared_pool
+from file_tailer import FileTailer
+from line_parser import parse_data_line
+from spool import open_spool
+from statements import StatementRegistry
+from write_retry import RetryingWriter
+from timestamps import parse_timestamp
+
+# Tópicos processados por este monitor
+MONITORED_TOPICS = {'WeatherData'}
 
 # Flag para controlar o encerramento
 shutdown_requested = False
@@ -32,23 +37,29 @@ class WeatherDataProcessor:
     def __init__(self, session_id: int, conn_string: str):
         self.session_id = session_id
         self.conn_string = conn_string
-        self.conn = None
+        self.pool = None
+        # INSERTs nomeados, preparados por conexão quando o pooler permite
+        self.statements = StatementRegistry(conn_string)
+        # Novas tentativas e divisão dos lotes rejeitados; linhas inválidas vão para o dead-letter
+        self.retrying = RetryingWriter()
         self.processed_count = 0
         self.connected = False
+        # Linhas que não chegam ao banco (queda ou lentidão) vão para o spool local
+        self.spool, self.drainer = open_spool(f'weather_data-{session_id}', {'weather_data': self._write_rows})
     
     async def connect(self):
         """Estabelece conexão com o banco de dados"""
         try:
-            self.conn = await asyncpg.connect(
-                dsn=self.conn_string,
-                ssl="require"
-            )
+            # Pool compartilhado pelos processadores do processo, com reconexão automática
+            self.pool = await shared_pool(self.conn_string)
             self.connected = True
+            if self.drainer:
+                self.drainer.start()
             logger.info(f"Conexão com o banco de dados estabelecida para session_id={self.session_id}")
             
             # Verifica se a sessão existe (usando campos corretos da tabela sessions)
             try:
-                session = await self.conn.fetchrow(
+                session = await self.pool.fetchrow(
                     "SELECT id, key, name, type FROM public.sessions WHERE id = $1",
                     self.session_id
                 )
@@ -63,7 +74,7 @@ class WeatherDataProcessor:
                 
             # Verifica a estrutura da tabela weather_data
             try:
-                weather_columns = await self.conn.fetch("""
+                weather_columns = await self.pool.fetch("""
                     SELECT column_name, data_type
                     FROM information_schema.columns
                     WHERE table_schema = 'public' AND table_name = 'weather_data'
@@ -93,9 +104,8 @@ class WeatherDataProcessor:
             # Parse do timestamp - IMPORTANTE: usar timestamp without time zone 
             if timestamp_str:
                 try:
-                    # Parse como timezone-aware e depois converte para naive
-                    aware_dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                    timestamp = aware_dt.replace(tzinfo=None)  # Remove timezone info
+                    # UTC sem informação de fuso horário
+                    timestamp = parse_timestamp(timestamp_str, aware=False)
                 except ValueError:
                     timestamp = datetime.now()
             else:
@@ -122,18 +132,12 @@ class WeatherDataProcessor:
             now = datetime.now()
             
             # Inserir no banco de dados usando a estrutura correta da tabela weather_data
-            await self.conn.execute("""
-                INSERT INTO public.weather_data (
-                    session_id, timestamp, air_temp, track_temp, humidity,
-                    pressure, rainfall, wind_direction, wind_speed,
-                    created_at, updated_at
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-            """,
-                self.session_id, timestamp, 
+            await self._write_or_spool([(
+                self.session_id, timestamp,
                 fields['air_temp'], fields['track_temp'], fields['humidity'],
-                fields['pressure'], fields['rainfall'], fields['wind_direction'], fields['wind_speed'],
+                fields['pressure'], fields['wind_speed'], fields['wind_direction'], fields['rainfall'],
                 now, now
-            )
+            )])
             
             self.processed_count += 1
             if self.processed_count % 10 == 0:
@@ -172,29 +176,30 @@ class WeatherDataProcessor:
         except (ValueError, TypeError):
             return None
     
+    async def _write_rows(self, rows: List[tuple]) -> None:
+        """Grava as linhas na tabela weather_data em um único envio"""
+        await self.pool.run(self.retrying.write, 'weather_data', rows, self.statements.executemany, 'weather_data')
+    
+    async def _write_or_spool(self, rows: List[tuple]) -> None:
+        """Grava as linhas no banco ou, se o banco estiver fora ou lento, no spool local"""
+        if self.spool:
+            await self.spool.write_through('weather_data', self._write_rows, rows)
+        else:
+            await self._write_rows(rows)
+    
     async def close(self):
         """Fecha a conexão com o banco de dados"""
-        if self.conn:
-            await self.conn.close()
-            logger.info("Conexão com o banco de dados fechada")
-
-def parse_data_line(line: str) -> Tuple[str, Dict, str]:
-    """Analisa uma linha de dados no formato específico"""
-    try:
-        # Use ast.literal_eval para processar seguramente a lista Python
-        parsed_data = ast.literal_eval(line)
-        
-        # Formato esperado: [tópico, dados, timestamp]
-        if isinstance(parsed_data, list) and len(parsed_data) >= 3:
-            topic = parsed_data[0]
-            data = parsed_data[1]
-            timestamp = parsed_data[2]
-            return topic, data, timestamp
-        
-        raise ValueError("Formato de dados inesperado")
-    
-    except Exception as e:
-        raise ValueError(f"Erro ao analisar linha: {e}")
+        if self.drainer:
+            await self.drainer.stop()
+            self.drainer.report()
+            await self.spool.close()
+        self.statements.report()
+        self.retrying.report()
+        self.retrying.dead_letter.close()
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Conexão com o banco de dados liberada")
 
 async def monitor_weather_data(input_file: str, session_id: int):
     """Monitora um arquivo de dados F1 para dados meteorológicos"""
@@ -220,6 +225,11 @@ async def monitor_weather_data(input_file: str, session_id: int):
     # Inicializa o processador de dados meteorológicos
     processor = WeatherDataProcessor(session_id=session_id, conn_string=conn_string)
     
+    # Leitura contínua do arquivo, retomando do último checkpoint desta sessão
+    checkpoints = CheckpointStore()
+    consumer = f"monitor_weather-{session_id}"
+    tailer = FileTailer(input_file, start_position=checkpoints.resume_position(consumer, input_file))
+    
     try:
         # Conecta ao banco de dados
         await processor.connect()
@@ -228,9 +238,6 @@ async def monitor_weather_data(input_file: str, session_id: int):
         if not os.path.exists(input_file):
             logger.warning(f"Arquivo {input_file} não encontrado. Aguardando sua criação...")
         
-        # Posição da última leitura
-        last_position = 0
-        
         # Estatísticas
         start_time = time.time()
         last_report_time = start_time
@@ -240,43 +247,34 @@ async def monitor_weather_data(input_file: str, session_id: int):
         # Loop principal de monitoramento
         while not shutdown_requested:
             try:
-                # Verifica se o arquivo existe
-                if not os.path.exists(input_file):
-                    await asyncio.sleep(1)
-                    continue
-                
-                # Obtém tamanho atual do arquivo
-                file_size = os.path.getsize(input_file)
+                # Aguarda novas linhas (acorda por evento de escrita ou após o timeout)
+                lines = await tailer.read_batch()
+                total_lines += len(lines)
                 
-                # Se há novos dados
-                if file_size > last_position:
-                    with open(input_file, 'r') as f:
-                        # Move para a última posição lida
-                        f.seek(last_position)
-                        
-                        # Lê as novas linhas
-                        lines = f.readlines()
-                        last_position = f.tell()
-                        
-                        total_lines += len(lines)
-                        
-                        # Processa as linhas
-                        for line in lines:
-                            try:
-                                # Analisa a linha no formato específico
-                                topic, data, timestamp = parse_data_line(line)
-                                
-                                # Se for dados meteorológicos, processa
-                                if topic == 'WeatherData':
-                                    success = await processor.process_weather_data(topic, data, timestamp)
-                                    if success:
-                                        weather_data_found += 1
-                            except ValueError as e:
-                                # Ignora erros de linhas malformadas
-                                pass
-                            except Exception as e:
-                                logger.error(f"Erro ao processar linha: {e}")
+                # Processa as linhas
+                for line in lines:
+                    try:
+                        # Analisa a linha no formato específico, descartando outros tópicos
+                        record = parse_data_line(line, MONITORED_TOPICS)
+                        if record is None:
+                            continue
+                        topic, data, timestamp = record
+
+                        # Se for dados meteorológicos, processa
+                        if topic == 'WeatherData':
+                            success = await processor.process_weather_data(topic, data, timestamp)
+                            if success:
+                                weather_data_found += 1
+                    except ValueError as e:
+                        # Ignora erros de linhas malformadas
+                        pass
+                    except Exception as e:
+                        logger.error(f"Erro ao processar linha: {e}")
                 
+                # Registra o progresso somente depois que o lote foi processado
+                if lines:
+                    tailer.save_checkpoint(checkpoints, consumer)
+
                 # Relatório periódico
                 current_time = time.time()
                 if current_time - last_report_time >= 60:  # a cada minuto
@@ -286,16 +284,15 @@ async def monitor_weather_data(input_file: str, session_id: int):
                     logger.info(f"Linhas processadas: {total_lines}")
                     logger.info(f"Registros meteorológicos encontrados: {weather_data_found}")
                     logger.info(f"Registros meteorológicos inseridos: {processor.processed_count}")
+                    if processor.drainer:
+                        processor.drainer.report()
                     
-                    if file_size > 0:
-                        logger.info(f"Tamanho do arquivo: {file_size/1024:.1f} KB")
-                        logger.info(f"Posição atual: {last_position/1024:.1f} KB ({last_position/file_size*100:.1f}%)")
+                    if tailer.file_size > 0:
+                        logger.info(f"Tamanho do arquivo: {tailer.file_size/1024:.1f} KB")
+                        logger.info(f"Posição atual: {tailer.position/1024:.1f} KB ({tailer.position/tailer.file_size*100:.1f}%)")
                     
                     last_report_time = current_time
                 
-                # Pequena pausa
-                await asyncio.sleep(0.5)
-                
             except asyncio.CancelledError:
                 logger.info("Monitoramento cancelado")
                 break
@@ -317,11 +314,17 @@ async def monitor_weather_data(input_file: str, session_id: int):
         logger.debug(traceback.format_exc())
     
     finally:
-        # Fecha a conexão
+        # Fecha o arquivo e a conexão
+        tailer.close()
         await processor.close()
         logger.info("Monitoramento encerrado")
 
 if __name__ == "__main__":
+    # Configurar o logger
+    logger.remove()
+    logger.add("f1_weather_extractor.log", rotation="10 MB", level="DEBUG")
+    logger.add(lambda msg: print(msg), level="INFO")
+    
     parser = argparse.ArgumentParser(description='Monitora dados meteorológicos da F1')
     parser.add_argument('--session-id', type=int, required=True, help='ID da sessão')
     parser.add_argument('--input-file', type=str, default='f1_data.txt', help='Arquivo de entrada')
@@ -21,28 +21,29 @@ def signal_handler(signum, frame):
             process.terminate()
     sys.exit(0)
 
-async def run_monitor(monitor_name: str, session_id: int, input_file: str):
-    """Executa um monitor específico"""
-    script_map = {
-        'weather': 'monitor_weather.py',
-        'telemetry': 'monitor_car_telemetry.py',
-        'positions': 'monitor_car_positions.py',
-        'control': 'monitor_race_control.py'
-    }
-    
-    if monitor_name not in script_map:
+# Monitores aceitos pelo serviço de ingestão
+KNOWN_MONITORS = ['weather', 'telemetry', 'positions', 'control']
+
+async def run_ingestion_service(monitors: list, session_id: int, input_file: str):
+    """Executa um único serviço de ingestão que alimenta todos os monitores"""
+    unknown = [name for name in monitors if name not in KNOWN_MONITORS]
+    for monitor_name in unknown:
         print(f"❌ Monitor '{monitor_name}' não reconhecido")
+    
+    monitors = [name for name in monitors if name in KNOWN_MONITORS]
+    if not monitors:
         return
     
-    script = script_map[monitor_name]
+    script = 'ingestion_service.py'
     
     if not os.path.exists(script):
         print(f"❌ Script {script} não encontrado")
         return
     
-    cmd = [sys.executable, script, '--session-id', str(session_id), '--input-file', input_file]
+    cmd = [sys.executable, script, '--session-id', str(session_id), '--input-file', input_file,
+           '--monitors', ','.join(monitors)]
     
-    print(f"🚀 Iniciando {monitor_name} monitor...")
+    print(f"🚀 Iniciando serviço de ingestão ({', '.join(monitors)})...")
     process = subprocess.Popen(cmd)
     running_processes.append(process)
     
@@ -83,27 +84,24 @@ async def main():
         print(f"⚠️  Arquivo {input_file} não encontrado!")
         print("   Os monitores aguardarão a criação do arquivo...")
     
-    # Inicia todos os monitores
-    tasks = []
-    for monitor in monitors:
-        process = await run_monitor(monitor, session_id, input_file)
-        if process:
-            tasks.append(process)
+    # Inicia um único processo de ingestão: o arquivo é lido e analisado uma
+    # só vez e cada linha é encaminhada ao monitor do seu tópico
+    process = await run_ingestion_service(monitors, session_id, input_file)
     
-    if not tasks:
+    if not process:
         print("❌ Nenhum monitor foi iniciado")
         return
     
-    print(f"\n✅ {len(tasks)} monitores em execução")
+    print(f"\n✅ Serviço de ingestão em execução com {len(monitors)} monitores")
     print("   Pressione Ctrl+C para encerrar todos\n")
     
     # Aguarda todos os processos
     try:
         while True:
             # Verifica se algum processo terminou
-            for i, process in enumerate(running_processes):
+            for process in running_processes:
                 if process.poll() is not None:
-                    print(f"⚠️  Monitor {i+1} terminou com código {process.returncode}")
+                    print(f"⚠️  Serviço de ingestão terminou com código {process.returncode}")
             
             await asyncio.sleep(5)
             
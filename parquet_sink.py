@@ -0,0 +1,296 @@
+"""
+Arquivo colunar (Parquet) dos dados decodificados, por sessão e por tópico.
+
+Ao lado do SupabaseLoader, o ParquetSink recebe os mesmos lotes transformados
+e acumula telemetria, posições, clima e mensagens de controle de corrida em
+buffers colunares. Durante a sessão, cada tópico é gravado em partes
+(``<dir>/<sessão>/<tópico>/part-NNNNN.parquet``, um row group cada) quando o
+buffer atinge ``ARCHIVE_ROW_GROUP_ROWS`` linhas ou a cada
+``ARCHIVE_FLUSH_INTERVAL_S`` segundos; cada parte é gravada em um arquivo
+temporário e renomeada, então as partes já gravadas podem ser lidas durante a
+sessão e uma queda perde apenas o buffer. No encerramento as partes de cada
+tópico são compactadas em um único arquivo ``<dir>/<sessão>/<tópico>.parquet``,
+ordenado por piloto e tempo, com row groups grandes.
+
+A análise offline lê uma corrida inteira com ``read_topic`` (ou diretamente com
+pyarrow/pandas/duckdb), sem consultar o banco:
+
+    python parquet_sink.py f1_archive 2025-05-17-q1
+
+Requer pyarrow (opcional: sem ele o arquivo colunar fica desativado).
+"""
+
+import asyncio
+import glob
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+ARROW_AVAILABLE = pa is not None
+
+# Linhas por row group durante a sessão e intervalo máximo entre gravações de cada tópico
+DEFAULT_ROW_GROUP_ROWS = int(os.getenv("ARCHIVE_ROW_GROUP_ROWS", "50000"))
+DEFAULT_FLUSH_INTERVAL_S = float(os.getenv("ARCHIVE_FLUSH_INTERVAL_S", "60"))
+
+# Row groups do arquivo compactado e compressão das colunas
+DEFAULT_COMPACT_ROW_GROUP_ROWS = int(os.getenv("ARCHIVE_COMPACT_ROW_GROUP_ROWS", "1000000"))
+DEFAULT_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+def _utc(value: Any) -> Optional[datetime]:
+    """Timestamp em UTC sem fuso (como nas colunas do banco)"""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None and value != '' else None
+    except (TypeError, ValueError):
+        return None
+
+def _float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None and value != '' else None
+    except (TypeError, ValueError):
+        return None
+
+def _str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+# Tipo de cada coluna: (conversão do valor do modelo, tipo do pyarrow)
+COLUMN_KINDS = {
+    'timestamp': (_utc, lambda: pa.timestamp('us')),
+    'int': (_int, lambda: pa.int32()),
+    'float': (_float, lambda: pa.float64()),
+    'string': (_str, lambda: pa.string()),
+}
+
+# Tópicos arquivados: chave do lote transformado -> colunas (nome, tipo, atributo do modelo)
+TOPICS: Dict[str, Tuple[Tuple[str, str, str], ...]] = {
+    'telemetry': (
+        ('timestamp', 'timestamp', 'timestamp'), ('driver_number', 'int', 'driver_number'),
+        ('rpm', 'int', 'rpm'), ('speed', 'int', 'speed'), ('gear', 'int', 'gear'),
+        ('throttle', 'float', 'throttle'), ('brake', 'float', 'brake'), ('drs', 'int', 'drs'),
+    ),
+    'car_positions': (
+        ('timestamp', 'timestamp', 'timestamp'), ('utc_time', 'timestamp', 'utc_time'),
+        ('driver_number', 'int', 'driver_number'),
+        ('x', 'float', 'x'), ('y', 'float', 'y'), ('z', 'float', 'z'),
+    ),
+    'positions': (
+        ('timestamp', 'timestamp', 'timestamp'), ('driver_number', 'int', 'driver_number'),
+        ('position', 'int', 'position'),
+    ),
+    'weather': (
+        ('timestamp', 'timestamp', 'timestamp'), ('air_temp', 'float', 'air_temp'),
+        ('track_temp', 'float', 'track_temp'), ('humidity', 'float', 'humidity'),
+        ('pressure', 'float', 'pressure'), ('wind_speed', 'float', 'wind_speed'),
+        ('wind_direction', 'int', 'wind_direction'), ('rainfall', 'float', 'rainfall'),
+    ),
+    'race_control': (
+        ('timestamp', 'timestamp', 'timestamp'), ('utc_time', 'string', 'utc_time'),
+        ('category', 'string', 'category'), ('message', 'string', 'message'),
+        ('flag', 'string', 'flag'), ('driver_number', 'int', 'driver_number'),
+        ('scope', 'string', 'scope'), ('sector', 'int', 'sector'), ('lap_number', 'int', 'lap_number'),
+    ),
+}
+
+def topic_schema(topic: str):
+    """Schema do pyarrow do tópico"""
+    return pa.schema([(name, COLUMN_KINDS[kind][1]()) for name, kind, _ in TOPICS[topic]])
+
+def _sort_keys(topic: str) -> List[Tuple[str, str]]:
+    names = {name for name, _, _ in TOPICS[topic]}
+    keys = [name for name in ('driver_number', 'timestamp') if name in names]
+    return [(name, 'ascending') for name in keys]
+
+class TopicBuffer:
+    """Buffer colunar de um tópico, com os extratores de cada coluna"""
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.columns = [(name, COLUMN_KINDS[kind][0], attrgetter(attribute))
+                        for name, kind, attribute in TOPICS[topic]]
+        self.data: Dict[str, List[Any]] = {name: [] for name, _, _ in self.columns}
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def extend(self, records: Sequence[Any]) -> None:
+        for name, convert, get in self.columns:
+            values = self.data[name]
+            for record in records:
+                values.append(convert(_get(get, record)))
+        self.rows += len(records)
+
+    def take(self) -> Dict[str, List[Any]]:
+        """Entrega as colunas acumuladas e esvazia o buffer"""
+        data = self.data
+        self.data = {name: [] for name, _, _ in self.columns}
+        self.rows = 0
+        self.started = time.monotonic()
+        return data
+
+def _get(getter: Callable[[Any], Any], record: Any) -> Any:
+    try:
+        return getter(record)
+    except AttributeError:
+        # Atributos opcionais (utc_time, scope, lap_number...) nem sempre existem no modelo
+        return None
+
+class ParquetSink:
+    """Grava os lotes transformados em arquivos Parquet por sessão e por tópico"""
+
+    def __init__(self, directory: str, session: str, row_group_rows: int = DEFAULT_ROW_GROUP_ROWS,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL_S, compression: str = DEFAULT_COMPRESSION,
+                 compact_row_group_rows: int = DEFAULT_COMPACT_ROW_GROUP_ROWS):
+        if not ARROW_AVAILABLE:
+            raise RuntimeError("O arquivo Parquet requer pyarrow (pip install pyarrow)")
+
+        self.directory = os.path.join(directory, session)
+        self.session = session
+        self.row_group_rows = max(row_group_rows, 1)
+        self.flush_interval = flush_interval
+        self.compression = compression
+        self.compact_row_group_rows = max(compact_row_group_rows, 1)
+        self.buffers = {topic: TopicBuffer(topic) for topic in TOPICS}
+        self._lock = asyncio.Lock()
+
+        # Métricas
+        self.rows_archived = Counter()
+        self.parts_written = 0
+        self.flush_time = 0.0
+        self.compacted_files = []
+
+    def _topic_dir(self, topic: str) -> str:
+        return os.path.join(self.directory, topic)
+
+    def final_path(self, topic: str) -> str:
+        return os.path.join(self.directory, f'{topic}.parquet')
+
+    def add(self, batch_data: Dict[str, List]) -> None:
+        """Acrescenta os registros do lote aos buffers dos tópicos"""
+        for topic, buffer in self.buffers.items():
+            records = batch_data.get(topic)
+            if records:
+                buffer.extend(records)
+
+    async def write_batch(self, batch_data: Dict[str, List]) -> None:
+        """Acrescenta o lote e grava os tópicos cujo buffer encheu ou passou do intervalo"""
+        self.add(batch_data)
+        await self.flush()
+
+    def _due(self, buffer: TopicBuffer, force: bool) -> bool:
+        if not buffer.rows:
+            return False
+        return (force or buffer.rows >= self.row_group_rows
+                or time.monotonic() - buffer.started >= self.flush_interval)
+
+    async def flush(self, force: bool = False) -> None:
+        """Grava uma parte (um row group) de cada tópico pendente, fora do loop de eventos"""
+        async with self._lock:
+            for topic, buffer in self.buffers.items():
+                if self._due(buffer, force):
+                    rows = buffer.rows
+                    await asyncio.to_thread(self._write_part, topic, buffer.take())
+                    self.rows_archived[topic] += rows
+
+    def _write_part(self, topic: str, columns: Dict[str, List[Any]]) -> None:
+        start = time.perf_counter()
+        table = pa.Table.from_pydict(columns, schema=topic_schema(topic))
+        directory = self._topic_dir(topic)
+        os.makedirs(directory, exist_ok=True)
+
+        # Numeração contínua mesmo ao retomar uma sessão já iniciada
+        existing = glob.glob(os.path.join(directory, 'part-*.parquet'))
+        number = max((int(os.path.basename(p)[5:10]) for p in existing), default=-1) + 1
+        path = os.path.join(directory, f'part-{number:05d}.parquet')
+        temporary = path + '.tmp'
+        pq.write_table(table, temporary, compression=self.compression, row_group_size=table.num_rows)
+        os.replace(temporary, path)
+
+        self.parts_written += 1
+        self.flush_time += time.perf_counter() - start
+
+    def _compact(self, topic: str) -> Optional[str]:
+        """Junta as partes do tópico (e o arquivo final de uma execução anterior) em um único arquivo"""
+        parts = sorted(glob.glob(os.path.join(self._topic_dir(topic), 'part-*.parquet')))
+        if not parts:
+            return None
+
+        final = self.final_path(topic)
+        sources = ([final] if os.path.exists(final) else []) + parts
+        table = pa.concat_tables([pq.read_table(path, schema=topic_schema(topic)) for path in sources])
+        table = table.sort_by(_sort_keys(topic))
+
+        temporary = final + '.tmp'
+        pq.write_table(table, temporary, compression=self.compression,
+                       row_group_size=self.compact_row_group_rows)
+        os.replace(temporary, final)
+        for path in parts:
+            os.remove(path)
+        try:
+            os.rmdir(self._topic_dir(topic))
+        except OSError:
+            pass
+        return final
+
+    async def close(self) -> None:
+        """Grava os buffers e compacta as partes de cada tópico no arquivo final da sessão"""
+        await self.flush(force=True)
+        start = time.perf_counter()
+        async with self._lock:
+            for topic in self.buffers:
+                final = await asyncio.to_thread(self._compact, topic)
+                if final:
+                    self.compacted_files.append(final)
+        if self.compacted_files:
+            logger.info(f"Arquivo Parquet da sessão '{self.session}' compactado em "
+                        f"{time.perf_counter() - start:.2f}s: {', '.join(self.compacted_files)}")
+
+    def report(self) -> None:
+        """Registra no log as linhas arquivadas por tópico"""
+        archived = ', '.join(f"{topic}={rows}" for topic, rows in sorted(self.rows_archived.items())) or 'nenhuma'
+        buffered = sum(buffer.rows for buffer in self.buffers.values())
+        logger.info(f"Arquivo Parquet '{self.directory}': linhas gravadas: {archived}; {self.parts_written} partes "
+                    f"em {self.flush_time:.2f}s, {buffered} linhas no buffer")
+
+def read_topic(directory: str, session: str, topic: str):
+    """Tabela do pyarrow com todas as linhas arquivadas do tópico (arquivo final e partes ainda não compactadas)"""
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("A leitura do arquivo Parquet requer pyarrow (pip install pyarrow)")
+    base = os.path.join(directory, session)
+    paths = glob.glob(os.path.join(base, f'{topic}.parquet'))
+    paths += sorted(glob.glob(os.path.join(base, topic, 'part-*.parquet')))
+    if not paths:
+        return topic_schema(topic).empty_table()
+    return pa.concat_tables([pq.read_table(path, schema=topic_schema(topic)) for path in paths])
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Uso: python parquet_sink.py <diretório> <sessão>")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    for topic in TOPICS:
+        table = read_topic(sys.argv[1], sys.argv[2], topic)
+        if table.num_rows:
+            timestamps = table.column('timestamp')
+            print(f"{topic:<14} {table.num_rows:>10} linhas  {pc.min(timestamps)} → {pc.max(timestamps)}")
+        else:
+            print(f"{topic:<14} {0:>10} linhas")
+    print(f"Lido em {time.perf_counter() - start:.2f}s")
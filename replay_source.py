@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Reprodução de sessões gravadas com o ritmo original.
+
+O ReplaySource lê um arquivo gravado pelo fastf1_livetiming e entrega as linhas
+no instante indicado pelos seus timestamps, em tempo real (1x), acelerado
+(10x, 100x...) ou o mais rápido possível (velocidade 0). Ele expõe a mesma
+interface do FileTailer (``read_batch``, ``position``, ``save_checkpoint``,
+``close``...), de modo que o F1DataExtractor e o restante do pipeline podem ser
+testados e medidos sem uma sessão ao vivo.
+
+Pela linha de comando, regrava a sessão em um arquivo de saída no ritmo
+original, para alimentar os monitores e o serviço de ingestão, que leem o
+arquivo com o FileTailer:
+
+    python replay_source.py f1_data_q1.txt --output f1_data.txt --speed 10
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import zlib
+from typing import List, Optional, Tuple, Union
+
+from loguru import logger
+
+from line_parser import peek_timestamp
+from timestamps import to_epoch_us
+
+class ReplaySource:
+    """Entrega as linhas de um arquivo gravado respeitando o intervalo entre seus timestamps"""
+
+    def __init__(self, path: str, speed: float = 1.0, max_batch: int = 1000,
+                 max_wait: float = 1.0, decode: bool = True):
+        self.path = path
+        self.speed = speed  # 0 = o mais rápido possível
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.decode = decode
+        self.position = 0  # Posição (bytes) após a última linha entregue
+        self.file_size = 0
+        self.last_line_checksum = None
+        self.last_line_length = 0
+        self.lines_emitted = 0
+        self.finished = asyncio.Event()
+
+        self._file = None
+        self._pending = None  # Próxima linha lida e ainda não entregue: (linha, instante de entrega)
+        self._start_time = None  # Relógio (loop.time()) e timestamp (µs) da primeira linha
+        self._start_timestamp = None
+        self._watermark = None
+        self._stopped = False
+
+    @property
+    def event_driven(self) -> bool:
+        """Compatível com o FileTailer: a reprodução não depende de eventos do sistema de arquivos"""
+        return False
+
+    @property
+    def exhausted(self) -> bool:
+        """Indica se a reprodução terminou (final do arquivo ou stop())"""
+        return self.finished.is_set()
+
+    def _open(self) -> None:
+        self._file = open(self.path, 'rb')
+        self.file_size = os.fstat(self._file.fileno()).st_size
+
+    def _due_time(self, line: bytes, now: float) -> float:
+        """Instante (no relógio do loop) em que a linha deve ser entregue"""
+        if not self.speed:
+            return now
+
+        timestamp = peek_timestamp(line)
+        try:
+            timestamp_us = to_epoch_us(timestamp) if timestamp else None
+        except ValueError:
+            timestamp_us = None
+
+        if self._start_timestamp is None:
+            if timestamp_us is None:
+                return now
+            self._start_time, self._start_timestamp = now, timestamp_us
+            self._watermark = timestamp_us
+
+        # Linhas levemente fora de ordem (ou sem timestamp) saem junto com a mais recente
+        if timestamp_us is not None and timestamp_us > self._watermark:
+            self._watermark = timestamp_us
+        return self._start_time + (self._watermark - self._start_timestamp) / 1e6 / self.speed
+
+    def _next_line(self, now: float) -> Optional[Tuple[bytes, float]]:
+        """Lê a próxima linha do arquivo com o instante de entrega; None ao final do arquivo"""
+        if self._file is None:
+            self._open()
+
+        line = self._file.readline()
+        if not line:
+            return None
+        return line, self._due_time(line, now)
+
+    async def read_batch(self, timeout: Optional[float] = None) -> List[Union[str, bytes]]:
+        """Retorna as linhas cujo instante de entrega já chegou, aguardando até ``timeout`` segundos.
+
+        Ao final do arquivo, comporta-se como um arquivo sem novas linhas: aguarda o
+        timeout e retorna uma lista vazia.
+        """
+        timeout = self.max_wait if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        lines = []
+
+        while not self._stopped and len(lines) < self.max_batch:
+            now = loop.time()
+            if self._pending is None:
+                self._pending = self._next_line(now)
+                if self._pending is None:
+                    if not self.finished.is_set():
+                        logger.info(f"Reprodução de {self.path} concluída ({self.lines_emitted + len(lines)} linhas)")
+                        self.finished.set()
+                    break
+
+            line, due = self._pending
+            if due <= now:
+                lines.append(line)
+                self._pending = None
+                continue
+
+            # Entrega o que já está disponível antes de esperar pela próxima linha
+            if lines or now >= deadline:
+                break
+            await asyncio.sleep(min(due, deadline) - now)
+
+        if not lines:
+            remaining = deadline - loop.time()
+            if self.finished.is_set() and remaining > 0 and not self._stopped:
+                await asyncio.sleep(remaining)
+            return []
+
+        self.position += sum(len(line) for line in lines)
+        self.last_line_length = len(lines[-1])
+        self.last_line_checksum = zlib.crc32(lines[-1])
+        self.lines_emitted += len(lines)
+
+        if self.decode:
+            return [line.decode('utf-8', 'replace') for line in lines]
+        return lines
+
+    def save_checkpoint(self, store, consumer: str) -> None:
+        """Persiste a posição atual no CheckpointStore informado"""
+        store.save(consumer, self.path, self.position, self.last_line_checksum, self.last_line_length)
+
+    def stop(self) -> None:
+        """Interrompe a reprodução; nenhuma outra linha será entregue"""
+        self._stopped = True
+        self.finished.set()
+
+    def close(self) -> None:
+        """Fecha o arquivo gravado"""
+        self.stop()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __aiter__(self):
+        return self._iterate_lines()
+
+    async def _iterate_lines(self):
+        """Iterador assíncrono das linhas, até o final do arquivo ou até stop()"""
+        while not self._stopped and not self.finished.is_set():
+            for line in await self.read_batch():
+                yield line
+
+async def replay_to_file(input_file: str, output_file: str, speed: float) -> None:
+    """Regrava a sessão em ``output_file`` no ritmo original (ou acelerado)"""
+    source = ReplaySource(input_file, speed=speed, decode=False)
+    start = time.time()
+    logger.info(f"Reproduzindo {input_file} em {output_file} "
+                f"({'o mais rápido possível' if not speed else f'{speed:g}x'})")
+
+    try:
+        # Mesmo modo de abertura do fastf1_livetiming: o arquivo de saída é recriado
+        with open(output_file, 'wb') as out:
+            while not source.exhausted:
+                lines = await source.read_batch()
+                if lines:
+                    out.writelines(lines)
+                    out.flush()
+    finally:
+        source.close()
+
+    logger.info(f"{source.lines_emitted} linhas reproduzidas em {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Reproduz uma sessão gravada no ritmo original')
+    parser.add_argument('input_file', help='Arquivo gravado pelo fastf1_livetiming')
+    parser.add_argument('--output', required=True, help='Arquivo de saída lido pelo pipeline/monitores')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Multiplicador de velocidade (1, 10, 100...; 0 = o mais rápido possível)')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(replay_to_file(args.input_file, args.output, args.speed))
+    except KeyboardInterrupt:
+        print("\nReprodução interrompida pelo usuário")
@@ -0,0 +1,389 @@
+"""
+Spool local em disco para quedas e lentidão do banco de dados.
+
+Quando uma gravação falha por perda de conexão, passa de ``SPOOL_WRITE_TIMEOUT_MS``
+ou quando já há dados no spool esperando para serem reenviados, as linhas são
+acrescentadas a um log local (somente acréscimo, dividido em segmentos) em vez
+de serem descartadas. Um SpoolDrainer em segundo plano reenvia os segmentos em
+lote, do mais antigo para o mais novo, assim que o banco volta a responder.
+
+Cada registro do segmento é ``[tamanho:uint32][crc32:uint32][payload]``, com o
+payload serializado com pickle. Na abertura os segmentos existentes são
+verificados e um registro incompleto no final (queda durante a escrita) é
+descartado. O fsync é feito em grupo: as gravações de um intervalo de
+``SPOOL_FSYNC_INTERVAL_MS`` compartilham um único fsync, e ``write_through`` só
+retorna depois dele — o checkpoint de leitura pode avançar com segurança.
+
+O reenvio é "pelo menos uma vez": um segmento só é apagado depois que todas as
+suas linhas foram gravadas, e se o processo cair no meio ele é reenviado
+inteiro. As tabelas com chave natural (ver statements.NATURAL_KEYS) ignoram as
+linhas repetidas.
+"""
+
+import asyncio
+import os
+import pickle
+import struct
+import time
+import zlib
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from connection_pool import backoff_delay, is_connection_error
+
+# Diretório base dos spools (vazio desativa o spool)
+DEFAULT_SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+
+# Tamanho máximo de cada segmento antes de abrir o próximo
+DEFAULT_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+
+# Janela do fsync em grupo
+DEFAULT_FSYNC_INTERVAL_MS = int(os.getenv("SPOOL_FSYNC_INTERVAL_MS", "50"))
+
+# Gravações mais lentas que isso vão para o spool (0 desativa o limite)
+DEFAULT_WRITE_TIMEOUT_MS = int(os.getenv("SPOOL_WRITE_TIMEOUT_MS", "5000"))
+
+# Intervalo entre verificações do drenador e linhas por gravação no reenvio
+DEFAULT_DRAIN_INTERVAL_MS = int(os.getenv("SPOOL_DRAIN_INTERVAL_MS", "1000"))
+DEFAULT_DRAIN_BATCH_ROWS = int(os.getenv("SPOOL_DRAIN_BATCH_ROWS", "5000"))
+
+RECORD_HEADER = struct.Struct('<II')
+SEGMENT_SUFFIX = '.seg'
+
+class Segment:
+    """Arquivo de segmento do spool e a quantidade de registros e linhas que contém"""
+
+    __slots__ = ('path', 'records', 'rows', 'size')
+
+    def __init__(self, path: str, records: int = 0, rows: int = 0, size: int = 0):
+        self.path = path
+        self.records = records
+        self.rows = rows
+        self.size = size
+
+class Spool:
+    """Log local de gravações pendentes, segmentado, com fsync em grupo"""
+
+    def __init__(self, name: str, directory: str = DEFAULT_SPOOL_DIR,
+                 segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 fsync_interval_ms: int = DEFAULT_FSYNC_INTERVAL_MS,
+                 write_timeout_ms: int = DEFAULT_WRITE_TIMEOUT_MS):
+        self.name = name
+        self.directory = os.path.join(directory, name)
+        self.segment_bytes = max(segment_bytes, 1)
+        self.fsync_interval = max(fsync_interval_ms, 0) / 1000.0
+        self.write_timeout = write_timeout_ms / 1000.0 if write_timeout_ms > 0 else None
+
+        self._segments = deque()  # Segmentos pendentes, do mais antigo ao mais novo
+        self._file = None         # Segmento aberto para acréscimo (sempre o último)
+        self._next_seq = 0
+        self._appended = 0        # Registros acrescentados / já em disco (fsync)
+        self._synced = 0
+        self._sync_task = None
+
+        # Métricas
+        self.spooled_rows = Counter()  # Linhas enviadas ao spool, por motivo
+        self.fsyncs = 0
+        self.recovered_rows = 0
+        self.torn_records = 0
+
+        self._open()
+
+    @property
+    def depth(self) -> int:
+        """Linhas no spool aguardando reenvio"""
+        return sum(segment.rows for segment in self._segments)
+
+    @property
+    def pending_bytes(self) -> int:
+        return sum(segment.size for segment in self._segments)
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f'{seq:010d}{SEGMENT_SUFFIX}')
+
+    def _open(self) -> None:
+        """Recupera os segmentos deixados por uma execução anterior"""
+        os.makedirs(self.directory, exist_ok=True)
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            segment = Segment(path)
+            for _, payload in self._scan(path, truncate=True):
+                segment.records += 1
+                segment.rows += len(payload[1])
+            segment.size = os.path.getsize(path)
+            if segment.records:
+                self._segments.append(segment)
+                self.recovered_rows += segment.rows
+            else:
+                os.remove(path)
+            self._next_seq = max(self._next_seq, int(name[:-len(SEGMENT_SUFFIX)]) + 1)
+
+        if self.recovered_rows:
+            logger.warning(f"Spool '{self.name}': {self.recovered_rows} linhas de uma execução anterior "
+                           f"em {len(self._segments)} segmentos aguardam reenvio")
+
+    def _scan(self, path: str, truncate: bool = False):
+        """Lê os registros válidos do segmento; com ``truncate``, descarta um final incompleto"""
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            length, crc = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            yield offset, pickle.loads(payload)
+            offset = start + length
+
+        if offset < len(data):
+            self.torn_records += 1
+            logger.warning(f"Spool '{self.name}': registro incompleto no fim de {path} "
+                           f"({len(data) - offset} bytes descartados)")
+            if truncate:
+                with open(path, 'r+b') as f:
+                    f.truncate(offset)
+
+    def append(self, topic: str, rows: Sequence[Any], reason: str = 'falha') -> None:
+        """Acrescenta as linhas ao segmento atual (chegam ao disco no próximo fsync em grupo)"""
+        rows = list(rows)
+        if not rows:
+            return
+
+        payload = pickle.dumps((topic, rows), protocol=pickle.HIGHEST_PROTOCOL)
+        if self._file is None or self._segments[-1].size >= self.segment_bytes:
+            self._roll()
+
+        self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+        segment = self._segments[-1]
+        segment.records += 1
+        segment.rows += len(rows)
+        segment.size += RECORD_HEADER.size + len(payload)
+        self._appended += 1
+        self.spooled_rows[reason] += len(rows)
+
+    def _roll(self) -> None:
+        """Fecha o segmento atual (com fsync) e abre o próximo"""
+        self._close_file()
+        path = self._segment_path(self._next_seq)
+        self._next_seq += 1
+        self._file = open(path, 'ab')
+        self._segments.append(Segment(path))
+
+    def _close_file(self) -> None:
+        if self._file is None:
+            return
+        self._fsync()
+        self._file.close()
+        self._file = None
+
+    def _fsync(self) -> None:
+        target = self._appended
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._synced = target
+        self.fsyncs += 1
+
+    async def _group_sync(self) -> None:
+        """Aguarda a janela do fsync em grupo e grava em disco tudo que foi acrescentado até então"""
+        try:
+            await asyncio.sleep(self.fsync_interval)
+            if self._file is not None:
+                self._fsync()
+        finally:
+            self._sync_task = None
+
+    async def sync(self) -> None:
+        """Aguarda até que todos os registros já acrescentados estejam em disco"""
+        while self._synced < self._appended and self._file is not None:
+            if self._sync_task is None:
+                self._sync_task = asyncio.create_task(self._group_sync())
+            await asyncio.shield(self._sync_task)
+        self._synced = max(self._synced, self._appended)
+
+    async def write_through(self, topic: str, write: Callable[[List[Any]], Awaitable[Any]],
+                            rows: Sequence[Any]) -> bool:
+        """Grava ``rows`` com ``write`` ou, se o banco estiver fora, lento ou com reenvio pendente,
+        no spool. Retorna True se as linhas foram gravadas no banco.
+
+        Erros que não são de conexão (dados, SQL) são propagados."""
+        rows = list(rows)
+        if not rows:
+            return True
+
+        # Com dados pendentes, as novas linhas entram na fila atrás deles
+        if self._segments:
+            self.append(topic, rows, reason='pendências')
+            await self.sync()
+            return False
+
+        try:
+            if self.write_timeout:
+                await asyncio.wait_for(write(rows), self.write_timeout)
+            else:
+                await write(rows)
+            return True
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            reason = 'lentidão' if isinstance(e, asyncio.TimeoutError) else 'falha'
+            logger.warning(f"Gravação de {len(rows)} linhas em '{topic}' enviada ao spool ({reason}: {str(e) or type(e).__name__})")
+            self.append(topic, rows, reason=reason)
+            await self.sync()
+            return False
+
+    def oldest_segment(self) -> Optional[Segment]:
+        """Segmento mais antigo pendente; se for o segmento em uso, ele é fechado antes"""
+        if not self._segments:
+            return None
+        if self._file is not None and len(self._segments) == 1:
+            self._close_file()
+        return self._segments[0]
+
+    def read_segment(self, segment: Segment) -> List[Tuple[str, List[Any]]]:
+        """Registros (tópico, linhas) do segmento"""
+        return [payload for _, payload in self._scan(segment.path)]
+
+    def remove_segment(self, segment: Segment) -> None:
+        """Apaga um segmento totalmente reenviado"""
+        self._segments.remove(segment)
+        try:
+            os.remove(segment.path)
+        except FileNotFoundError:
+            pass
+
+    async def close(self) -> None:
+        """Grava em disco os registros pendentes e fecha o segmento atual"""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        self._close_file()
+
+    def report(self) -> None:
+        """Registra no log a profundidade do spool"""
+        spooled = ', '.join(f"{reason}={rows}" for reason, rows in sorted(self.spooled_rows.items())) or 'nenhuma'
+        logger.info(f"Spool '{self.name}': {self.depth} linhas pendentes em {len(self._segments)} segmentos "
+                    f"({self.pending_bytes / 1024:.0f} KiB), linhas enviadas ao spool: {spooled}, "
+                    f"{self.fsyncs} fsyncs")
+
+class SpoolDrainer:
+    """Reenvia os segmentos do spool ao banco em segundo plano, em lote.
+
+    ``handlers`` mapeia o tópico para a função de gravação; os tópicos de um
+    segmento são reenviados na ordem do dicionário (chaves estrangeiras primeiro)."""
+
+    def __init__(self, spool: Spool, handlers: Dict[str, Callable[[List[Any]], Awaitable[Any]]],
+                 interval_ms: int = DEFAULT_DRAIN_INTERVAL_MS, batch_rows: int = DEFAULT_DRAIN_BATCH_ROWS):
+        self.spool = spool
+        self.handlers = handlers
+        self.interval = max(interval_ms, 1) / 1000.0
+        self.batch_rows = max(batch_rows, 1)
+        self._task = None
+
+        # Métricas
+        self.rows_drained = 0
+        self.rows_failed = 0
+        self.segments_drained = 0
+        self.drain_time = 0.0
+        self.retries = 0
+
+    @property
+    def drain_rate(self) -> float:
+        """Linhas reenviadas por segundo de reenvio"""
+        return self.rows_drained / self.drain_time if self.drain_time else 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                if await self.drain_once():
+                    attempt = 0
+                    continue
+                await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Banco ainda fora: o segmento fica no spool e é tentado de novo depois
+                self.retries += 1
+                delay = max(backoff_delay(attempt), self.interval)
+                attempt = min(attempt + 1, 10)
+                logger.warning(f"Reenvio do spool '{self.spool.name}' interrompido ({e}); "
+                               f"nova tentativa em {delay:.2f}s ({self.spool.depth} linhas pendentes)")
+                await asyncio.sleep(delay)
+
+    async def drain_once(self) -> bool:
+        """Reenvia o segmento mais antigo; retorna False se o spool estiver vazio"""
+        segment = self.spool.oldest_segment()
+        if segment is None:
+            return False
+
+        by_topic: Dict[str, List[Any]] = {}
+        for topic, rows in self.spool.read_segment(segment):
+            by_topic.setdefault(topic, []).extend(rows)
+
+        start = time.perf_counter()
+        drained = 0
+        order = [topic for topic in self.handlers if topic in by_topic]
+        order += [topic for topic in by_topic if topic not in self.handlers]
+        for topic in order:
+            rows = by_topic[topic]
+            write = self.handlers.get(topic)
+            if write is None:
+                logger.error(f"Spool '{self.spool.name}': tópico sem gravação '{topic}', {len(rows)} linhas descartadas")
+                self.rows_failed += len(rows)
+                continue
+
+            for i in range(0, len(rows), self.batch_rows):
+                chunk = rows[i:i + self.batch_rows]
+                try:
+                    await write(chunk)
+                    drained += len(chunk)
+                except Exception as e:
+                    if is_connection_error(e):
+                        raise
+                    self.rows_failed += len(chunk)
+                    logger.error(f"Erro ao reenviar {len(chunk)} linhas de '{topic}' do spool "
+                                 f"'{self.spool.name}': {e}")
+
+        self.spool.remove_segment(segment)
+        self.segments_drained += 1
+        self.rows_drained += drained
+        self.drain_time += time.perf_counter() - start
+        logger.info(f"Spool '{self.spool.name}': {drained} linhas reenviadas "
+                    f"({self.spool.depth} ainda pendentes)")
+        return True
+
+    async def stop(self) -> None:
+        """Interrompe o reenvio (o que não foi reenviado continua no spool)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def report(self) -> None:
+        """Registra no log a profundidade do spool e a taxa de reenvio"""
+        self.spool.report()
+        logger.info(f"Reenvio do spool '{self.spool.name}': {self.rows_drained} linhas em "
+                    f"{self.segments_drained} segmentos ({self.drain_rate:.0f} linhas/s), "
+                    f"falhas={self.rows_failed}, tentativas interrompidas={self.retries}")
+
+def open_spool(name: str, handlers: Dict[str, Callable[[List[Any]], Awaitable[Any]]],
+               directory: str = DEFAULT_SPOOL_DIR) -> Tuple[Optional[Spool], Optional[SpoolDrainer]]:
+    """Abre o spool ``name`` e cria seu drenador; (None, None) se SPOOL_DIR estiver vazio"""
+    if not directory:
+        return None, None
+    spool = Spool(name, directory)
+    return spool, SpoolDrainer(spool, handlers)
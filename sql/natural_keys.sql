@@ -0,0 +1,70 @@
+-- Chaves naturais das tabelas de alto volume do Supabase.
+--
+-- Os INSERTs do pipeline usam ON CONFLICT DO NOTHING (e o COPY passa por uma
+-- tabela temporária com INSERT ... SELECT ... ON CONFLICT DO NOTHING): com estes
+-- índices únicos, reproduzir uma sessão ou reiniciar um monitor grava apenas as
+-- linhas novas. As colunas devem coincidir com NATURAL_KEYS em statements.py;
+-- o verify_tables.py confere se os índices existem.
+--
+-- Antes de cada índice, as duplicatas já gravadas são removidas (fica a linha
+-- de menor id). Execute uma vez, por exemplo:
+--   psql "$DATABASE_URL" -f sql/natural_keys.sql
+--
+-- Observação: linhas com alguma coluna da chave nula não entram em conflito
+-- (comportamento padrão dos índices únicos do PostgreSQL); por isso o pipeline
+-- sempre grava um session_id (o SupabaseLoader usa o placeholder 1).
+
+BEGIN;
+
+-- car_telemetry: uma amostra por piloto e instante de telemetria
+DELETE FROM public.car_telemetry a
+    USING public.car_telemetry b
+    WHERE a.id > b.id
+      AND a.session_id = b.session_id
+      AND a.driver_number = b.driver_number
+      AND a.utc_timestamp = b.utc_timestamp;
+CREATE UNIQUE INDEX IF NOT EXISTS car_telemetry_natural_key
+    ON public.car_telemetry (session_id, driver_number, utc_timestamp);
+
+-- car_positions: uma posição por piloto e instante
+DELETE FROM public.car_positions a
+    USING public.car_positions b
+    WHERE a.id > b.id
+      AND a.session_id = b.session_id
+      AND a.driver_number = b.driver_number
+      AND a.utc_time = b.utc_time;
+CREATE UNIQUE INDEX IF NOT EXISTS car_positions_natural_key
+    ON public.car_positions (session_id, driver_number, utc_time);
+
+-- weather_data: uma leitura por sessão e instante
+-- (versões anteriores do SupabaseLoader gravavam session_id nulo: essas duplicatas também são removidas)
+DELETE FROM public.weather_data a
+    USING public.weather_data b
+    WHERE a.id > b.id
+      AND a.session_id IS NOT DISTINCT FROM b.session_id
+      AND a.timestamp = b.timestamp;
+CREATE UNIQUE INDEX IF NOT EXISTS weather_data_natural_key
+    ON public.weather_data (session_id, timestamp);
+
+-- race_control_messages: a mesma mensagem no mesmo horário só uma vez
+DELETE FROM public.race_control_messages a
+    USING public.race_control_messages b
+    WHERE a.id > b.id
+      AND a.session_id = b.session_id
+      AND a.utc_time = b.utc_time
+      AND a.category = b.category
+      AND a.message = b.message;
+CREATE UNIQUE INDEX IF NOT EXISTS race_control_messages_natural_key
+    ON public.race_control_messages (session_id, utc_time, category, message);
+
+-- driver_positions: uma posição de classificação por piloto e instante
+DELETE FROM public.driver_positions a
+    USING public.driver_positions b
+    WHERE a.id > b.id
+      AND a.session_id = b.session_id
+      AND a.driver_number = b.driver_number
+      AND a.timestamp = b.timestamp;
+CREATE UNIQUE INDEX IF NOT EXISTS driver_positions_natural_key
+    ON public.driver_positions (session_id, driver_number, timestamp);
+
+COMMIT;
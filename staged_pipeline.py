@@ -0,0 +1,205 @@
+"""
+Pipeline em etapas concorrentes ligadas por filas asyncio limitadas.
+
+A leitura, a análise/decodificação, a transformação e a carga rodam em tarefas
+próprias: enquanto um lote é carregado no banco, os seguintes já estão sendo
+lidos e transformados. Cada fila tem tamanho máximo (em lotes); quando uma
+etapa fica para trás, a anterior espera para entregar o próximo lote, até
+chegar à leitura — a memória fica limitada e o atraso fica visível na
+profundidade das filas.
+
+Os lotes recebem um número de sequência na leitura. O checkpoint só avança até
+o último lote concluído sem lacunas, mesmo que etapas com mais de uma tarefa
+concluam lotes fora de ordem. Uma etapa com estado entre lotes (``ordered``)
+recebe os lotes na ordem de leitura.
+"""
+
+import asyncio
+import os
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+# Tamanho de cada fila entre as etapas (em lotes)
+DEFAULT_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+
+# Número de tarefas de cada etapa
+# (a transformação guarda estado entre lotes e é sempre ordenada; a carga fica com uma
+# tarefa por padrão para que as sessões de um lote sejam gravadas antes das linhas dependentes do seguinte)
+DEFAULT_DECODE_CONCURRENCY = int(os.getenv("PIPELINE_DECODE_CONCURRENCY", "2"))
+DEFAULT_LOAD_CONCURRENCY = int(os.getenv("PIPELINE_LOAD_CONCURRENCY", "1"))
+
+class Batch:
+    """Lote de linhas lidas, acompanhado da posição de leitura correspondente"""
+
+    __slots__ = ('seq', 'lines', 'position', 'created_at', 'records', 'data', 'record_count', 'failed')
+
+    def __init__(self, seq: int, lines: List[str], position: Any = None):
+        self.seq = seq
+        self.lines = lines
+        self.position = position
+        self.created_at = time.perf_counter()
+        self.records = None
+        self.data = None
+        self.record_count = 0
+        self.failed = False
+
+class Stage:
+    """Etapa do pipeline: ``concurrency`` tarefas consumindo uma fila limitada.
+    
+    Com ``ordered`` a etapa tem uma única tarefa e recebe os lotes na ordem de
+    leitura, mesmo que a etapa anterior os conclua fora de ordem."""
+
+    def __init__(self, name: str, handler: Callable[[Batch], Awaitable[None]],
+                 concurrency: int = 1, queue_size: int = DEFAULT_QUEUE_SIZE, ordered: bool = False):
+        self.name = name
+        self.handler = handler
+        self.ordered = ordered
+        self.concurrency = 1 if ordered else max(concurrency, 1)
+        self.queue = asyncio.Queue(maxsize=max(queue_size, 1))
+        self.tasks = []
+        self._next_seq = 0
+        self._waiting: Dict[int, Batch] = {}  # Lotes que chegaram antes dos anteriores
+
+        # Métricas
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.max_depth = 0
+
+    async def put(self, batch: Batch) -> None:
+        """Entrega um lote à etapa; aguarda se a fila estiver cheia (contrapressão)"""
+        if not self.ordered:
+            await self.queue.put(batch)
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+            return
+
+        # Lotes fora de ordem esperam os anteriores fora da fila
+        self._waiting[batch.seq] = batch
+        while self._next_seq in self._waiting:
+            await self.queue.put(self._waiting.pop(self._next_seq))
+            self._next_seq += 1
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def start(self, forward: Callable[[Batch], Awaitable[None]]) -> None:
+        """Inicia as tarefas da etapa; ``forward`` recebe cada lote concluído"""
+        self.tasks = [asyncio.create_task(self._worker(forward)) for _ in range(self.concurrency)]
+
+    async def _worker(self, forward: Callable[[Batch], Awaitable[None]]) -> None:
+        while True:
+            batch = await self.queue.get()
+            try:
+                if not batch.failed:
+                    start = time.perf_counter()
+                    try:
+                        await self.handler(batch)
+                        self.processed += 1
+                    except Exception as e:
+                        # O lote segue apenas para liberar o checkpoint dos lotes seguintes
+                        batch.failed = True
+                        self.failed += 1
+                        logger.error(f"Erro na etapa '{self.name}' (lote {batch.seq}): {e}")
+                        logger.debug(f"Detalhes do erro: {traceback.format_exc()}")
+                    finally:
+                        self.busy_time += time.perf_counter() - start
+                await forward(batch)
+            finally:
+                self.queue.task_done()
+
+    async def stop(self) -> None:
+        """Aguarda o esvaziamento da fila e encerra as tarefas"""
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+class StagedPipeline:
+    """Lê lotes de ``read`` e os passa pelas etapas, gravando o checkpoint em ordem"""
+
+    def __init__(self, read: Callable[[], Awaitable[Optional[Tuple[List[str], Any]]]],
+                 stages: Sequence[Stage], commit: Optional[Callable[[Any], None]] = None,
+                 on_complete: Optional[Callable[[Batch], None]] = None):
+        self.read = read  # Retorna (linhas, posição); None quando não há mais dados
+        self.stages = list(stages)
+        self.commit = commit
+        self.on_complete = on_complete
+
+        self._next_seq = 0
+        self._next_commit = 0
+        self._completed: Dict[int, Batch] = {}
+        self._stopping = False
+
+        # Métricas
+        self.lines_read = 0
+        self.batches_read = 0
+        self.batches_completed = 0
+
+    def stop(self) -> None:
+        """Interrompe a leitura; os lotes já lidos ainda passam por todas as etapas"""
+        self._stopping = True
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Profundidade atual (em lotes) da fila de entrada de cada etapa"""
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    def _forwarder(self, index: int) -> Callable[[Batch], Awaitable[None]]:
+        if index + 1 < len(self.stages):
+            return self.stages[index + 1].put
+        return self._complete
+
+    async def _complete(self, batch: Batch) -> None:
+        """Registra o lote concluído e avança o checkpoint até o último lote sem lacunas"""
+        self.batches_completed += 1
+        if self.on_complete:
+            self.on_complete(batch)
+
+        self._completed[batch.seq] = batch
+        committed = None
+        while self._next_commit in self._completed:
+            committed = self._completed.pop(self._next_commit)
+            self._next_commit += 1
+
+        if committed is not None and self.commit:
+            self.commit(committed.position)
+
+    async def run(self) -> None:
+        """Executa o pipeline até ``stop()`` ou até ``read`` indicar o fim dos dados"""
+        for index, stage in enumerate(self.stages):
+            stage.start(self._forwarder(index))
+
+        try:
+            while not self._stopping:
+                result = await self.read()
+                if result is None:
+                    break
+
+                lines, position = result
+                if not lines:
+                    continue
+
+                self.lines_read += len(lines)
+                self.batches_read += 1
+                batch = Batch(self._next_seq, lines, position)
+                self._next_seq += 1
+                await self.stages[0].put(batch)
+        except asyncio.CancelledError:
+            for stage in self.stages:
+                for task in stage.tasks:
+                    task.cancel()
+            raise
+
+        # Esvazia as etapas em ordem: cada uma só para depois de entregar tudo à seguinte
+        for stage in self.stages:
+            await stage.stop()
+
+    def report(self) -> None:
+        """Registra no log a profundidade das filas e a ocupação de cada etapa"""
+        logger.info(f"Pipeline: {self.batches_read} lotes lidos ({self.lines_read} linhas), "
+                    f"{self.batches_completed} concluídos")
+        for stage in self.stages:
+            logger.info(f"  Etapa '{stage.name}' (x{stage.concurrency}): fila={stage.queue.qsize()}/"
+                        f"{stage.queue.maxsize} (máx. {stage.max_depth}), lotes={stage.processed}, "
+                        f"falhas={stage.failed}, tempo ocupado={stage.busy_time:.2f}s")
@@ -0,0 +1,173 @@
+"""
+Registro central das instruções INSERT de alto volume.
+
+Cada instrução tem um nome (o nome da tabela) e é preparada uma única vez por
+conexão: as execuções seguintes só enviam os parâmetros. Pelo pooler do
+Supabase na porta 6543 (pgbouncer em modo transação) cada transação pode cair
+em uma conexão diferente do servidor e instruções preparadas com nome não
+sobrevivem; nesse modo o cache de instruções do asyncpg é desativado
+(``statement_cache_size=0``) e as instruções são executadas sem preparo
+nomeado, em lote com ``executemany`` sempre que possível.
+
+O modo é detectado pela porta do DSN e pode ser forçado com DB_POOL_MODE
+(``transaction``, ``session`` ou ``direct``).
+
+As tabelas de NATURAL_KEYS têm um índice único na chave natural
+(sql/natural_keys.sql) e seus INSERTs ignoram as linhas já existentes: reproduzir
+uma sessão ou reiniciar um monitor não duplica dados.
+"""
+
+import os
+import time
+import weakref
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional, Sequence
+from urllib.parse import urlsplit
+
+import asyncpg
+from loguru import logger
+
+from copy_loader import CAR_POSITIONS_COLUMNS, CAR_TELEMETRY_COLUMNS, SKIP_CONFLICTS
+
+# Modo do pooler: 'transaction' (pgbouncer), 'session' ou 'direct'; vazio detecta pela porta
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "").lower()
+
+# Porta do pooler do Supabase em modo transação
+POOLER_TRANSACTION_PORT = 6543
+
+WEATHER_DATA_COLUMNS = (
+    'session_id', 'timestamp', 'air_temp', 'track_temp', 'humidity',
+    'pressure', 'wind_speed', 'wind_direction', 'rainfall',
+    'created_at', 'updated_at'
+)
+RACE_CONTROL_MESSAGES_COLUMNS = (
+    'session_id', 'timestamp', 'utc_time', 'category', 'message',
+    'flag', 'scope', 'sector', 'created_at', 'updated_at'
+)
+DRIVER_POSITIONS_COLUMNS = (
+    'session_id', 'timestamp', 'driver_number', 'position', 'created_at', 'updated_at'
+)
+
+# Chave natural de cada tabela (índices únicos criados por sql/natural_keys.sql)
+NATURAL_KEYS = {
+    'car_telemetry': ('session_id', 'driver_number', 'utc_timestamp'),
+    'car_positions': ('session_id', 'driver_number', 'utc_time'),
+    'weather_data': ('session_id', 'timestamp'),
+    'race_control_messages': ('session_id', 'utc_time', 'category', 'message'),
+    'driver_positions': ('session_id', 'driver_number', 'timestamp'),
+}
+
+def insert_statement(table: str, columns: Sequence[str], on_conflict: Optional[str] = None) -> str:
+    """Monta o INSERT parametrizado da tabela com as colunas na ordem dada"""
+    placeholders = ', '.join(f'${i}' for i in range(1, len(columns) + 1))
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    if on_conflict:
+        sql += f" {on_conflict}"
+    return sql
+
+# Instruções nomeadas das tabelas do Supabase (todas com chave natural)
+STATEMENTS = {
+    'car_telemetry': insert_statement('public.car_telemetry', CAR_TELEMETRY_COLUMNS, SKIP_CONFLICTS),
+    'car_positions': insert_statement('public.car_positions', CAR_POSITIONS_COLUMNS, SKIP_CONFLICTS),
+    'weather_data': insert_statement('public.weather_data', WEATHER_DATA_COLUMNS, SKIP_CONFLICTS),
+    'race_control_messages': insert_statement('public.race_control_messages', RACE_CONTROL_MESSAGES_COLUMNS,
+                                              SKIP_CONFLICTS),
+    'driver_positions': insert_statement('public.driver_positions', DRIVER_POSITIONS_COLUMNS, SKIP_CONFLICTS),
+}
+
+def transaction_pooling(dsn: Optional[str] = None) -> bool:
+    """Indica se as conexões passam por um pooler em modo transação"""
+    if DB_POOL_MODE:
+        return DB_POOL_MODE == 'transaction'
+    try:
+        return bool(dsn) and urlsplit(dsn).port == POOLER_TRANSACTION_PORT
+    except ValueError:
+        return False
+
+def connection_options(dsn: Optional[str] = None) -> Dict[str, Any]:
+    """Opções de conexão do asyncpg para o modo do pooler (sem cache de instruções em modo transação)"""
+    return {'statement_cache_size': 0} if transaction_pooling(dsn) else {}
+
+def raw_connection(conn):
+    """Conexão física por trás do proxy do pool (o asyncpg cria um proxy novo a cada acquire)"""
+    return getattr(conn, '_con', None) or conn
+
+class StatementRegistry:
+    """Executa as instruções nomeadas, preparando-as uma vez por conexão quando o pooler permite"""
+
+    def __init__(self, dsn: Optional[str] = None, statements: Dict[str, str] = STATEMENTS,
+                 prepare: Optional[bool] = None):
+        self.statements = dict(statements)
+        self.prepare = not transaction_pooling(dsn) if prepare is None else prepare
+        # conexão física -> {nome: instrução preparada}; some junto com a conexão
+        self._prepared = weakref.WeakKeyDictionary()
+
+        # Métricas por instrução
+        self.hits = Counter()        # Execuções com a instrução já preparada na conexão
+        self.misses = Counter()      # Preparos (primeiro uso na conexão ou após invalidação)
+        self.unprepared = Counter()  # Execuções sem preparo nomeado (pooler em modo transação)
+        self.rows = Counter()
+        self.seconds = Counter()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.statements
+
+    def sql(self, name: str) -> str:
+        """Texto SQL da instrução"""
+        return self.statements[name]
+
+    async def _prepared_statement(self, conn, name: str):
+        cache = self._prepared.setdefault(raw_connection(conn), {})
+        statement = cache.get(name)
+        if statement is None:
+            self.misses[name] += 1
+            statement = cache[name] = await conn.prepare(self.sql(name))
+        else:
+            self.hits[name] += 1
+        return statement
+
+    def _invalidate(self, conn, name: str) -> None:
+        self._prepared.get(raw_connection(conn), {}).pop(name, None)
+
+    async def execute(self, conn, name: str, *args) -> None:
+        """Executa a instrução com uma linha de parâmetros"""
+        await self.executemany(conn, name, [args])
+
+    async def executemany(self, conn, name: str, rows: Iterable[Sequence[Any]]) -> None:
+        """Executa a instrução para cada linha de parâmetros em um único envio"""
+        rows = list(rows)
+        if not rows:
+            return
+
+        start = time.perf_counter()
+        if not self.prepare:
+            self.unprepared[name] += 1
+            if len(rows) == 1:
+                await conn.execute(self.sql(name), *rows[0])
+            else:
+                await conn.executemany(self.sql(name), rows)
+        else:
+            statement = await self._prepared_statement(conn, name)
+            try:
+                await statement.executemany(rows)
+            except asyncpg.InvalidCachedStatementError:
+                # A estrutura da tabela mudou: prepara de novo e repete uma vez
+                self._invalidate(conn, name)
+                statement = await self._prepared_statement(conn, name)
+                await statement.executemany(rows)
+
+        self.rows[name] += len(rows)
+        self.seconds[name] += time.perf_counter() - start
+
+    def report(self) -> None:
+        """Registra no log o uso de cada instrução e a taxa de acerto do cache de preparo"""
+        mode = 'preparadas por conexão' if self.prepare else 'sem preparo nomeado (pooler em modo transação)'
+        logger.info(f"Instruções SQL: {mode}")
+        for name in sorted(self.rows):
+            executions = self.hits[name] + self.misses[name] + self.unprepared[name]
+            rate = self.rows[name] / self.seconds[name] if self.seconds[name] else 0.0
+            line = f"  {name}: {self.rows[name]} linhas em {executions} execuções ({rate:.0f} linhas/s)"
+            if self.prepare:
+                hit_rate = self.hits[name] / executions * 100 if executions else 0.0
+                line += f", cache de preparo {hit_rate:.1f}% ({self.misses[name]} preparos)"
+            logger.info(line)
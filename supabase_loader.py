@@ -1,31 +1,78 @@
 import asyncio
-import asyncpg
+import os
+import time
+from collections import deque
 from datetime import datetime
+from functools import partial
 from typing import Dict, List, Any, Optional
 
 from loguru import logger
 
+from connection_pool import is_connection_error, shared_pool
+from copy_loader import CAR_POSITIONS_COLUMNS, CAR_TELEMETRY_COLUMNS, CopyLoader
+from spool import DEFAULT_SPOOL_DIR, open_spool
+from statements import NATURAL_KEYS, StatementRegistry
+from write_retry import RetryingWriter
 from models import Driver, Session, LapData, Position, TelemetryData, RaceControl, Weather
 from config_supabase import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
 
+# Carga concorrente: cada tabela em sua própria conexão e transação (false: um lote, uma transação)
+DEFAULT_CONCURRENT_LOAD = os.getenv("SUPABASE_CONCURRENT_LOAD", "true").lower() == "true"
+
+# Amostras de latência guardadas por tabela para o relatório
+LATENCY_SAMPLES = 1000
+
+class TableStats:
+    """Latência de commit (carga + COMMIT) e volume de uma tabela"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.commits = 0
+        self.rows = 0
+        self.failures = 0
+
+    def record(self, elapsed: float, rows: int) -> None:
+        self.latencies.append(elapsed)
+        self.commits += 1
+        self.rows += rows
+
+    def summary(self) -> Dict[str, float]:
+        """p50, p99 e máximo (em ms) das latências recentes"""
+        if not self.latencies:
+            return {'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        ordered = sorted(self.latencies)
+        return {
+            'p50_ms': ordered[len(ordered) // 2] * 1000,
+            'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            'max_ms': ordered[-1] * 1000,
+        }
+
 class SupabaseLoader:
     """Carrega dados da F1 no Supabase via conexão PostgreSQL usando tabelas existentes"""
     
-    def __init__(self):
+    def __init__(self, concurrent: bool = DEFAULT_CONCURRENT_LOAD, spool_dir: str = DEFAULT_SPOOL_DIR):
         self.pool = None
+        self.concurrent = concurrent
+        self.table_stats: Dict[str, TableStats] = {}
         self.conn_string = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        # INSERTs nomeados, preparados por conexão quando o pooler permite
+        self.statements = StatementRegistry(self.conn_string)
+        self.copy_loader = CopyLoader(statements=self.statements, skip_conflicts=NATURAL_KEYS)  # COPY para car_telemetry e car_positions
+        # Novas tentativas e divisão dos lotes rejeitados; linhas inválidas vão para o dead-letter
+        self.retrying = RetryingWriter()
+        # Tabelas que não chegam ao banco (queda ou lentidão) vão para o spool local e são reenviadas depois
+        self.spool, self.drainer = open_spool('supabase_loader', self._spool_handlers(), spool_dir)
     
     async def connect(self) -> None:
         """Estabelece conexão direta com o banco de dados Supabase"""
         try:
             logger.info(f"Conectando diretamente ao PostgreSQL do Supabase em {DB_HOST}:{DB_PORT}/{DB_NAME}...")
-            self.pool = await asyncpg.create_pool(
-                dsn=self.conn_string,
-                min_size=1,
-                max_size=10,
-                ssl="require"  # Supabase requer SSL
-            )
+            # Pool compartilhado com verificação de saúde e reconexão (Supabase requer SSL)
+            self.pool = await shared_pool(self.conn_string)
             logger.info("Conexão estabelecida com sucesso")
+            if self.drainer:
+                self.drainer.start()
             
             # Apenas verifica se as tabelas existem, não as cria
             await self._verify_tables_exist()
@@ -39,9 +86,18 @@ class SupabaseLoader:
     
     async def disconnect(self) -> None:
         """Fecha a conexão com o banco de dados"""
+        if self.drainer:
+            await self.drainer.stop()
+            await self.spool.close()
+            self.drainer.report()
         if self.pool:
             await self.pool.close()
             logger.info("Conexão com o Supabase fechada")
+        self.copy_loader.report()
+        self.statements.report()
+        self.retrying.report()
+        self.retrying.dead_letter.close()
+        self.report_latencies()
     
     async def _verify_tables_exist(self) -> None:
         """Verifica se as tabelas necessárias existem no Supabase"""
@@ -131,12 +187,96 @@ class SupabaseLoader:
         except Exception as e:
             logger.error(f"Erro ao verificar estrutura da tabela weather_data: {e}")
     
+    def _table_loaders(self) -> List[List[tuple]]:
+        """Etapas de carga: (chave do lote, tabela, função) por etapa, na ordem das chaves estrangeiras.
+        
+        As tabelas de uma mesma etapa são independentes entre si; as de etapas
+        seguintes dependem das anteriores (todas referenciam sessions)."""
+        return [
+            [('sessions', 'sessions', self._load_sessions)],
+            [
+                ('drivers', 'session_drivers', self._load_session_drivers),
+                ('positions', 'driver_positions', self._load_driver_positions),
+                ('telemetry', 'car_telemetry', self._load_car_telemetry),
+                ('race_control', 'race_control_messages', self._load_race_control_messages),
+                ('weather', 'weather_data', self._load_weather),
+                ('car_positions', 'car_positions', self._load_car_positions),
+            ],
+        ]
+    
+    def _spool_handlers(self) -> Dict[str, Any]:
+        """Funções de reenvio do spool por chave do lote, na ordem das chaves estrangeiras"""
+        handlers = {'batch': self._load_batches}
+        for stage in self._table_loaders():
+            for key, table, load in stage:
+                handlers[key] = partial(self._load_table, table, load)
+        return handlers
+    
     async def load_batch(self, batch_data: Dict[str, List]) -> None:
         """Carrega um lote de dados no Supabase usando tabelas existentes"""
         if not self.pool:
             logger.error("Conexão com o banco de dados não inicializada")
             return
         
+        if self.concurrent:
+            await self._load_batch_concurrent(batch_data)
+        elif self.spool:
+            # O lote inteiro é uma entrada do spool (uma única transação também no reenvio)
+            await self.spool.write_through('batch', self._load_batches, [batch_data])
+        else:
+            await self._load_batch_single_transaction(batch_data)
+    
+    async def _load_batches(self, batches: List[Dict[str, List]]) -> None:
+        """Carrega lotes inteiros, cada um em uma única transação"""
+        for batch_data in batches:
+            await self._load_batch_single_transaction(batch_data)
+    
+    async def _load_batch_concurrent(self, batch_data: Dict[str, List]) -> None:
+        """Carrega as tabelas independentes ao mesmo tempo, cada uma em sua conexão e transação.
+        
+        Uma tabela lenta (telemetria) não atrasa as pequenas e um erro em uma
+        tabela desfaz apenas a transação dela."""
+        for stage in self._table_loaders():
+            tasks = [
+                self._load_or_spool(key, table, load, batch_data[key])
+                for key, table, load in stage if batch_data.get(key)
+            ]
+            if tasks:
+                await asyncio.gather(*tasks)
+        
+        # lap_data não tem tabela específica no Supabase
+        if batch_data.get('lap_data'):
+            logger.debug("lap_data não mapeado para tabela específica - ignorando")
+    
+    async def _load_or_spool(self, key: str, table: str, load, rows: List) -> None:
+        """Carrega as linhas da tabela ou, se o banco estiver fora ou lento, grava-as no spool local"""
+        try:
+            if self.spool:
+                await self.spool.write_through(key, partial(self._load_table, table, load), rows)
+            else:
+                await self._load_table(table, load, rows)
+        except Exception as e:
+            logger.error(f"Erro ao carregar {len(rows)} linhas em {table}: {e}")
+    
+    async def _load_table(self, table: str, load, rows: List) -> None:
+        """Carrega as linhas de uma tabela em uma transação própria e registra a latência do commit"""
+        stats = self.table_stats.get(table)
+        if stats is None:
+            stats = self.table_stats[table] = TableStats(table)
+        
+        start = time.perf_counter()
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await load(conn, rows)
+            stats.record(time.perf_counter() - start, len(rows))
+        except Exception:
+            stats.failures += 1
+            raise
+    
+    async def _load_batch_single_transaction(self, batch_data: Dict[str, List]) -> None:
+        """Carrega todas as tabelas do lote em sequência, em uma única transação"""
+        start = time.perf_counter()
         async with self.pool.acquire() as conn:
             async with conn.transaction():
                 # Carrega sessões - usando campos corretos da tabela existente
@@ -170,6 +310,34 @@ class SupabaseLoader:
                 # Carrega posições dos carros (nova funcionalidade)
                 if batch_data.get('car_positions'):
                     await self._load_car_positions(conn, batch_data['car_positions'])
+        
+        # Nesse modo a latência de commit é a do lote inteiro
+        rows = sum(len(value) for value in batch_data.values())
+        self.table_stats.setdefault('(lote)', TableStats('(lote)')).record(time.perf_counter() - start, rows)
+    
+    def table_latencies(self) -> Dict[str, Dict[str, float]]:
+        """Latência de commit (p50/p99/máx. em ms) e volume de cada tabela"""
+        result = {}
+        for table, stats in self.table_stats.items():
+            result[table] = {**stats.summary(), 'commits': stats.commits, 'rows': stats.rows,
+                             'failures': stats.failures}
+        return result
+    
+    def report_latencies(self) -> None:
+        """Registra no log a latência de commit de cada tabela"""
+        if not self.table_stats:
+            return
+        mode = 'concorrente, uma transação por tabela' if self.concurrent else 'uma transação por lote'
+        logger.info(f"Latência de commit por tabela ({mode}):")
+        for table, info in sorted(self.table_latencies().items()):
+            logger.info(f"  {table}: p50={info['p50_ms']:.1f}ms, p99={info['p99_ms']:.1f}ms, "
+                        f"máx={info['max_ms']:.1f}ms, {info['commits']} commits, {info['rows']} linhas, "
+                        f"{info['failures']} falhas")
+    
+    def report_spool(self) -> None:
+        """Registra no log a profundidade do spool local e a taxa de reenvio"""
+        if self.drainer:
+            self.drainer.report()
     
     async def _load_sessions(self, conn, sessions: List[Session]) -> None:
         """Carrega dados de sessão no Supabase usando estrutura da tabela existente"""
@@ -203,6 +371,8 @@ class SupabaseLoader:
                     datetime.now()
                 )
             except Exception as e:
+                if is_connection_error(e):
+                    raise
                 logger.error(f"Erro ao inserir sessão {session.session_key}: {e}")
     
     async def _load_session_drivers(self, conn, drivers: List[Driver]) -> None:
@@ -248,6 +418,8 @@ class SupabaseLoader:
                     datetime.now()
                 )
             except Exception as e:
+                if is_connection_error(e):
+                    raise
                 logger.error(f"Erro ao inserir piloto {driver.driver_number} na session_drivers: {e}")
     
     async def _load_driver_positions(self, conn, positions: List[Position]) -> None:
@@ -266,13 +438,12 @@ class SupabaseLoader:
                 datetime.now()
             ) for p in positions]
             
-            await conn.executemany('''
-                INSERT INTO public.driver_positions 
-                (session_id, timestamp, driver_number, position, created_at, updated_at)
-                VALUES ($1, $2, $3, $4, $5, $6)
-            ''', values)
+            await self.retrying.write(conn, 'driver_positions', values,
+                                     self.statements.executemany, 'driver_positions')
             
         except Exception as e:
+            if is_connection_error(e):
+                raise
             logger.error(f"Erro ao inserir posições na driver_positions: {e}")
     
     async def _load_car_telemetry(self, conn, telemetry_list: List[TelemetryData]) -> None:
@@ -294,22 +465,13 @@ class SupabaseLoader:
                 datetime.now()
             ) for t in telemetry_list]
             
-            # Dividir em lotes menores para evitar sobrecarga
-            batch_size = 1000
-            for i in range(0, len(values), batch_size):
-                batch = values[i:i+batch_size]
-                
-                await conn.executemany('''
-                    INSERT INTO public.car_telemetry (
-                        timestamp, utc_timestamp, session_id, driver_number,
-                        rpm, speed, gear, throttle, brake, drs,
-                        created_at, updated_at
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-                ''', batch)
-                
-                logger.debug(f"Lote de telemetria inserido: {len(batch)} registros")
+            await self.retrying.write(conn, 'car_telemetry', values,
+                                     self.copy_loader.load, 'car_telemetry', CAR_TELEMETRY_COLUMNS)
+            logger.debug(f"Lote de telemetria inserido: {len(values)} registros")
                 
         except Exception as e:
+            if is_connection_error(e):
+                raise
             logger.error(f"Erro ao inserir telemetria na car_telemetry: {e}")
     
     async def _load_race_control_messages(self, conn, race_control_list: List[RaceControl]) -> None:
@@ -331,13 +493,11 @@ class SupabaseLoader:
                 datetime.now()
             ) for rc in race_control_list]
             
-            await conn.executemany('''
-                INSERT INTO public.race_control_messages (
-                    session_id, timestamp, utc_time, category, message,
-                    flag, scope, sector, created_at, updated_at
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-            ''', values)
+            await self.retrying.write(conn, 'race_control_messages', values,
+                                     self.statements.executemany, 'race_control_messages')
         except Exception as e:
+            if is_connection_error(e):
+                raise
             logger.error(f"Erro ao inserir mensagens de controle na race_control_messages: {e}")
     
     async def _load_car_positions(self, conn, car_positions_list) -> None:
@@ -358,14 +518,12 @@ class SupabaseLoader:
                 datetime.now()
             ) for pos in car_positions_list]
             
-            await conn.executemany('''
-                INSERT INTO public.car_positions (
-                    session_id, timestamp, utc_time, driver_number,
-                    x_coord, y_coord, z_coord, created_at, updated_at
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-            ''', values)
+            await self.retrying.write(conn, 'car_positions', values,
+                                     self.copy_loader.load, 'car_positions', CAR_POSITIONS_COLUMNS)
             
         except Exception as e:
+            if is_connection_error(e):
+                raise
             logger.error(f"Erro ao inserir posições dos carros na car_positions: {e}")
     
     async def _load_weather(self, conn, weather_list: List[Weather]) -> None:
@@ -376,19 +534,15 @@ class SupabaseLoader:
         try:
             # Note: usando a estrutura da tabela weather_data existente
             values = [(
-                None,  # session_id será None se não especificado
+                1,  # session_id placeholder (não nulo: a chave natural (session_id, timestamp) ignora nulos)
                 w.timestamp.replace(tzinfo=None) if w.timestamp.tzinfo else w.timestamp,  # timestamp without time zone
                 w.air_temp, w.track_temp, w.humidity,
                 w.pressure, w.wind_speed, w.wind_direction, w.rainfall,
                 datetime.now(), datetime.now()
             ) for w in weather_list]
             
-            await conn.executemany('''
-                INSERT INTO public.weather_data (
-                    session_id, timestamp, air_temp, track_temp, humidity,
-                    pressure, wind_speed, wind_direction, rainfall,
-                    created_at, updated_at
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-            ''', values)
+            await self.retrying.write(conn, 'weather_data', values, self.statements.executemany, 'weather_data')
         except Exception as e:
+            if is_connection_error(e):
+                raise
             logger.error(f"Erro ao inserir weather em lote: {e}")
\ No newline at end of file
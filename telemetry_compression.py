@@ -0,0 +1,152 @@
+"""
+Compressão por banda morta (deadband) da telemetria dos carros.
+
+O tópico CarData.z envia RPM, velocidade, marcha, acelerador, freio e DRS de
+cada carro cerca de 4 vezes por segundo, mesmo quando nada mudou; marcha e DRS
+ficam constantes por longos trechos. O DeadbandFilter descarta as amostras em
+que todos os canais estão dentro da banda morta configurada em relação à
+última amostra mantida do mesmo carro.
+
+Cada trecho constante ("run") mantém a primeira e a última amostra: quando um
+canal sai da banda, a última amostra descartada do trecho é emitida antes da
+nova, de modo que a série pode ser reconstruída por interpolação entre as
+amostras gravadas (a diferença para o valor real fica dentro da banda). A
+última amostra do trecho em andamento fica retida até a próxima mudança ou até
+``flush()``.
+
+Para que uma queda não perca as amostras retidas, cada lote filtrado informa a
+posição de leitura de onde suas linhas podem ser relidas (``source``), e
+``safe_position`` devolve a posição que pode ir para o checkpoint: a origem da
+amostra retida mais antiga, enquanto houver alguma. Ao reiniciar, a leitura
+volta até ela e a amostra é emitida de novo; as linhas já gravadas são
+ignoradas pela chave natural de car_telemetry.
+
+As bandas são absolutas, por canal, e configuradas por TELEMETRY_DEADBAND
+(``rpm=100,speed=1,throttle=1``); banda 0 mantém toda mudança do canal. A
+compressão é opcional e ativada por TELEMETRY_COMPRESSION=true.
+"""
+
+import os
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+# Canais da telemetria, na ordem em que ``values`` os retorna
+CHANNELS = ('rpm', 'speed', 'gear', 'throttle', 'brake', 'drs')
+
+# Ativa a compressão da telemetria antes da carga
+DEFAULT_TELEMETRY_COMPRESSION = os.getenv("TELEMETRY_COMPRESSION", "false").lower() == "true"
+
+# Banda morta padrão de cada canal (variações menores ou iguais são descartadas)
+DEFAULT_DEADBANDS = {'rpm': 100.0, 'speed': 1.0, 'gear': 0.0, 'throttle': 1.0, 'brake': 0.0, 'drs': 0.0}
+
+def parse_deadbands(spec: str) -> Dict[str, float]:
+    """Lê as bandas no formato ``canal=valor,canal=valor`` sobre as bandas padrão"""
+    deadbands = dict(DEFAULT_DEADBANDS)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        channel, _, value = item.partition('=')
+        channel = channel.strip().lower()
+        if channel not in deadbands:
+            raise ValueError(f"Canal de telemetria desconhecido em TELEMETRY_DEADBAND: {channel}")
+        deadbands[channel] = float(value)
+    return deadbands
+
+DEFAULT_TELEMETRY_DEADBANDS = parse_deadbands(os.getenv("TELEMETRY_DEADBAND", ""))
+
+# Acesso aos canais dos modelos TelemetryData (pipeline) e das linhas de car_telemetry (monitores)
+model_key = attrgetter('driver_number')
+model_values = attrgetter(*CHANNELS)
+row_key = itemgetter(3)
+row_values = itemgetter(4, 5, 6, 7, 8, 9)
+
+def _within(previous: Any, current: Any, band: float) -> bool:
+    if previous is None or current is None:
+        return previous is current
+    try:
+        return abs(float(current) - float(previous)) <= band
+    except (TypeError, ValueError):
+        return previous == current
+
+class DeadbandFilter:
+    """Descarta amostras dentro da banda morta, mantendo a primeira e a última de cada trecho"""
+
+    def __init__(self, key: Callable[[Any], Hashable] = model_key,
+                 values: Callable[[Any], Sequence[Any]] = model_values,
+                 deadbands: Optional[Dict[str, float]] = None):
+        self.key = key
+        self.values = values
+        deadbands = DEFAULT_TELEMETRY_DEADBANDS if deadbands is None else deadbands
+        self.bands = tuple(deadbands.get(channel, 0.0) for channel in CHANNELS)
+
+        self._reference: Dict[Hashable, Sequence[Any]] = {}  # Valores da última amostra mantida, por carro
+        self._held: Dict[Hashable, Any] = {}                 # Última amostra descartada do trecho atual
+        self._held_source: Dict[Hashable, Tuple[int, Any]] = {}  # (lote, posição de origem) da amostra retida
+        self._batches = 0
+
+        # Métricas
+        self.samples_in = 0
+        self.samples_out = 0
+
+    @property
+    def ratio(self) -> float:
+        """Fator de compressão (amostras recebidas / amostras mantidas)"""
+        return self.samples_in / self.samples_out if self.samples_out else 0.0
+
+    def _changed(self, reference: Sequence[Any], values: Sequence[Any]) -> bool:
+        for previous, current, band in zip(reference, values, self.bands):
+            if not _within(previous, current, band):
+                return True
+        return False
+
+    def filter(self, samples: Sequence[Any], source: Any = None) -> List[Any]:
+        """Amostras a gravar, em ordem; as amostras de cada carro devem chegar em ordem de tempo.
+        
+        ``source`` é a posição de leitura a partir da qual o lote pode ser relido."""
+        self._batches += 1
+        kept = []
+        for sample in samples:
+            self.samples_in += 1
+            key = self.key(sample)
+            values = self.values(sample)
+            reference = self._reference.get(key)
+
+            if reference is not None and not self._changed(reference, values):
+                self._held[key] = sample
+                self._held_source[key] = (self._batches, source)
+                continue
+
+            # Fim do trecho anterior: a última amostra dele vai antes da mudança
+            self._held_source.pop(key, None)
+            held = self._held.pop(key, None)
+            if held is not None:
+                kept.append(held)
+            kept.append(sample)
+            self._reference[key] = values
+
+        self.samples_out += len(kept)
+        return kept
+
+    def flush(self) -> List[Any]:
+        """Última amostra retida de cada trecho em andamento (no encerramento)"""
+        held = list(self._held.values())
+        self._held.clear()
+        self._held_source.clear()
+        self.samples_out += len(held)
+        return held
+
+    def safe_position(self, position: Any) -> Any:
+        """Posição que pode ir para o checkpoint depois do lote lido até ``position``.
+        
+        Com amostras retidas, é a origem da mais antiga (None se desconhecida: o
+        checkpoint não deve avançar)."""
+        if not self._held_source:
+            return position
+        return min(self._held_source.values(), key=itemgetter(0))[1]
+
+    def report(self) -> None:
+        """Registra no log o volume de amostras antes e depois da compressão"""
+        dropped = self.samples_in - self.samples_out
+        share = dropped / self.samples_in * 100 if self.samples_in else 0.0
+        logger.info(f"Compressão da telemetria: {self.samples_in} amostras recebidas, {self.samples_out} mantidas "
+                    f"({share:.1f}% descartadas, fator {self.ratio:.1f}x), {len(self._held)} retidas")
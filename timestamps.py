@@ -0,0 +1,127 @@
+"""
+Conversão rápida dos timestamps ISO-8601 da F1 (ex.: ``2025-05-17T13:59:20.6797217Z``).
+
+Os timestamps chegam com 7 dígitos de fração, que ``datetime.fromisoformat``
+rejeita em versões do Python anteriores à 3.11 (o código antigo caía
+silenciosamente em ``datetime.now()``). Aqui a fração é truncada para
+microssegundos e o fuso normalizado antes de chamar ``fromisoformat``.
+
+Para conversões em lote para microssegundos desde a época Unix, o prefixo
+"data + hora até o segundo" fica em um pequeno cache: como os registros chegam
+em ordem (várias amostras por segundo), a maioria das conversões reaproveita o
+mesmo prefixo e só precisa ler a fração.
+
+Timestamps sem fuso horário são interpretados como UTC (os campos ``Utc`` da F1).
+"""
+
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Tuple
+
+# Tamanho de "AAAA-MM-DDTHH:MM:SS"
+_PREFIX_LENGTH = 19
+
+# Tamanho do formato da F1: "AAAA-MM-DDTHH:MM:SS.fffffffZ"
+_F1_FORMAT_LENGTH = 28
+
+# Número máximo de prefixos (segundos) guardados no cache
+_CACHE_SIZE = 256
+
+_UTC_OFFSET = '+00:00'
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_US = timedelta(microseconds=1)
+
+# Prefixo AAAA-MM-DDTHH:MM:SS -> microssegundos desde a época Unix
+_prefix_cache = {}
+
+# A partir do Python 3.11, fromisoformat aceita 'Z' e frações longas diretamente
+try:
+    datetime.fromisoformat('2000-01-01T00:00:00.0000000Z')
+    _NATIVE_ISO_FORMAT = True
+except ValueError:
+    _NATIVE_ISO_FORMAT = False
+
+def _normalize(value: str) -> Tuple[str, str]:
+    """Separa data/hora (com fração de exatamente 6 dígitos) e fuso (±HH:MM) de um timestamp"""
+    if not isinstance(value, str) or len(value) < 19:
+        raise ValueError(f"Timestamp inválido: {value!r}")
+
+    body, offset = value, _UTC_OFFSET
+    if body[-1] in 'Zz':
+        body = body[:-1]
+    elif len(body) > 19 and body[-6] in '+-' and body[-3] == ':':
+        body, offset = body[:-6], body[-6:]
+
+    if len(body) > 19:
+        fraction = body[20:]
+        if body[19] != '.' or not fraction.isdigit():
+            raise ValueError(f"Timestamp inválido: {value!r}")
+        # Trunca (sem arredondar) frações com mais de 6 dígitos
+        body = body[:20] + fraction[:6].ljust(6, '0')
+
+    return body, offset
+
+def parse_timestamp(value: str, aware: bool = True) -> datetime:
+    """Converte um timestamp ISO-8601 para datetime em UTC.
+
+    Com ``aware=False`` retorna um datetime sem fuso (UTC implícito), como
+    esperado pelas colunas ``timestamp without time zone``. Gera ValueError
+    para valores inválidos.
+    """
+    # Caminho rápido: formato da F1 (7 dígitos de fração e 'Z')
+    if isinstance(value, str) and len(value) == _F1_FORMAT_LENGTH and value[-1] == 'Z':
+        if not aware:
+            return datetime.fromisoformat(value[:26])
+        return datetime.fromisoformat(value if _NATIVE_ISO_FORMAT else value[:26] + _UTC_OFFSET)
+
+    body, offset = _normalize(value)
+
+    if offset == _UTC_OFFSET:
+        return datetime.fromisoformat(body + offset if aware else body)
+
+    result = datetime.fromisoformat(body + offset).astimezone(timezone.utc)
+    return result if aware else result.replace(tzinfo=None)
+
+def _second_epoch_us(prefix: str) -> int:
+    """Retorna (e guarda no cache) o instante AAAA-MM-DDTHH:MM:SS em microssegundos"""
+    second_us = _prefix_cache.get(prefix)
+    if second_us is None:
+        second_us = (datetime.fromisoformat(prefix + _UTC_OFFSET) - _EPOCH) // _ONE_US
+
+        # Só os prefixos recentes interessam; um cache cheio é simplesmente descartado
+        if len(_prefix_cache) >= _CACHE_SIZE:
+            _prefix_cache.clear()
+        _prefix_cache[prefix] = second_us
+    return second_us
+
+def to_epoch_us(value: str) -> int:
+    """Converte um timestamp ISO-8601 para microssegundos desde a época Unix (UTC)"""
+    body, offset = _normalize(value)
+    if offset != _UTC_OFFSET:
+        return (datetime.fromisoformat(body + offset) - _EPOCH) // _ONE_US
+
+    return _second_epoch_us(body[:_PREFIX_LENGTH]) + int(body[20:] or 0)
+
+def parse_timestamps_us(values: Iterable[str]) -> array:
+    """Converte um lote de timestamps para um array('q') de microssegundos desde a época Unix"""
+    result = array('q')
+    append = result.append
+    cached = _prefix_cache.get
+
+    for value in values:
+        # Caminho rápido: formato da F1 com o segundo já no cache; só a fração precisa ser lida
+        if type(value) is str and len(value) == _F1_FORMAT_LENGTH and value[-1] == 'Z':
+            second_us = cached(value[:_PREFIX_LENGTH])
+            fraction = value[20:26]
+            if second_us is not None and value[19] == '.' and fraction.isdigit():
+                append(second_us + int(fraction))
+                continue
+
+        append(to_epoch_us(value))
+
+    return result
+
+def from_epoch_us(epoch_us: int, aware: bool = True) -> datetime:
+    """Converte microssegundos desde a época Unix de volta para datetime em UTC"""
+    result = _EPOCH + timedelta(microseconds=epoch_us)
+    return result if aware else result.replace(tzinfo=None)
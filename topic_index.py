@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Índice de tópicos para os arquivos de sessão gravados pelo fastf1_livetiming.
+
+O índice é um arquivo ao lado dos dados (``<arquivo>.idx``) com uma entrada
+binária de tamanho fixo por linha: offset em bytes, timestamp (microssegundos
+desde a época Unix), tamanho da linha e tópico. Com ele, extrair WeatherData ou
+RaceControlMessages de uma captura de corrida inteira não exige mais ler o
+arquivo todo: as entradas do tópico são localizadas na coluna de tópicos e as
+linhas lidas diretamente pelo offset. Janelas de tempo usam busca binária sobre
+o maior timestamp visto até cada linha, que é crescente mesmo quando os tópicos
+chegam levemente fora de ordem.
+
+A construção é incremental: apenas as linhas adicionadas desde a última
+execução são indexadas. Se o arquivo de dados tiver sido recriado ou truncado,
+o índice é refeito do início.
+
+Uso:
+    python topic_index.py build f1_data.txt
+    python topic_index.py stats f1_data.txt
+    python topic_index.py extract f1_data.txt --topic WeatherData [--start ISO] [--end ISO]
+"""
+
+import argparse
+import os
+import struct
+import sys
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from checkpoint import line_checksum
+from line_parser import peek_timestamp, peek_topic
+from timestamps import to_epoch_us
+
+# Cabeçalho: identificação, número de entradas, bytes indexados, CRC32 da última linha, número de tópicos
+_MAGIC = b'F1IDX\x00\x01\x00'
+_HEADER = struct.Struct('<8sQQII')
+
+# Nomes dos tópicos (o id é a posição na tabela; o id 0 é reservado para linhas sem tópico)
+MAX_TOPICS = 255
+_TOPIC_NAME_SIZE = 64
+_TOPIC_TABLE_SIZE = MAX_TOPICS * _TOPIC_NAME_SIZE
+_DATA_START = _HEADER.size + _TOPIC_TABLE_SIZE
+
+# Entrada: offset, timestamp (µs), maior timestamp visto até a linha, tamanho, id do tópico (1 byte)
+# e preenchimento até 32 bytes
+_ENTRY = struct.Struct('<QqqIB3x')
+_ENTRY_WORDS = _ENTRY.size // 8
+_TOPIC_FIELD = 28  # Posição (byte) do id do tópico dentro da entrada
+_TIMESTAMP_FIELD = 1  # Posições do timestamp e do maior timestamp na entrada vista como inteiros de 64 bits
+_WATERMARK_FIELD = 2
+
+# Atraso máximo, em relação à linha mais recente, com que uma linha ainda pode chegar fora de ordem
+# (os tópicos são gravados na ordem de chegada, com diferenças de décimos de segundo)
+MAX_DISORDER_US = 60 * 1_000_000
+
+# Timestamp registrado para linhas sem timestamp reconhecível antes da primeira linha com timestamp
+NO_TIMESTAMP = -1
+
+def index_path(data_file: str) -> str:
+    """Caminho do índice de um arquivo de dados"""
+    return f"{data_file}.idx"
+
+def _line_timestamp(line: bytes) -> int:
+    """Extrai o timestamp (último campo) de uma linha [tópico, dados, timestamp]"""
+    timestamp = peek_timestamp(line)
+    if timestamp is None:
+        return NO_TIMESTAMP
+
+    try:
+        return to_epoch_us(timestamp)
+    except ValueError:
+        return NO_TIMESTAMP
+
+class TopicIndex:
+    """Índice (tópico, offset, tamanho, timestamp) de cada linha de um arquivo de dados"""
+
+    def __init__(self, data_file: str, index_file: Optional[str] = None, chunk_size: int = 4 * 1024 * 1024):
+        self.data_file = data_file
+        self.index_file = index_file or index_path(data_file)
+        self.chunk_size = chunk_size
+
+        self.topic_names: List[str] = ['']
+        self.topic_ids: Dict[str, int] = {'': 0}
+        self.entry_count = 0
+        self.indexed_bytes = 0
+        self.last_line_checksum = 0
+
+        # Entradas carregadas por load(): bytes brutos e colunas derivadas
+        self._entries = b''
+        self._topic_column = b''
+        self._timestamps = None
+        self._watermarks = None
+
+    def exists(self) -> bool:
+        """Indica se o arquivo de índice existe"""
+        return os.path.exists(self.index_file)
+
+    def _read_header(self, f) -> bool:
+        """Lê cabeçalho e tabela de tópicos; retorna False se o índice for inválido"""
+        header = f.read(_DATA_START)
+        if len(header) < _DATA_START:
+            return False
+
+        magic, entry_count, indexed_bytes, checksum, topic_count = _HEADER.unpack_from(header)
+        if magic != _MAGIC or topic_count > MAX_TOPICS:
+            return False
+
+        names = []
+        for i in range(topic_count):
+            start = _HEADER.size + i * _TOPIC_NAME_SIZE
+            names.append(header[start:start + _TOPIC_NAME_SIZE].rstrip(b'\0').decode('utf-8'))
+
+        self.topic_names = names or ['']
+        self.topic_ids = {name: i for i, name in enumerate(self.topic_names)}
+        self.entry_count = entry_count
+        self.indexed_bytes = indexed_bytes
+        self.last_line_checksum = checksum
+        return True
+
+    def _write_header(self, f) -> None:
+        """Grava cabeçalho e tabela de tópicos no início do índice"""
+        table = bytearray(_TOPIC_TABLE_SIZE)
+        for i, name in enumerate(self.topic_names):
+            encoded = name.encode('utf-8')[:_TOPIC_NAME_SIZE]
+            start = i * _TOPIC_NAME_SIZE
+            table[start:start + len(encoded)] = encoded
+
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, self.entry_count, self.indexed_bytes,
+                             self.last_line_checksum, len(self.topic_names)))
+        f.write(table)
+
+    def _reset(self) -> None:
+        """Descarta o estado do índice para reconstruí-lo do início"""
+        self.topic_names = ['']
+        self.topic_ids = {'': 0}
+        self.entry_count = 0
+        self.indexed_bytes = 0
+        self.last_line_checksum = 0
+
+    def _matches_data_file(self, f) -> bool:
+        """Confere se o índice corresponde ao arquivo de dados atual (última linha indexada)"""
+        if self.entry_count == 0:
+            return True
+
+        f.seek(_DATA_START + (self.entry_count - 1) * _ENTRY.size)
+        offset, _, _, length, _ = _ENTRY.unpack(f.read(_ENTRY.size))
+        try:
+            with open(self.data_file, 'rb') as data:
+                data.seek(offset)
+                last_line = data.read(length)
+        except OSError:
+            return False
+
+        return (offset + length == self.indexed_bytes and len(last_line) == length
+                and line_checksum(last_line) == self.last_line_checksum)
+
+    def _last_watermark(self, f) -> int:
+        """Maior timestamp visto até a última entrada já gravada no índice"""
+        if self.entry_count == 0:
+            return NO_TIMESTAMP
+
+        f.seek(_DATA_START + (self.entry_count - 1) * _ENTRY.size)
+        return _ENTRY.unpack(f.read(_ENTRY.size))[2]
+
+    def _topic_id(self, topic: bytes) -> int:
+        """Retorna o id de um tópico, registrando-o se for novo"""
+        name = topic.decode('utf-8', 'replace')
+        topic_id = self.topic_ids.get(name)
+        if topic_id is None:
+            if len(self.topic_names) >= MAX_TOPICS:
+                raise ValueError(f"Limite de {MAX_TOPICS} tópicos excedido no índice")
+            topic_id = len(self.topic_names)
+            self.topic_names.append(name)
+            self.topic_ids[name] = topic_id
+        return topic_id
+
+    def build(self) -> int:
+        """Indexa as linhas adicionadas desde a última execução e retorna quantas foram indexadas"""
+        mode = 'r+b' if self.exists() else 'w+b'
+        with open(self.index_file, mode) as f:
+            if mode == 'r+b' and not (self._read_header(f) and self._matches_data_file(f)):
+                logger.warning(f"Índice {self.index_file} não corresponde a {self.data_file}; reconstruindo")
+                self._reset()
+            elif mode == 'w+b':
+                self._reset()
+
+            # Descarta entradas gravadas após o último cabeçalho consistente (ex.: queda no meio da escrita)
+            f.truncate(_DATA_START + self.entry_count * _ENTRY.size)
+
+            new_entries = bytearray()
+            added = 0
+            offset = self.indexed_bytes
+            last_line = None
+            # Maior timestamp visto até cada linha: coluna crescente usada pela busca binária
+            watermark = self._last_watermark(f)
+
+            with open(self.data_file, 'rb') as data:
+                data.seek(offset)
+                pending = b''
+                while True:
+                    chunk = data.read(self.chunk_size)
+                    if not chunk:
+                        break
+
+                    chunk = pending + chunk
+                    end = chunk.rfind(b'\n') + 1
+                    pending = chunk[end:]
+
+                    # Apenas linhas completas são indexadas; o restante fica para a próxima execução
+                    for line in chunk[:end].splitlines(keepends=True):
+                        topic = peek_topic(line)
+                        topic_id = self._topic_id(topic) if topic else 0
+                        timestamp = _line_timestamp(line)
+                        if timestamp == NO_TIMESTAMP:
+                            # Linhas sem timestamp ficam no instante da linha mais recente
+                            timestamp = watermark
+                        watermark = max(watermark, timestamp)
+                        new_entries += _ENTRY.pack(offset, timestamp, watermark, len(line), topic_id)
+                        offset += len(line)
+                        added += 1
+                        last_line = line
+
+            if added:
+                f.seek(0, os.SEEK_END)
+                f.write(new_entries)
+                f.flush()
+                os.fsync(f.fileno())
+
+                # O cabeçalho só é atualizado depois que as entradas estão no disco
+                self.entry_count += added
+                self.indexed_bytes = offset
+                self.last_line_checksum = line_checksum(last_line)
+
+            self._write_header(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._entries = b''
+        return added
+
+    def load(self) -> bool:
+        """Carrega as entradas do índice para consulta; retorna False se não houver índice válido"""
+        if not self.exists():
+            return False
+
+        with open(self.index_file, 'rb') as f:
+            if not self._read_header(f):
+                return False
+            self._entries = f.read(self.entry_count * _ENTRY.size)
+
+        self.entry_count = len(self._entries) // _ENTRY.size
+        self._entries = self._entries[:self.entry_count * _ENTRY.size]
+        # Colunas sem laço por entrada: o byte do tópico, o timestamp e o maior timestamp de cada entrada
+        words = memoryview(self._entries).cast('q')
+        self._topic_column = self._entries[_TOPIC_FIELD::_ENTRY.size]
+        self._timestamps = words[_TIMESTAMP_FIELD::_ENTRY_WORDS]
+        self._watermarks = words[_WATERMARK_FIELD::_ENTRY_WORDS]
+        return True
+
+    def _ensure_loaded(self) -> None:
+        if not self._entries and not self.load():
+            raise FileNotFoundError(f"Índice {self.index_file} não encontrado; execute 'build' antes")
+
+    def entry(self, position: int) -> Tuple[str, int, int, int]:
+        """Retorna (tópico, offset, tamanho, timestamp) da entrada na posição informada"""
+        self._ensure_loaded()
+        offset, timestamp, _, length, topic_id = _ENTRY.unpack_from(self._entries, position * _ENTRY.size)
+        return self.topic_names[topic_id], offset, length, timestamp
+
+    def topic_counts(self) -> Dict[str, int]:
+        """Número de linhas de cada tópico"""
+        self._ensure_loaded()
+        return {name: self._topic_column.count(bytes([topic_id]))
+                for topic_id, name in enumerate(self.topic_names) if name}
+
+    def _window(self, start_us: Optional[int], end_us: Optional[int]) -> Tuple[int, int]:
+        """Intervalo de entradas [início, fim) que pode conter linhas da janela (busca binária)"""
+        # Antes da primeira entrada cujo maior timestamp alcança o início, nenhuma linha está na janela
+        low = bisect_left(self._watermarks, start_us) if start_us is not None else 0
+        # Linhas atrasadas ainda podem aparecer até MAX_DISORDER_US depois do fim da janela
+        high = bisect_left(self._watermarks, end_us + MAX_DISORDER_US) if end_us is not None else self.entry_count
+        return low, max(low, high)
+
+    def _in_window(self, position: int, start_us: Optional[int], end_us: Optional[int]) -> bool:
+        timestamp = self._timestamps[position]
+        return (start_us is None or timestamp >= start_us) and (end_us is None or timestamp < end_us)
+
+    def find(self, topics: Optional[Set[str]] = None, start_us: Optional[int] = None,
+             end_us: Optional[int] = None) -> List[int]:
+        """Posições (números de linha a partir de 0) das entradas dos tópicos na janela [start_us, end_us)"""
+        self._ensure_loaded()
+        low, high = self._window(start_us, end_us)
+
+        if topics is None:
+            positions = range(low, high)
+        else:
+            positions = self._find_topics(topics, low, high)
+
+        if start_us is None and end_us is None:
+            return list(positions)
+        return [position for position in positions if self._in_window(position, start_us, end_us)]
+
+    def _find_topics(self, topics: Set[str], low: int, high: int) -> List[int]:
+        """Posições das entradas dos tópicos no intervalo [low, high)"""
+        positions = []
+        for topic in topics:
+            topic_id = self.topic_ids.get(topic)
+            if topic_id is None:
+                continue
+
+            # Procura o byte do tópico na coluna de tópicos (sem laço Python por entrada)
+            needle = bytes([topic_id])
+            position = self._topic_column.find(needle, low, high)
+            while position >= 0:
+                positions.append(position)
+                position = self._topic_column.find(needle, position + 1, high)
+
+        positions.sort()
+        return positions
+
+    def read_lines(self, topics: Optional[Set[str]] = None, start_us: Optional[int] = None,
+                   end_us: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """Lê do arquivo de dados, pelo offset, as linhas (número, texto) dos tópicos na janela"""
+        positions = self.find(topics, start_us, end_us)
+        with open(self.data_file, 'rb') as data:
+            for position in positions:
+                _, offset, length, _ = self.entry(position)
+                data.seek(offset)
+                yield position + 1, data.read(length).decode('utf-8', 'replace')
+
+def main():
+    parser = argparse.ArgumentParser(description='Índice de tópicos dos arquivos de dados da F1')
+    parser.add_argument('command', choices=['build', 'stats', 'extract'], help='Operação')
+    parser.add_argument('data_file', help='Arquivo de dados gravado pelo fastf1_livetiming')
+    parser.add_argument('--topic', action='append', help='Tópico a extrair (pode ser repetido)')
+    parser.add_argument('--start', help='Início da janela (timestamp ISO-8601, UTC)')
+    parser.add_argument('--end', help='Fim da janela (timestamp ISO-8601, UTC)')
+    args = parser.parse_args()
+
+    index = TopicIndex(args.data_file)
+
+    if args.command == 'build':
+        added = index.build()
+        print(f"{added} linhas indexadas ({index.entry_count} no total) em {index.index_file}")
+        return
+
+    # Mantém o índice em dia antes de consultar
+    index.build()
+
+    if args.command == 'stats':
+        index.load()
+        print(f"{index.entry_count} linhas, {index.indexed_bytes} bytes indexados")
+        for topic, count in sorted(index.topic_counts().items(), key=lambda item: -item[1]):
+            print(f"  {topic:<25} {count}")
+        return
+
+    start_us = to_epoch_us(args.start) if args.start else None
+    end_us = to_epoch_us(args.end) if args.end else None
+    topics = set(args.topic) if args.topic else None
+    for _, line in index.read_lines(topics, start_us, end_us):
+        sys.stdout.write(line)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
-import json
 import re
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
 from loguru import logger
 
+from decoder import decode_compressed_data
+from line_parser import parse_data_line
 from models import Driver, Session, LapData, Position, TelemetryData, RaceControl, Weather
+from timestamps import parse_timestamp
+
+# Tópicos com transformação implementada (linhas de outros tópicos são descartadas na leitura)
+TRANSFORMED_TOPICS = {
+    'DriverList', 'SessionInfo', 'TimingData', 'TimingAppData',
+    'Position.z', 'CarData.z', 'RaceControlMessages', 'WeatherData'
+}
 
 class F1DataTransformer:
     """Transforma dados brutos da F1 em modelos estruturados"""
@@ -15,11 +23,41 @@ class F1DataTransformer:
         self.drivers_cache = {}
         self.session_info = None
     
+    def parse_lines(self, raw_lines: List[str]) -> List[Tuple[str, Any, str]]:
+        """Converte as linhas brutas em registros (tópico, dados, timestamp) dos tópicos transformados"""
+        records = []
+        for line in raw_lines:
+            # Ignora linhas vazias
+            if not line.strip():
+                continue
+            
+            try:
+                record = parse_data_line(line, TRANSFORMED_TOPICS)
+            except ValueError:
+                logger.error(f"Erro ao analisar linha: {line[:100]}...")
+                continue
+            
+            if record is not None:
+                records.append(record)
+        
+        return records
+    
     def process_data_batch(self, raw_lines: List[str]) -> Dict[str, List]:
         """Processa um lote de linhas de dados brutos e retorna dados estruturados"""
         if not raw_lines:
             return {}
         
+        return self.process_records(self.parse_lines(raw_lines))
+    
+    def process_records(self, records: List[Tuple[str, Any, str]]) -> Dict[str, List]:
+        """Processa um lote de registros (tópico, dados, timestamp) e retorna dados estruturados.
+        
+        Os payloads comprimidos podem chegar já decodificados (ex.: pelo PayloadDecoder);
+        caso contrário, são decodificados aqui.
+        """
+        if not records:
+            return {}
+        
         # Dicionário para armazenar os resultados transformados
         result = {
             'drivers': [],
@@ -28,44 +66,35 @@ class F1DataTransformer:
             'positions': [],
             'telemetry': [],
             'race_control': [],
-            'weather': []
+            'weather': [],
+            'car_positions': []
         }
         
-        for line in raw_lines:
+        for topic, payload, timestamp in records:
             try:
-                # Ignora linhas vazias
-                if not line.strip():
-                    continue
-                
-                # Parse da linha JSON
-                data = json.loads(line)
+                data = {'topic': topic, 'data': payload, 'timestamp': timestamp}
                 
                 # Determina o tipo de dados e processa adequadamente
-                if 'topic' in data:
-                    topic = data['topic']
-                    
-                    if topic == 'DriverList':
-                        self._process_driver_list(data, result)
-                    elif topic == 'SessionInfo':
-                        self._process_session_info(data, result)
-                    elif topic == 'TimingData':
-                        self._process_timing_data(data, result)
-                    elif topic == 'TimingAppData':
-                        self._process_timing_app_data(data, result)
-                    elif topic == 'Position.z':
-                        self._process_position_data(data, result)
-                    elif topic == 'CarData.z':
-                        self._process_car_data(data, result)
-                    elif topic == 'RaceControlMessages':
-                        self._process_race_control(data, result)
-                    elif topic == 'WeatherData':
-                        self._process_weather_data(data, result)
-                    # Outros tópicos podem ser adicionados conforme necessário
+                if topic == 'DriverList':
+                    self._process_driver_list(data, result)
+                elif topic == 'SessionInfo':
+                    self._process_session_info(data, result)
+                elif topic == 'TimingData':
+                    self._process_timing_data(data, result)
+                elif topic == 'TimingAppData':
+                    self._process_timing_app_data(data, result)
+                elif topic == 'Position.z':
+                    self._process_position_data(data, result)
+                elif topic == 'CarData.z':
+                    self._process_car_data(data, result)
+                elif topic == 'RaceControlMessages':
+                    self._process_race_control(data, result)
+                elif topic == 'WeatherData':
+                    self._process_weather_data(data, result)
+                # Outros tópicos podem ser adicionados conforme necessário
             
-            except json.JSONDecodeError:
-                logger.error(f"Erro ao decodificar JSON: {line[:100]}...")
             except Exception as e:
-                logger.error(f"Erro ao processar linha: {str(e)}")
+                logger.error(f"Erro ao processar registro de {topic}: {str(e)}")
         
         # Remove duplicatas de drivers e sessions ao final
         if result['drivers']:
@@ -159,7 +188,8 @@ class F1DataTransformer:
         timestamp_str = data.get('timestamp', '')
         timestamp = self._parse_timestamp(timestamp_str)
         
-        for driver_number, timing_data in data['data'].items():
+        # Os dados de cada piloto vêm agrupados em 'Lines'
+        for driver_number, timing_data in data['data'].get('Lines', {}).items():
             try:
                 driver_number = int(driver_number)
                 
@@ -223,7 +253,8 @@ class F1DataTransformer:
         timestamp_str = data.get('timestamp', '')
         timestamp = self._parse_timestamp(timestamp_str)
         
-        for driver_number, app_data in data['data'].items():
+        # Os dados de cada piloto vêm agrupados em 'Lines'
+        for driver_number, app_data in data['data'].get('Lines', {}).items():
             try:
                 driver_number = int(driver_number)
                 
@@ -268,79 +299,72 @@ class F1DataTransformer:
             except (ValueError, TypeError) as e:
                 logger.error(f"Erro ao processar app data para piloto {driver_number}: {e}")
     
+    def _decoded_payload(self, data: Dict) -> Optional[Dict]:
+        """Retorna o payload de um tópico comprimido, decodificando-o se necessário"""
+        payload = data.get('data')
+        if isinstance(payload, str):
+            try:
+                payload = decode_compressed_data(payload)
+            except Exception as e:
+                logger.error(f"Falha ao decodificar dados de {data.get('topic')}: {e}")
+                return None
+        return payload if isinstance(payload, dict) else None
+    
     def _process_position_data(self, data: Dict, result: Dict[str, List]) -> None:
-        """Processa dados de posição em pista"""
-        if 'data' not in data:
+        """Processa dados de posição em pista (Position.z)"""
+        payload = self._decoded_payload(data)
+        if not payload:
             return
         
         # Obtém o timestamp do evento
-        timestamp_str = data.get('timestamp', '')
-        timestamp = self._parse_timestamp(timestamp_str)
+        timestamp = self._parse_timestamp(data.get('timestamp', ''))
         
-        for driver_number, position_data in data['data'].items():
-            try:
-                driver_number = int(driver_number)
-                
-                if isinstance(position_data, list) and len(position_data) >= 2:
-                    # Alguns sistemas fornecem posições como [x, y, z]
-                    x, y = position_data[0], position_data[1]
-                    z = position_data[2] if len(position_data) > 2 else 0
-                    
-                    # Cria objeto de telemetria com posição
-                    telemetry = TelemetryData(
-                        driver_number=driver_number,
+        # Cada entrada traz as coordenadas de todos os carros em um instante
+        for position_entry in payload.get('Position', []):
+            entry_time = self._parse_timestamp(position_entry.get('Timestamp', ''))
+            
+            for driver_number, coords in position_entry.get('Entries', {}).items():
+                try:
+                    car_position = TelemetryData(
+                        driver_number=int(driver_number),
                         timestamp=timestamp,
-                        x=x,
-                        y=y,
-                        z=z
+                        x=coords.get('X', 0),
+                        y=coords.get('Y', 0),
+                        z=coords.get('Z', 0),
+                        utc_time=entry_time
                     )
-                    result['telemetry'].append(telemetry)
-            except (ValueError, TypeError, IndexError) as e:
-                logger.error(f"Erro ao processar dados de posição para piloto {driver_number}: {e}")
+                    result['car_positions'].append(car_position)
+                except (ValueError, TypeError, AttributeError) as e:
+                    logger.error(f"Erro ao processar dados de posição para piloto {driver_number}: {e}")
     
     def _process_car_data(self, data: Dict, result: Dict[str, List]) -> None:
-        """Processa dados do carro para telemetria"""
-        if 'data' not in data:
+        """Processa dados do carro para telemetria (CarData.z)"""
+        payload = self._decoded_payload(data)
+        if not payload:
             return
         
-        # Obtém o timestamp do evento
-        timestamp_str = data.get('timestamp', '')
-        timestamp = self._parse_timestamp(timestamp_str)
-        
-        for driver_number, car_data in data['data'].items():
-            try:
-                driver_number = int(driver_number)
-                
-                # Verifica se temos dados de telemetria
-                if isinstance(car_data, dict):
-                    # Cria objeto de telemetria
+        # Cada entrada traz os canais de todos os carros em um instante
+        for entry in payload.get('Entries', []):
+            entry_time = self._parse_timestamp(entry.get('Utc', ''))
+            
+            for driver_number, car_info in entry.get('Cars', {}).items():
+                try:
+                    channels = car_info.get('Channels', {})
+                    
+                    # Os números dos canais são os do CarDataProcessor do livetiming
                     telemetry = TelemetryData(
-                        driver_number=driver_number,
-                        timestamp=timestamp
+                        driver_number=int(driver_number),
+                        timestamp=entry_time,
+                        rpm=channels.get('0'),
+                        speed=channels.get('2'),
+                        gear=channels.get('3'),
+                        throttle=channels.get('4'),
+                        brake=channels.get('5'),
+                        drs=channels.get('45')
                     )
-                    
-                    # Adiciona dados disponíveis
-                    if 'Speed' in car_data:
-                        telemetry.speed = int(car_data['Speed'])
-                    
-                    if 'RPM' in car_data:
-                        telemetry.rpm = int(car_data['RPM'])
-                    
-                    if 'nGear' in car_data:
-                        telemetry.gear = int(car_data['nGear'])
-                    
-                    if 'Throttle' in car_data:
-                        telemetry.throttle = int(car_data['Throttle'])
-                    
-                    if 'Brake' in car_data:
-                        telemetry.brake = int(car_data['Brake'])
-                    
-                    if 'DRS' in car_data:
-                        telemetry.drs = int(car_data['DRS'])
-                    
                     result['telemetry'].append(telemetry)
-            except (ValueError, TypeError) as e:
-                logger.error(f"Erro ao processar car data para piloto {driver_number}: {e}")
+                except (ValueError, TypeError, AttributeError) as e:
+                    logger.error(f"Erro ao processar car data para piloto {driver_number}: {e}")
     
     def _process_race_control(self, data: Dict, result: Dict[str, List]) -> None:
         """Processa mensagens do controle de corrida"""
@@ -351,7 +375,12 @@ class F1DataTransformer:
         timestamp_str = data.get('timestamp', '')
         timestamp = self._parse_timestamp(timestamp_str)
         
-        for message_data in data['data']:
+        # 'Messages' chega como lista no primeiro registro e como dicionário indexado nas atualizações
+        messages = data['data'].get('Messages', [])
+        if isinstance(messages, dict):
+            messages = list(messages.values())
+        
+        for message_data in messages:
             try:
                 msg = message_data.get('Message', '')
                 category = message_data.get('Category', '')
@@ -374,7 +403,9 @@ class F1DataTransformer:
                     driver_number=driver_number,
                     scope=message_data.get('Scope', ''),
                     sector=message_data.get('Sector'),
-                    lap_number=message_data.get('Lap')
+                    lap_number=message_data.get('Lap'),
+                    # Texto 'Utc' sem conversão, como grava o monitor_race_control (coluna text da chave natural)
+                    utc_time=message_data.get('Utc')
                 )
                 
                 result['race_control'].append(rc_message)
@@ -425,9 +456,9 @@ class F1DataTransformer:
             return datetime.now()
         
         try:
-            # Formato ISO padrão
-            return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-        except (ValueError, TypeError):
+            # Formato ISO da F1 (7 dígitos de fração, sufixo 'Z')
+            return parse_timestamp(timestamp_str)
+        except ValueError:
             # Fallback para o timestamp atual
             return datetime.now()
     
@@ -11,6 +11,8 @@ from dotenv import load_dotenv
 import asyncpg
 from loguru import logger
 
+from statements import NATURAL_KEYS
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
@@ -78,6 +80,10 @@ class TableVerifier:
                     logger.error(f"❌ Tabela {table_name}: PROBLEMA")
                     all_ok = False
             
+            # Sem as chaves naturais o pipeline funciona, mas reprocessamentos duplicam linhas
+            logger.info("\n🔑 Verificando chaves naturais (sql/natural_keys.sql)...")
+            await self.verify_natural_keys()
+            
             return all_ok
             
         except Exception as e:
@@ -113,6 +119,37 @@ class TableVerifier:
             logger.error(f"   Erro ao verificar tabela {table_name}: {e}")
             return False
     
+    async def verify_natural_keys(self) -> bool:
+        """Verifica se cada tabela tem o índice único da sua chave natural"""
+        all_ok = True
+        for table_name, key in NATURAL_KEYS.items():
+            try:
+                indexes = await self.conn.fetch('''
+                    SELECT i.relname AS index_name,
+                           array_agg(a.attname::text ORDER BY k.ord) AS columns
+                    FROM pg_index x
+                    JOIN pg_class t ON t.oid = x.indrelid
+                    JOIN pg_namespace n ON n.oid = t.relnamespace
+                    JOIN pg_class i ON i.oid = x.indexrelid
+                    CROSS JOIN LATERAL unnest(x.indkey) WITH ORDINALITY AS k(attnum, ord)
+                    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+                    WHERE n.nspname = 'public' AND t.relname = $1 AND x.indisunique
+                    GROUP BY i.relname
+                ''', table_name)
+                
+                matching = [row['index_name'] for row in indexes if set(row['columns']) == set(key)]
+                if matching:
+                    logger.info(f"   {table_name}: chave natural ({', '.join(key)}) -> índice {matching[0]}")
+                else:
+                    logger.warning(f"   {table_name}: índice único em ({', '.join(key)}) não encontrado; "
+                                   f"reprocessamentos vão duplicar linhas (execute sql/natural_keys.sql)")
+                    all_ok = False
+            except Exception as e:
+                logger.warning(f"   Erro ao verificar chave natural de {table_name}: {e}")
+                all_ok = False
+        
+        return all_ok
+    
     def _check_type_compatibility(self, actual_type: str, expected_type: str) -> bool:
         """Verifica se os tipos são compatíveis"""
         # Normaliza os tipos para comparação
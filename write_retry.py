@@ -0,0 +1,170 @@
+"""
+Novas tentativas e divisão de lotes para as gravações em lote.
+
+Uma gravação em lote (COPY ou ``executemany``) que falha por causa de uma única
+linha inválida desfaz o lote inteiro. O RetryingWriter trata as falhas em duas
+camadas:
+
+- erros transitórios do servidor (deadlock, falha de serialização, lock ou
+  statement timeout) são repetidos com espera exponencial com jitter;
+- erros de dados (DATA_ERRORS) dividem o lote ao meio, recursivamente, até
+  isolar as linhas inválidas. As metades válidas são gravadas normalmente e
+  cada linha inválida vai para o arquivo de dead-letter (JSON Lines) com o
+  erro correspondente.
+
+Com ``k`` linhas inválidas em um lote de ``n`` linhas, a divisão custa cerca de
+``2·k·log2(n)`` gravações a mais; o restante do lote segue com o tamanho
+normal. Dentro de uma transação cada tentativa roda em um SAVEPOINT, para que
+a falha de uma metade não aborte a transação inteira.
+
+Erros de conexão não são tratados aqui: a conexão já não serve para uma nova
+tentativa e o erro sobe para o PoolManager (nova conexão) ou para o spool.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+import asyncpg
+from loguru import logger
+
+from connection_pool import backoff_delay
+
+# Novas tentativas para erros transitórios do servidor
+DEFAULT_WRITE_RETRIES = int(os.getenv("WRITE_RETRIES", "3"))
+
+# Arquivo de dead-letter com as linhas rejeitadas (vazio desativa; as linhas só vão para o log)
+DEFAULT_DEAD_LETTER_FILE = os.getenv("DEAD_LETTER_FILE", "f1_dead_letter.jsonl")
+
+# Erros do servidor que podem dar certo numa nova tentativa com os mesmos dados
+TRANSIENT_ERRORS = (
+    asyncpg.DeadlockDetectedError,
+    asyncpg.SerializationError,
+    asyncpg.LockNotAvailableError,
+    asyncpg.QueryCanceledError,
+)
+
+# Erros causados pelo conteúdo de alguma linha: o lote é dividido para isolá-la.
+# ValueError cobre os erros de codificação dos parâmetros no cliente (DataError do asyncpg).
+# Os demais erros (SQL inválido, tabela inexistente) valem para qualquer linha e são propagados.
+DATA_ERRORS = (
+    asyncpg.DataError,
+    asyncpg.IntegrityConstraintViolationError,
+    ValueError,
+)
+
+class DeadLetterFile:
+    """Arquivo JSON Lines com as linhas rejeitadas pelo banco, uma por linha"""
+
+    def __init__(self, path: str = DEFAULT_DEAD_LETTER_FILE):
+        self.path = path
+        self._file = None
+        self.rows = Counter()  # Linhas rejeitadas por tabela
+
+    def record(self, table: str, row: Sequence[Any], error: BaseException) -> None:
+        """Registra uma linha rejeitada e o erro que a rejeitou"""
+        self.rows[table] += 1
+        entry = {
+            'time': datetime.now().isoformat(),
+            'table': table,
+            'error': f"{type(error).__name__}: {error}",
+            'row': list(row) if isinstance(row, (tuple, list)) else row,
+        }
+        if not self.path:
+            logger.error(f"Linha rejeitada em {table} ({entry['error']}): {entry['row']}")
+            return
+
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        # default=str cobre datetime, Decimal e os modelos
+        self._file.write(json.dumps(entry, default=str, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def report(self) -> None:
+        """Registra no log as linhas enviadas ao dead-letter"""
+        if self.rows:
+            counts = ', '.join(f"{table}={rows}" for table, rows in sorted(self.rows.items()))
+            logger.warning(f"Dead-letter ({self.path or 'somente log'}): {sum(self.rows.values())} linhas ({counts})")
+
+class RetryingWriter:
+    """Executa gravações em lote com novas tentativas e isolamento das linhas inválidas"""
+
+    def __init__(self, dead_letter: Optional[DeadLetterFile] = None, retries: int = DEFAULT_WRITE_RETRIES):
+        self.dead_letter = dead_letter or DeadLetterFile()
+        self.retries = max(retries, 0)
+
+        # Métricas por tabela
+        self.rows_written = Counter()
+        self.retried = Counter()  # Novas tentativas após erro transitório
+        self.splits = Counter()   # Lotes divididos ao meio após erro de dados
+        self.seconds = Counter()
+
+    async def write(self, conn, table: str, rows: List[tuple],
+                    operation: Callable[..., Awaitable[Any]], *args) -> None:
+        """Grava ``rows`` com ``operation(conn, *args, rows)``; linhas inválidas vão para o dead-letter"""
+        if not rows:
+            return
+        start = time.perf_counter()
+        try:
+            await self._write_or_split(conn, table, rows, operation, args)
+        finally:
+            self.seconds[table] += time.perf_counter() - start
+
+    async def _write_or_split(self, conn, table: str, rows: List[tuple],
+                              operation: Callable[..., Awaitable[Any]], args: tuple) -> None:
+        try:
+            await self._attempt(conn, table, rows, operation, args)
+            self.rows_written[table] += len(rows)
+            return
+        except DATA_ERRORS as e:
+            error = e
+
+        if len(rows) == 1:
+            self.dead_letter.record(table, rows[0], error)
+            return
+
+        if self.splits[table] == 0:
+            logger.warning(f"Lote de {len(rows)} linhas rejeitado em {table} ({error}); "
+                           f"dividindo para isolar as linhas inválidas")
+        self.splits[table] += 1
+        middle = len(rows) // 2
+        await self._write_or_split(conn, table, rows[:middle], operation, args)
+        await self._write_or_split(conn, table, rows[middle:], operation, args)
+
+    async def _attempt(self, conn, table: str, rows: List[tuple],
+                       operation: Callable[..., Awaitable[Any]], args: tuple) -> None:
+        """Executa a gravação, repetindo erros transitórios; dentro de uma transação usa um SAVEPOINT"""
+        for attempt in range(self.retries + 1):
+            try:
+                if conn.is_in_transaction():
+                    async with conn.transaction():
+                        await operation(conn, *args, rows)
+                else:
+                    await operation(conn, *args, rows)
+                return
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.retries:
+                    raise
+                self.retried[table] += 1
+                delay = backoff_delay(attempt)
+                logger.warning(f"Erro transitório ao gravar {len(rows)} linhas em {table} ({e}); "
+                               f"nova tentativa em {delay:.2f}s ({attempt + 1}/{self.retries})")
+                await asyncio.sleep(delay)
+
+    def report(self) -> None:
+        """Registra no log as novas tentativas, divisões e linhas rejeitadas por tabela"""
+        for table in sorted(self.rows_written.keys() | self.splits.keys()):
+            rate = self.rows_written[table] / self.seconds[table] if self.seconds[table] else 0.0
+            logger.info(f"Gravação em lote {table}: {self.rows_written[table]} linhas ({rate:.0f} linhas/s), "
+                        f"{self.retried[table]} novas tentativas, {self.splits[table]} divisões, "
+                        f"{self.dead_letter.rows[table]} linhas no dead-letter")
+        self.dead_letter.report()